@@ -0,0 +1,177 @@
+#  Copyright (c) 2024, Alexander Austin
+#  All rights reserved.
+#
+#  This source code is licensed under the BSD-style license found in the
+#  LICENSE file in the root directory of this source tree.
+
+
+# Dither throughput per algorithm on panel sized frames
+
+
+#!/usr/bin/python3.12
+# -*- coding: utf-8 -*-
+
+
+import os, sys, tempfile, time
+import numpy
+from Paper.DB import DB
+from Paper.Dither import Dither
+from PIL import Image
+
+
+class Benchmark:
+
+
+    def __init__(self, frames=5, size=(800, 480)):
+        """Initialize."""
+
+        self.settings = {
+            'frames': frames,
+            'size': size,
+            'seed': 0
+        }
+
+        self.imageSettings = [
+            info
+            for info in DB.dbObjectInfo
+            if info['type'] == 'settings'
+        ][0]['defaults'][0]['image']
+
+        self.paletteRgb = [
+            self.imageSettings['palette'][colorKey]
+            for colorKey in self.imageSettings['palette'].keys()
+        ]
+
+        self.palette = Image.new(
+            'P',
+            (1, 1)
+        )
+        self.palette.putpalette(
+            tuple(
+                [
+                    val
+                    for color in self.paletteRgb
+                    for val in color
+                ] + [0, 0, 0] * (
+                    256 - len(self.paletteRgb)
+                )
+            )
+        )
+
+        self.dither = Dither(
+            {
+                'render_log': {
+                    'type': 'log',
+                    'path': os.path.join(
+                        tempfile.gettempdir(),
+                        'Paper_Benchmark.log'
+                    )
+                },
+                'palette_lut': {
+                    'type': 'lut',
+                    'path': os.path.join(
+                        tempfile.gettempdir(),
+                        'Paper_Benchmark_lut.npz'
+                    )
+                }
+            }
+        )
+
+
+        return
+
+
+    def generateFrames(self):
+        """Generates photo like test frames, gradients with noise."""
+
+        generator = numpy.random.default_rng(self.settings['seed'])
+
+        width, height = self.settings['size']
+
+        y, x = numpy.mgrid[0:height, 0:width].astype(numpy.float32)
+
+        frames = []
+
+        for f in range(self.settings['frames']):
+
+            phase = generator.random(3) * numpy.pi * 2.0
+
+            pixels = numpy.stack(
+                [
+                    127.5 + 127.5 * numpy.sin(x / (width / (c + 1.5)) + y / (height / (3.0 - c)) + phase[c])
+                    for c in range(3)
+                ],
+                axis=-1
+            ) + generator.normal(0.0, 12.0, (height, width, 3))
+
+            frames.append(
+                Image.fromarray(
+                    numpy.clip(pixels, 0, 255).astype(numpy.uint8),
+                    'RGB'
+                )
+            )
+
+
+        return frames
+    def run(self):
+        """Times every algorithm over the same frames."""
+
+        frames = self.generateFrames()
+
+        print(
+            '%-16s %10s %10s %10s' % (
+                'algorithm',
+                'ms/frame',
+                'frames/s',
+                'Mpx/s'
+            )
+        )
+
+        for algorithm in self.dither.algorithms.keys():
+
+            imageSettings = {
+                'dither': {
+                    'algorithm': algorithm
+                }
+            }
+
+            # First pass warms per size caches
+            self.dither.ditherImage(
+                frames[0],
+                self.palette,
+                self.paletteRgb,
+                imageSettings
+            )
+
+            started = time.perf_counter()
+
+            for frame in frames:
+
+                self.dither.ditherImage(
+                    frame,
+                    self.palette,
+                    self.paletteRgb,
+                    imageSettings
+                )
+
+            elapsed = (time.perf_counter() - started) / len(frames)
+
+            print(
+                '%-16s %10.1f %10.2f %10.2f' % (
+                    algorithm,
+                    elapsed * 1000.0,
+                    1.0 / elapsed,
+                    self.settings['size'][0] * self.settings['size'][1] / elapsed / 1000000.0
+                )
+            )
+
+
+        return
+
+
+if __name__ == '__main__':
+
+    benchmark = Benchmark(
+        frames=int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    )
+    benchmark.run()
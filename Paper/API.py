@@ -65,18 +65,16 @@ def getAuthorization(req):
                 authorization['logged_in'] = True
                 authorization['user'] = user
 
-                permissionIds = [
-                    userPermission['permission_id']
-                    for userPermission in user['user_permissions']
-                ]
+                # Bit n set for permission id n
+                permissions = user['permissions']
 
-                if 0 in permissionIds: authorization['api'] = True
+                if permissions & (1 << 0): authorization['api'] = True
 
-                if 1 in permissionIds: authorization['admin'] = True
+                if permissions & (1 << 1): authorization['admin'] = True
 
-                if 2 in permissionIds: authorization['settings'] = True
+                if permissions & (1 << 2): authorization['settings'] = True
 
-                if 3 in permissionIds: authorization['media'] = True
+                if permissions & (1 << 3): authorization['media'] = True
 
     except Exception as e:
 
@@ -168,6 +166,60 @@ def apiImages(subpath):
 
             if authorization['logged_in'] == True:
 
+                if subpath == 'jobs' or subpath.startswith('jobs/'):
+
+                    jobData = backend.getJobData(
+                        'all' if subpath == 'jobs' else subpath.split('/', 1)[-1]
+                    )
+
+                    return jsonify(jobData), 200
+
+                if subpath == 'duplicates':
+
+                    duplicateData = backend.getDuplicateData()
+
+                    return jsonify(duplicateData), 200
+
+                if subpath == 'list':
+
+                    # ?size=50&sort=created&direction=desc&include=3/11&exclude=2&cursor=...
+                    listFilters = {
+                        'sort': {},
+                        'include': [],
+                        'exclude': []
+                    }
+
+                    for key in ['size', 'cursor']:
+
+                        if key in request.args.keys():
+
+                            listFilters[key] = request.args.get(key)
+
+                    if 'sort' in request.args.keys():
+
+                        listFilters['sort']['key'] = request.args.get('sort')
+
+                    if 'direction' in request.args.keys():
+
+                        listFilters['sort']['direction'] = request.args.get('direction')
+
+                    for filterType in ['include', 'exclude']:
+
+                        for tagFilter in request.args.getlist(filterType):
+
+                            listFilters[filterType].append(
+                                dict(
+                                    zip(
+                                        ['category_id', 'subcategory_id'],
+                                        tagFilter.split('/', 1)
+                                    )
+                                )
+                            )
+
+                    imageData, statusCode = backend.getImageList(listFilters)
+
+                    return jsonify(imageData), statusCode
+
                 imageData = backend.getImageData(subpath)
 
                 return jsonify(imageData), 200
@@ -236,23 +288,49 @@ def apiImages(subpath):
 
                             if 'tags' in requestData.keys() or 'description' in requestData.keys():
 
+                                imageId = None
+
+                                try: imageId = int(requestData['id'])
+                                except: pass
+
+                                if imageId is None:
+
+                                    return jsonify({'error': 'Bad request'}), 400
+
                                 if 'tags' in requestData.keys():
 
-                                    backend.setImageTags(
-                                        requestData['id'],
+                                    statusMessage, statusCode = backend.setImageTags(
+                                        imageId,
                                         requestData['tags']
                                     )
 
+                                    if not statusCode == 200:
+
+                                        return jsonify(statusMessage), statusCode
+
                                 if 'description' in requestData.keys():
 
-                                    backend.setImageDescription(
-                                        requestData['id'],
+                                    statusMessage, statusCode = backend.setImageDescription(
+                                        imageId,
                                         requestData['description']
                                     )
 
-                                imageData = backend.getImageData('all')
+                                    if not statusCode == 200:
+
+                                        return jsonify(statusMessage), statusCode
 
-                                return jsonify(imageData), 200
+                                # Only the changed image, the client merges it into its list
+                                imageData = backend.getImageData(str(imageId))
+
+                                if not isinstance(imageData, dict) or not 'image_data' in imageData.keys():
+
+                                    return jsonify({'error': 'Server error'}), 500
+
+                                if len(imageData['image_data']) == 0:
+
+                                    return jsonify({'error': 'Not found'}), 404
+
+                                return jsonify({'image_update': imageData['image_data']}), 200
 
                 else:
 
@@ -291,11 +369,22 @@ def apiImages(subpath):
 
                         if 'id' in requestData.keys():
 
-                            backend.deleteImage(requestData['id'])
+                            imageId = None
+
+                            try: imageId = int(requestData['id'])
+                            except: pass
+
+                            if imageId is None:
+
+                                return jsonify({'error': 'Bad request'}), 400
+
+                            statusMessage, statusCode = backend.deleteImage(imageId)
+
+                            if not statusCode == 200:
 
-                            imageData = backend.getImageData('all')
+                                return jsonify(statusMessage), statusCode
 
-                            return jsonify(imageData), 200
+                            return jsonify({'image_delete': [imageId]}), 200
 
                 else:
 
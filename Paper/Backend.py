@@ -9,10 +9,12 @@
 # -*- coding: utf-8 -*-
 
 
-import base64, datetime, glob, json, os, subprocess, sys
-from Paper.DB import DB, DbCategory, DbImage, DbInfo, DbPermission, DbTask, DbToken, DbUser, DbUserPermission
+import base64, datetime, glob, hashlib, io, json, mmap, os, subprocess, sys, threading
+from concurrent.futures import ThreadPoolExecutor
+from Paper.DB import DB, DbCategory, DbImage, DbInfo, DbJob, DbPermission, DbTag, DbTask, DbToken, DbUser, DbUserPermission
 from Paper.Display import Display
-from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+from Paper.Render import Render
+from PIL import Image
 import pillow_avif
 from pillow_heif import register_heif_opener
 
@@ -20,135 +22,185 @@ from pillow_heif import register_heif_opener
 class Backend:
 
 
+    jobPool = None
+    jobLock = threading.RLock()
+    jobsRecovered = False
+
+    # Resolved tokens by token string, shared by API and UI in process
+    tokenCache = {}
+    tokenCacheLock = threading.Lock()
+    tokenCacheSeconds = 5.0
+
+    # Image listing sorts, each backed by an index
+    imageListSorts = ['id', 'created', 'ingested', 'file', 'description']
+    imageListSize = 50
+    imageListMaxSize = 500
+
+    thumbnailAtlasMaxImages = 256
+
+    # Local index read and rewritten by scans and failed jobs
+    localIndexLock = threading.Lock()
+
+    # Striped by image and profile, so one lazy render per quantization
+    quantizationLocks = [threading.Lock() for i in range(16)]
+
+
     def __init__(self):
         """Initialize."""
 
         self.logFileKey = 'backend_log'
         self.db = DB()
 
-        self.generatePalette()
+        self.render = Render(self.db)
 
         self.display = Display()
 
+        self.recoverJobs()
+
 
         return
-    def generatePalette(self):
-        """Generate quantization palette."""
 
-        try:
 
-            imageSettings = self.db.settings.get('image')
-            
-            paletteSettings = imageSettings['palette']
+    def ingestLocalImages(self):
+        """Ingest manually transferred images in local path, skipping files already seen unchanged."""
 
-            paletteRgb = [
-                paletteSettings[colorKey]
-                for colorKey in paletteSettings.keys()
-            ]
+        statusMessage = {'error': 'Server error'}
+        statusCode = 500
 
+        try:
 
-            self.palette = Image.new(
-                'P',
-                (1, 1)
-            )
-            self.palette.putpalette(
-                tuple(
-                    [
-                        val
-                        for color in paletteRgb
-                        for val in color
-                    ] + [0, 0, 0] * (
-                        256 - len(paletteRgb)
-                    )
-                )
+            dbImages = self.db.get(
+                dbObjectType='image',
+                match=None,
+                projection={
+                    'columns': ['path']
+                }
             )
 
-        except Exception as e:
+            if isinstance(dbImages, DbImage):
 
-            self.db.log(
-                self.logFileKey,
-                '.'.join(
-                    [
-                        str(self.__class__.__name__),
-                        str(sys._getframe().f_code.co_name)
-                    ]
-                ),
-                str(e)
+                dbImages = [dbImages]
+
+            dbImagePaths = set(
+                [
+                    dbImage.working['path']
+                    for dbImage in (dbImages if isinstance(dbImages, list) else [])
+                ]
             )
 
+            del dbImages
 
-        return
 
+            localIndex = self.getLocalIndex()
 
-    def ingestLocalImages(self):
-        """Ingest manually transferred images in temp path."""
 
-        statusMessage = {'error': 'Server error'}
-        statusCode = 500
+            scannedIndex = {}
+            newImages = []
+            queuedImages = set()
+            jobBatches = []
 
-        try:
+            with os.scandir(self.db.paths['local']['path']) as localEntries:
 
-            dbImages = self.db.get(
-                dbObjectType='image',
-                match=None
-            )
+                for localEntry in localEntries:
 
+                    if localEntry.name.startswith('.') == False and localEntry.is_file() == True:
 
-            dbImagePaths = []
+                        localStat = localEntry.stat()
 
-            if not dbImages is None:
+                        scannedIndex[localEntry.path] = [
+                            localStat.st_size,
+                            localStat.st_mtime
+                        ]
 
-                if isinstance(dbImages, DbImage):
+                        if not localEntry.path in dbImagePaths:
 
-                    dbImagePaths = [
-                        dbImages.working['path']
-                    ]
+                            if not localIndex.get(localEntry.path) == scannedIndex[localEntry.path]:
 
-                if isinstance(dbImages, list):
+                                newImages.append(
+                                    localEntry.path
+                                )
 
-                    dbImagePaths = [
-                        dbImage.working['path']
-                        for dbImage in dbImages
-                    ]
-                    
-            del dbImages
 
+            if len(newImages) > 0:
 
-            localImages = glob.glob(
-                os.path.join(
-                    self.db.paths['local']['path'],
-                    '*'
+                ingestSettings = self.render.getSettings(
+                    self.db.settings.get('image'),
+                    'ingest'
                 )
-            )
 
+                batchSize = max(
+                    [
+                        1,
+                        int(ingestSettings['batch'])
+                    ]
+                )
 
-            newImages = []
+                for i in range(0, len(newImages), batchSize):
 
-            for localImage in localImages:
+                    jobIds = []
 
-                if not localImage in dbImagePaths:
+                    for newImage in newImages[i:i + batchSize]:
 
-                    newImages.append(
-                        self.ingestImage(
-                            imagePath=localImage,
+                        dbJob = self.queueIngestJob(
+                            imagePath=newImage,
                             tags=[],
-                            description=''
+                            description='',
+                            submit=False
                         )
-                    )
 
+                        if isinstance(dbJob, DbJob):
 
-            if len(newImages) > 0:
+                            jobIds.append(
+                                dbJob.working['id']
+                            )
 
-                self.db.settings.generateMediaQueue()
+                            queuedImages.add(
+                                newImage
+                            )
 
+                        del dbJob
 
-            del dbImagePaths
-            del localImages
-            del newImages
+                    if len(jobIds) > 0:
 
-            statusMessage = {'status': 'ok'}
+                        jobBatches.append(
+                            jobIds
+                        )
+
+
+            # Indexed before any batch runs, so a failed job can drop its entry for a retry
+            with Backend.localIndexLock:
+
+                localIndex = self.getLocalIndex()
+
+                self.setLocalIndex(
+                    {
+                        localPath: localValue
+                        for localPath, localValue in scannedIndex.items()
+                        if localPath in queuedImages or localIndex.get(localPath) == localValue
+                    }
+                )
+
+            for jobIds in jobBatches:
+
+                self.getJobPool().submit(
+                    self.runJobBatch,
+                    jobIds
+                )
+
+
+            statusMessage = {
+                'status': 'ok',
+                'queued': len(newImages)
+            }
             statusCode = 200
 
+            del dbImagePaths
+            del localIndex
+            del scannedIndex
+            del newImages
+            del queuedImages
+            del jobBatches
+
         except Exception as e:
 
             self.db.log(
@@ -164,6 +216,60 @@ class Backend:
 
 
         return statusMessage, statusCode
+    def getLocalIndex(self):
+        """Gets local path index of file size and modified time by path."""
+
+        localIndex = {}
+
+        try:
+
+            if os.path.exists(self.db.paths['local_index']['path']):
+
+                with open(self.db.paths['local_index']['path'], 'r', encoding='utf-8') as f:
+
+                    localIndex = json.loads(
+                        f.read()
+                    )
+
+        except Exception as e:
+
+            localIndex = {}
+
+
+        return localIndex
+    def setLocalIndex(self, localIndex):
+        """Replaces local path index."""
+
+        try:
+
+            with open(self.db.paths['local_index']['path'] + '.tmp', 'w', encoding='utf-8') as f:
+
+                f.write(
+                    json.dumps(
+                        localIndex
+                    )
+                )
+
+            os.replace(
+                self.db.paths['local_index']['path'] + '.tmp',
+                self.db.paths['local_index']['path']
+            )
+
+        except Exception as e:
+
+            self.db.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return
     def processUploadChunk(self, fileInfo, fileBytes):
         """Process uploaded file chunks."""
 
@@ -225,26 +331,60 @@ class Backend:
 
                                         if fileInfo['info'][i]['index'] == fileInfo['current']['index']:
 
-                                            if fileInfo['info'][i]['chunks'] > 1:
+                                            dbJob = self.queueIngestJob(
+                                                storageNames['temp'],
+                                                tags=[] if not 'tags' in fileInfo['info'][i].keys() else fileInfo['info'][i]['tags'],
+                                                description='' if not 'description' in fileInfo['info'][i].keys() else fileInfo['info'][i]['description'],
+                                                fileName=storageNames['temp'].rsplit(os.sep, 1)[-1],
+                                                submit=False
+                                            )
+
+                                            if isinstance(dbJob, DbJob):
 
-                                                with open(storageNames['temp'], 'wb') as wF:
+                                                # Job owned path, a later upload with the same name can't replace it before ingest
+                                                dbJob.working['path'] = os.path.join(
+                                                    self.db.paths['temp']['path'],
+                                                    '_'.join(
+                                                        [
+                                                            'job',
+                                                            str(dbJob.working['id']),
+                                                            storageNames['temp'].rsplit(os.sep, 1)[-1]
+                                                        ]
+                                                    )
+                                                )
 
-                                                    for c in range(len(storageNames['chunks'])):
+                                                if fileInfo['info'][i]['chunks'] > 1:
 
-                                                        if os.path.exists(storageNames['chunks'][c]):
+                                                    with open(dbJob.working['path'], 'wb') as wF:
 
-                                                            with open(storageNames['chunks'][c], 'rb') as rF:
+                                                        for c in range(len(storageNames['chunks'])):
 
-                                                                wF.write(rF.read())
+                                                            if os.path.exists(storageNames['chunks'][c]):
 
-                                                            try: os.remove(storageNames['chunks'][c])
-                                                            except: pass
+                                                                with open(storageNames['chunks'][c], 'rb') as rF:
 
-                                            self.ingestImage(
-                                                storageNames['temp'],
-                                                tags=[] if not 'tags' in fileInfo['info'][i].keys() else fileInfo['info'][i]['tags'],
-                                                description='' if not 'description' in fileInfo['info'][i].keys() else fileInfo['info'][i]['description']
-                                            )
+                                                                    wF.write(rF.read())
+
+                                                                try: os.remove(storageNames['chunks'][c])
+                                                                except: pass
+
+                                                else:
+
+                                                    os.replace(
+                                                        storageNames['temp'],
+                                                        dbJob.working['path']
+                                                    )
+
+                                                dbJob.save()
+
+                                                self.getJobPool().submit(
+                                                    self.runJob,
+                                                    dbJob.working['id']
+                                                )
+
+                                            fileProgress['job_id'] = None if dbJob is None else dbJob.working['id']
+
+                                            del dbJob
 
                                     else:
 
@@ -344,172 +484,134 @@ class Backend:
         return storageNames
 
 
-    def ingestImage(self, imagePath, tags=[], description=''):
-        """Ingest image."""
+    def queueIngestJob(self, imagePath, tags=[], description='', fileName=None, submit=True):
+        """Queues image for background ingest, submitting it to the job pool unless batched by caller."""
 
-        dbImage = None
+        dbJob = None
 
         try:
 
-            if os.path.exists(imagePath):
+            ingestSettings = self.render.getSettings(
+                self.db.settings.get('image'),
+                'ingest'
+            )
 
-                imageSettings = self.db.settings.get('image')
+            self.db.delete(
+                'job',
+                match={
+                    'finished': {
+                        '<': (datetime.datetime.now() - datetime.datetime.fromtimestamp(0)).total_seconds() - ingestSettings['keep']
+                    }
+                },
+                children=True
+            )
 
 
-                imageWorking = {
-                    'bytes': os.path.getsize(
-                        imagePath
-                    ),
-                    'path': os.path.join(
-                        self.db.paths['original']['path'],
-                        imagePath.rsplit(os.sep, 1)[-1]
-                    ),
-                    'file': imagePath.rsplit(os.sep, 1)[-1],
-                    'url': '/images/original/%s' % (
-                        imagePath.rsplit(os.sep, 1)[-1],
-                    ),
-                    'created': min(
-                        [
-                            os.path.getctime(imagePath),
-                            os.path.getmtime(imagePath)
-                        ]
-                    ),
-                    'description': description
+            dbJob = self.db.new(
+                'job',
+                {
+                    'type': 'ingest',
+                    'status': 'pending',
+                    'progress': 0.0,
+                    'path': imagePath,
+                    'info': {
+                        'tags': tags,
+                        'description': description,
+                        'name': fileName
+                    },
+                    'image_id': None,
+                    'message': None,
+                    'created': (datetime.datetime.now() - datetime.datetime.fromtimestamp(0)).total_seconds(),
+                    'started': None,
+                    'finished': None
                 }
-                
-
-                if os.path.exists(imageWorking['path']):
+            )
 
-                    for i in range(sys.maxsize):
+            if isinstance(dbJob, DbJob) and submit == True:
 
-                        uniquePath = os.path.join(
-                            imageWorking['path'].rsplit(os.sep, 1)[0],
-                            '%(simple_name)s_%(number)i.%(extension)s' % {
-                                'simple_name': imageWorking['path'].rsplit(os.sep, 1)[-1].rsplit('.', 1)[0],
-                                'number': i,
-                                'extension': '' if not '.' in imageWorking['path'].rsplit(os.sep, 1)[-1] else imageWorking['path'].rsplit(os.sep, 1)[-1].rsplit('.', 1)[-1]
-                            }
-                        )
+                self.getJobPool().submit(
+                    self.runJob,
+                    dbJob.working['id']
+                )
 
-                        if not os.path.exists(uniquePath):
+        except Exception as e:
 
-                            imageWorking['path'] = uniquePath
+            self.db.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
 
-                            break
 
+        return dbJob
+    def runJob(self, jobId):
+        """Runs queued job in worker thread."""
 
-                register_heif_opener()
+        jobDone = False
 
-                originalImage = Image.open(imagePath).convert('RGB')
-                originalImage = ImageOps.exif_transpose(originalImage)
+        try:
 
-                imageWorking['width'] = originalImage.size[0]
-                imageWorking['height'] = originalImage.size[1]
+            dbJob = self.db.get(
+                'job',
+                match={
+                    'id': jobId
+                }
+            )
 
+            if isinstance(dbJob, DbJob):
 
-                with open(imageWorking['path'], 'wb') as wF:
+                if dbJob.claim() == True:
 
-                    with open(imagePath, 'rb') as rF:
+                    jobInfo = dbJob.working['info'] if isinstance(dbJob.working['info'], dict) else {}
 
-                        wF.write(rF.read())
+                    dbImage = self.ingestImage(
+                        dbJob.working['path'],
+                        tags=[] if not 'tags' in jobInfo.keys() else jobInfo['tags'],
+                        description='' if not 'description' in jobInfo.keys() else jobInfo['description'],
+                        dbJob=dbJob,
+                        fileName=None if not 'name' in jobInfo.keys() else jobInfo['name']
+                    )
 
-                try: os.remove(imagePath)
-                except: pass
+                    if isinstance(dbImage, DbImage):
 
+                        dbJob.working['status'] = 'done'
+                        dbJob.working['image_id'] = dbImage.working['id']
 
-                dbImageTemp = self.db.new(
-                    'image',
-                    imageWorking
-                )
+                        jobDone = True
 
+                    else:
 
-                quantizationProfiles = [
-                    {
-                        'orientation': 'landscape',
-                        'sizing': {
-                            'type': 'fit',
-                            'fill': 'blur'
-                        }
-                    }, {
-                        'orientation': 'landscape',
-                        'sizing': {
-                            'type': 'fit',
-                            'fill': 'blank'
-                        }
-                    }, {
-                        'orientation': 'landscape',
-                        'sizing': {
-                            'type': 'cover'
-                        }
-                    }, {
-                        'orientation': 'portrait',
-                        'sizing': {
-                            'type': 'fit',
-                            'fill': 'blur'
-                        }
-                    }, {
-                        'orientation': 'portrait',
-                        'sizing': {
-                            'type': 'fit',
-                            'fill': 'blank'
-                        }
-                    }, {
-                        'orientation': 'portrait',
-                        'sizing': {
-                            'type': 'cover'
-                        }
-                    }
-                ]
+                        dbJob.working['status'] = 'error'
+                        dbJob.working['message'] = 'Ingest failed.'
 
-                for quantizationProfile in quantizationProfiles:
+                        # Unindexed, so the next local scan retries the file
+                        with Backend.localIndexLock:
 
-                    self.db.new(
-                        'quantization',
-                        self.generateImageQuantization(
-                            originalImage.copy(),
-                            imageWorking['path'],
-                            imageSettings,
-                            quantizationProfile,
-                            imageId=dbImageTemp.working['id']
-                        )
-                    )
+                            localIndex = self.getLocalIndex()
 
-                for thumbnailSize in imageSettings['thumbnail_sizes']:
+                            if dbJob.working['path'] in localIndex.keys():
 
-                    self.db.new(
-                        'thumbnail',
-                        self.generateImageThumbnail(
-                            originalImage.copy(),
-                            imageWorking['path'],
-                            imageSettings,
-                            thumbnailSize,
-                            imageId=dbImageTemp.working['id']
-                        )
-                    )
+                                del localIndex[dbJob.working['path']]
 
-                for tag in tags:
+                                self.setLocalIndex(
+                                    localIndex
+                                )
 
-                    self.db.new(
-                        'tag',
-                        {
-                            'image_id': dbImageTemp.working['id'],
-                            'category_id': tag['category_id'],
-                            'subcategory_id': None if not 'subcategory_id' in tag.keys() else tag['subcategory_id'],
-                        }
-                    )
+                            del localIndex
 
+                    dbJob.working['progress'] = 100.0
+                    dbJob.working['finished'] = (datetime.datetime.now() - datetime.datetime.fromtimestamp(0)).total_seconds()
 
+                    dbJob.save()
 
-                dbImage = self.db.get(
-                    'image',
-                    match={
-                        'id': dbImageTemp.working['id']
-                    }
-                )
+                    del dbImage
 
-                del originalImage
-                del imageWorking
-                del dbImageTemp
+            del dbJob
 
         except Exception as e:
 
@@ -521,281 +623,795 @@ class Backend:
                         str(sys._getframe().f_code.co_name)
                     ]
                 ),
-                str(e)
+                ' '.join(
+                    [
+                        str(jobId),
+                        str(e)
+                    ]
+                )
             )
 
 
-        return dbImage
-    def generateImageQuantization(self, originalImage, originalPath, imageSettings, quantizationProfile, imageId=None):
-        """Generates quantized image from original."""
-
-        quantizationWorking = None
+        return jobDone
+    def runJobBatch(self, jobIds):
+        """Runs batch of queued jobs in worker thread, then refreshes media queue."""
 
         try:
 
-            destinationSize = [
-                max(
-                    [
-                        imageSettings['size'][0],
-                        imageSettings['size'][1]
-                    ]
-                ) if quantizationProfile['orientation'] == 'landscape' else min(
-                    [
-                        imageSettings['size'][0],
-                        imageSettings['size'][1]
-                    ]
-                ),
-                min(
-                    [
-                        imageSettings['size'][0],
-                        imageSettings['size'][1]
-                    ]
-                ) if quantizationProfile['orientation'] == 'landscape' else max(
-                    [
-                        imageSettings['size'][0],
-                        imageSettings['size'][1]
-                    ]
-                )
+            jobsDone = [
+                self.runJob(jobId)
+                for jobId in jobIds
             ]
 
-            imageSizing = self.getImageSizing(
-                originalImage.size,
-                destinationSize
-            )
+            if any(jobsDone) == True:
 
-            quantizationInfo = {
-                'width': destinationSize[0],
-                'height': destinationSize[1],
-                'path': os.path.join(
-                    self.db.paths['quantization']['path'],
-                    '%(file_name)s_%(orientation)s_%(sizing)s.%(extension)s' % {
-                        'file_name': originalPath.rsplit(os.sep, 1)[-1].rsplit('.', 1)[0],
-                        'orientation': quantizationProfile['orientation'],
-                        'sizing': 'cover' if quantizationProfile['sizing']['type'] == 'cover' else '_'.join(
-                            [
-                                quantizationProfile['sizing']['type'],
-                                quantizationProfile['sizing']['fill']
-                            ]
-                        ),
-                        'extension': imageSettings['extension']
+                self.db.settings.generateMediaQueue()
+
+            del jobsDone
+
+        except Exception as e:
+
+            self.db.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return
+    def setJobProgress(self, dbJob, progress):
+        """Updates running job progress."""
+
+        try:
+
+            if isinstance(dbJob, DbJob):
+
+                dbJob.working['progress'] = float(progress)
+
+                dbJob.save()
+
+        except Exception as e:
+
+            self.db.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return
+    def recoverJobs(self):
+        """Requeues jobs left pending or interrupted by a restart, once per process."""
+
+        try:
+
+            with Backend.jobLock:
+
+                if Backend.jobsRecovered == False:
+
+                    Backend.jobsRecovered = True
+
+                    dbJobs = self.db.get(
+                        'job',
+                        match={
+                            'status': ['pending', 'running']
+                        },
+                        order=[
+                            {
+                                'key': 'created',
+                                'direction': 'ASC'
+                            }
+                        ]
+                    )
+
+                    if not dbJobs is None:
+
+                        if isinstance(dbJobs, DbJob):
+
+                            dbJobs = [dbJobs]
+
+                        for dbJob in dbJobs:
+
+                            if dbJob.working['status'] == 'running':
+
+                                dbJob.working['status'] = 'pending'
+                                dbJob.working['progress'] = 0.0
+                                dbJob.working['started'] = None
+
+                                dbJob.save()
+
+                            self.getJobPool().submit(
+                                self.runJob,
+                                dbJob.working['id']
+                            )
+
+                    del dbJobs
+
+        except Exception as e:
+
+            self.db.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return
+    def getJobPool(self):
+        """Gets job worker pool, shared by all instances in process."""
+
+        with Backend.jobLock:
+
+            if Backend.jobPool is None:
+
+                Backend.jobPool = ThreadPoolExecutor(
+                    max_workers=max(
+                        [
+                            1,
+                            self.render.getSettings(
+                                self.db.settings.get('image'),
+                                'ingest'
+                            )['workers']
+                        ]
+                    ),
+                    thread_name_prefix='paper_job'
+                )
+
+
+        return Backend.jobPool
+    def getJobData(self, jobId):
+        """Gets jobs with progress and timing for API use."""
+
+        jobData = {
+            'job_data': []
+        }
+
+        try:
+
+            if isinstance(jobId, (str, int)):
+
+                dbMatch = None
+
+                if not jobId == 'all':
+
+                    dbMatch = {
+                        'id': int(jobId)
                     }
+
+
+                dbJobs = self.db.get(
+                    dbObjectType='job',
+                    match=dbMatch
+                )
+
+
+                if not dbJobs is None:
+
+                    if isinstance(dbJobs, DbJob):
+
+                        dbJobs = [dbJobs]
+
+                    timestamp = (datetime.datetime.now() - datetime.datetime.fromtimestamp(0)).total_seconds()
+
+                    for dbJob in dbJobs:
+
+                        apiJob = dbJob.getApiFormat()
+
+                        apiJob['waited'] = (
+                            timestamp if dbJob.working['started'] is None else dbJob.working['started']
+                        ) - dbJob.working['created']
+                        apiJob['elapsed'] = None if dbJob.working['started'] is None else (
+                            (
+                                timestamp if dbJob.working['finished'] is None else dbJob.working['finished']
+                            ) - dbJob.working['started']
+                        )
+
+                        jobData['job_data'].append(apiJob)
+
+                del dbJobs
+
+        except Exception as e:
+
+            self.db.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
                 ),
-                'url': '/images/quantization/%(file_name)s_%(orientation)s_%(sizing)s.%(extension)s' % {
-                    'file_name': originalPath.rsplit(os.sep, 1)[-1].rsplit('.', 1)[0],
-                    'orientation': quantizationProfile['orientation'],
-                    'sizing': 'cover' if quantizationProfile['sizing']['type'] == 'cover' else '_'.join(
+                str(e)
+            )
+
+
+        return jobData
+
+
+    def ingestImage(self, imagePath, tags=[], description='', dbJob=None, fileName=None):
+        """Ingest image."""
+
+        dbImage = None
+
+        # Written before the commit, removed again if the image isn't stored
+        ingestPaths = []
+
+        try:
+
+            contentHash = None
+
+            if os.path.exists(imagePath):
+
+                contentHash = self.render.getContentHash(
+                    imagePath
+                )
+
+                if not contentHash is None:
+
+                    dbImage = self.db.get(
+                        'image',
+                        match={
+                            'hash': contentHash
+                        }
+                    )
+
+                    if isinstance(dbImage, list):
+
+                        dbImage = dbImage[0]
+
+
+                    if isinstance(dbImage, DbImage):
+
+                        # Exact duplicate, nothing to decode or store
+                        try: os.remove(imagePath)
+                        except: pass
+
+                        if isinstance(dbJob, DbJob):
+
+                            dbJob.working['message'] = 'Duplicate of image %i.' % (
+                                dbImage.working['id'],
+                            )
+
+
+            if os.path.exists(imagePath) and dbImage is None:
+
+                imageSettings = self.db.settings.get('image')
+
+                ingestSettings = self.render.getSettings(
+                    imageSettings,
+                    'ingest'
+                )
+
+
+                if fileName is None:
+
+                    fileName = imagePath.rsplit(os.sep, 1)[-1]
+
+
+                imageWorking = {
+                    'bytes': os.path.getsize(
+                        imagePath
+                    ),
+                    'path': os.path.join(
+                        self.db.paths['original']['path'],
+                        fileName
+                    ),
+                    'file': fileName,
+                    'url': '/images/original/%s' % (
+                        fileName,
+                    ),
+                    'created': min(
                         [
-                            quantizationProfile['sizing']['type'],
-                            quantizationProfile['sizing']['fill']
+                            os.path.getctime(imagePath),
+                            os.path.getmtime(imagePath)
                         ]
                     ),
-                    'extension': imageSettings['extension']
-                },
-                'orientation': quantizationProfile['orientation']
-            }
+                    'description': description,
+                    'hash': contentHash,
+                    'phash': None
+                }
+                
+
+                if os.path.exists(imageWorking['path']) and not contentHash is None:
+
+                    # Same name, different content, suffix with content hash before probing
+                    imageWorking['path'] = os.path.join(
+                        imageWorking['path'].rsplit(os.sep, 1)[0],
+                        '%(simple_name)s_%(hash)s.%(extension)s' % {
+                            'simple_name': imageWorking['path'].rsplit(os.sep, 1)[-1].rsplit('.', 1)[0],
+                            'hash': contentHash[:12],
+                            'extension': '' if not '.' in imageWorking['path'].rsplit(os.sep, 1)[-1] else imageWorking['path'].rsplit(os.sep, 1)[-1].rsplit('.', 1)[-1]
+                        }
+                    )
+
+
+                if os.path.exists(imageWorking['path']):
+
+                    for i in range(sys.maxsize):
+
+                        uniquePath = os.path.join(
+                            imageWorking['path'].rsplit(os.sep, 1)[0],
+                            '%(simple_name)s_%(number)i.%(extension)s' % {
+                                'simple_name': imageWorking['path'].rsplit(os.sep, 1)[-1].rsplit('.', 1)[0],
+                                'number': i,
+                                'extension': '' if not '.' in imageWorking['path'].rsplit(os.sep, 1)[-1] else imageWorking['path'].rsplit(os.sep, 1)[-1].rsplit('.', 1)[-1]
+                            }
+                        )
+
+                        if not os.path.exists(uniquePath):
+
+                            imageWorking['path'] = uniquePath
+
+                            break
+
+
+                imageWorking['file'] = imageWorking['path'].rsplit(os.sep, 1)[-1]
+                imageWorking['url'] = '/images/original/%s' % (
+                    imageWorking['file'],
+                )
+
+
+                quantizationProfiles = self.render.getQuantizationProfiles(
+                    imageSettings
+                )
+
+                renderJobs = [
+                    {
+                        'type': 'quantization',
+                        'profile': quantizationProfile
+                    }
+                    for quantizationProfile in quantizationProfiles
+                ] + [
+                    {
+                        'type': 'thumbnail',
+                        'size': thumbnailSize
+                    }
+                    for thumbnailSize in imageSettings['thumbnail_sizes']
+                ]
+
+                register_heif_opener()
+
+                originalImage, originalSize = self.render.decodeImage(
+                    imagePath,
+                    imageSettings,
+                    renderJobs
+                )
+
+                if originalImage is None:
+
+                    # Source is only removed once the image is stored, so it stays for a retry
+                    raise ValueError('Could not decode %s.' % (imagePath, ))
+
+                imageWorking['width'] = originalSize[0]
+                imageWorking['height'] = originalSize[1]
+
+                if ingestSettings['perceptual'] == True:
+
+                    imageWorking['phash'] = self.render.getPerceptualHash(
+                        originalImage
+                    )
+
+                    if isinstance(dbJob, DbJob) and isinstance(dbJob.working['info'], dict):
+
+                        dbJob.working['info']['similar'] = [
+                            duplicate['image_id']
+                            for duplicate in self.findSimilarImages(
+                                imageWorking['phash'],
+                                ingestSettings['distance']
+                            )
+                        ]
+
+                self.setJobProgress(dbJob, 20.0)
+
+
+                # Moved into place only after the commit, in the same folder so the move can't fail across devices
+                originalTempPath = os.path.join(
+                    imageWorking['path'].rsplit(os.sep, 1)[0],
+                    '.%(file)s.%(thread)i.tmp' % {
+                        'file': imageWorking['file'],
+                        'thread': threading.get_ident()
+                    }
+                )
+
+                ingestPaths.append(originalTempPath)
+
+                with open(originalTempPath, 'wb') as wF:
+
+                    with open(imagePath, 'rb') as rF:
+
+                        wF.write(rF.read())
+
+
+                # Image, quantizations, thumbnails and tags written together in one commit
+                dbTransaction = self.db.transaction()
+
+                dbImageTemp = dbTransaction.new(
+                    'image',
+                    imageWorking
+                )
+
+                self.setJobProgress(dbJob, 30.0)
+
+
+                renderResults = self.render.renderJobs(
+                    originalImage,
+                    imageWorking['path'],
+                    imageSettings,
+                    renderJobs,
+                    imageId=dbImageTemp.working['id']
+                )
+
+                ingestPaths += [
+                    renderResult[key]
+                    for renderResult in renderResults
+                    if isinstance(renderResult, dict)
+                    for key in ['path', 'frame']
+                    if key in renderResult.keys() and not renderResult[key] is None
+                ]
+
+                if None in renderResults:
+
+                    dbTransaction.rollback()
+
+                    raise ValueError('Could not render %s.' % (imagePath, ))
+
+                for renderJob, renderResult in zip(renderJobs, renderResults):
+
+                    dbTransaction.new(
+                        renderJob['type'],
+                        renderResult
+                    )
+
+                for tag in tags:
+
+                    dbTransaction.new(
+                        'tag',
+                        {
+                            'image_id': dbImageTemp.working['id'],
+                            'category_id': tag['category_id'],
+                            'subcategory_id': None if not 'subcategory_id' in tag.keys() else tag['subcategory_id'],
+                        }
+                    )
+
+                if dbTransaction.commit() == False:
+
+                    raise ValueError('Could not store %s.' % (imagePath, ))
+
+                ingestPaths = []
+
+                os.replace(
+                    originalTempPath,
+                    imageWorking['path']
+                )
+
+                try: os.remove(imagePath)
+                except: pass
+
+                self.setJobProgress(dbJob, 90.0)
+
+
+                self.enforceQuantizationBudget(imageSettings)
+
+
+                dbImage = self.db.get(
+                    'image',
+                    match={
+                        'id': dbImageTemp.working['id']
+                    }
+                )
+
+                del originalImage
+                del imageWorking
+                del dbImageTemp
+
+        except Exception as e:
+
+            self.db.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+            # Nothing stored, the source is kept
+            for ingestPath in ingestPaths:
+
+                try: os.remove(ingestPath)
+                except: pass
+
+
+        return dbImage
+    def findSimilarImages(self, perceptualHash, distance, imageId=None):
+        """Finds images with perceptual hash within hamming distance."""
+
+        similarImages = []
+
+        try:
+
+            if not perceptualHash is None:
+
+                hashValue = int(perceptualHash, 16)
+
+                for dbImage in self.getImageHashes():
+
+                    if not dbImage.working['phash'] is None and not dbImage.working['id'] == imageId:
+
+                        hashDistance = (hashValue ^ int(dbImage.working['phash'], 16)).bit_count()
+
+                        if hashDistance <= distance:
+
+                            similarImages.append(
+                                {
+                                    'image_id': dbImage.working['id'],
+                                    'distance': hashDistance
+                                }
+                            )
+
+
+                similarImages.sort(key=lambda s: s['distance'])
+
+        except Exception as e:
+
+            self.db.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return similarImages
+    def getImageHashes(self):
+        """Gets every image with only id and perceptual hash loaded."""
+
+        dbImages = []
+
+        try:
+
+            dbImages = self.db.get(
+                dbObjectType='image',
+                match=None,
+                projection={
+                    'columns': ['id', 'phash']
+                }
+            )
+
+            if isinstance(dbImages, DbImage):
+
+                dbImages = [dbImages]
+
+            if not isinstance(dbImages, list):
+
+                dbImages = []
+
+        except Exception as e:
+
+            self.db.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return dbImages
+    def getDuplicateData(self):
+        """Gets pairs of near duplicate images for API use."""
+
+        duplicateData = {
+            'duplicate_data': []
+        }
+
+        try:
+
+            distance = self.render.getSettings(
+                self.db.settings.get('image'),
+                'ingest'
+            )['distance']
+
+            hashValues = [
+                (dbImage.working['id'], int(dbImage.working['phash'], 16))
+                for dbImage in self.getImageHashes()
+                if not dbImage.working['phash'] is None
+            ]
+
+
+            # Pairs within distance share at least one of distance + 1 bands exactly
+            bandCount = distance + 1
+            bandBits = -(-64 // bandCount)
+
+            pairs = {}
+
+            for band in range(bandCount):
+
+                buckets = {}
+
+                for hashIndex in range(len(hashValues)):
 
-            if not imageId is None:
+                    buckets.setdefault(
+                        (hashValues[hashIndex][1] >> (band * bandBits)) & ((1 << bandBits) - 1),
+                        []
+                    ).append(hashIndex)
 
-                quantizationInfo['image_id'] = imageId
+                for bucket in buckets.values():
 
+                    for i in range(len(bucket)):
 
-            resizedImage = None
+                        for j in range(i + 1, len(bucket)):
 
-            if originalImage.size[0] == quantizationInfo['width'] and originalImage.size[1] == quantizationInfo['height']:
+                            pairKey = (
+                                min(hashValues[bucket[i]][0], hashValues[bucket[j]][0]),
+                                max(hashValues[bucket[i]][0], hashValues[bucket[j]][0])
+                            )
 
-                resizedImage = originalImage
+                            if not pairKey in pairs.keys():
 
-            elif (originalImage.size[0] / quantizationInfo['width']) == (originalImage.size[1] / quantizationInfo['height']):
+                                hashDistance = (hashValues[bucket[i]][1] ^ hashValues[bucket[j]][1]).bit_count()
 
-                resizedImage = originalImage.resize(
-                    (
-                        quantizationInfo['width'],
-                        quantizationInfo['height']
-                    ),
-                    Image.Resampling.LANCZOS
-                )
+                                if hashDistance <= distance:
 
-            else:
+                                    pairs[pairKey] = hashDistance
 
-                if quantizationProfile['sizing']['type'] == 'fit':
 
-                    fgImage = originalImage.copy()
-                    fgImage = fgImage.resize(
-                        (
-                            imageSizing['fit']['resize']['width'],
-                            imageSizing['fit']['resize']['height']
-                        ),
-                        Image.Resampling.LANCZOS
-                    )
+            duplicateData['duplicate_data'] = [
+                {
+                    'image_id': pairKey[0],
+                    'duplicate_id': pairKey[1],
+                    'distance': pairs[pairKey]
+                }
+                for pairKey in sorted(pairs.keys(), key=lambda p: (pairs[p], p))
+            ]
 
-                    if quantizationProfile['sizing']['fill'] == 'blank':
+            del hashValues
+            del pairs
 
-                        resizedImage = Image.new(
-                            mode='RGB',
-                            size=(
-                                quantizationInfo['width'],
-                                quantizationInfo['height']
-                            ),
-                            color=(255, 255, 255)
-                        )
+        except Exception as e:
 
-                    elif quantizationProfile['sizing']['fill'] == 'blur':
+            self.db.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
 
-                        resizedImage = Image.new(
-                            mode='RGB',
-                            size=(
-                                quantizationInfo['width'],
-                                quantizationInfo['height']
-                            ),
-                            color=(255, 255, 255)
-                        )
 
-                        bgImage = originalImage.copy()
-                        bgImage = bgImage.resize(
-                            (
-                                imageSizing['cover']['resize']['width'],
-                                imageSizing['cover']['resize']['height']
-                            ),
-                            Image.Resampling.LANCZOS
-                        )
-                        bgImage = bgImage.crop(
-                            (
-                                imageSizing['cover']['crop']['x0'],
-                                imageSizing['cover']['crop']['y0'],
-                                imageSizing['cover']['crop']['x1'],
-                                imageSizing['cover']['crop']['y1']
-                            )
-                        )
-                        bgImage = bgImage.filter(
-                            ImageFilter.GaussianBlur(
-                                min(
-                                    [
-                                        2,
-                                        int(
-                                            max(
-                                                [
-                                                    quantizationInfo['width'],
-                                                    quantizationInfo['height']
-                                                ]
-                                            ) / 32
-                                        )
-                                    ]
-                                )
-                            )
-                        )
-                        brightnessFilter = ImageEnhance.Brightness(bgImage)
-                        bgImage = brightnessFilter.enhance(
-                            imageSettings['blur_brightness']
-                        )
+        return duplicateData
+    def getImageQuantization(self, imageId, profileString):
+        """Gets image quantization for profile and status, rendering it on first use."""
 
-                        resizedImage.paste(
-                            bgImage,
-                            (
-                                0,
-                                0,
-                                quantizationInfo['width'],
-                                quantizationInfo['height']
-                            )
-                        )
+        dbQuantization = None
+        statusCode = 404
 
-                        del bgImage
+        try:
 
+            imageSettings = self.db.settings.get('image')
 
-                    resizedImage.paste(
-                        fgImage,
-                        (
-                            imageSizing['fit']['paste']['x0'],
-                            imageSizing['fit']['paste']['y0'],
-                            imageSizing['fit']['paste']['x1'],
-                            imageSizing['fit']['paste']['y1']
-                        )
-                    )
+            dbQuantization = self.findImageQuantization(
+                imageId,
+                profileString
+            )
 
-                    del fgImage
+            if dbQuantization is None:
 
-                elif quantizationProfile['sizing']['type'] == 'cover':
+                with self.quantizationLocks[hash((imageId, profileString)) % len(self.quantizationLocks)]:
 
-                    resizedImage = Image.new(
-                        mode='RGB',
-                        size=(
-                            quantizationInfo['width'],
-                            quantizationInfo['height']
-                        ),
-                        color=(255, 255, 255)
+                    # Another request may have rendered it while this one waited
+                    dbQuantization = self.findImageQuantization(
+                        imageId,
+                        profileString
                     )
 
-                    fgImage = originalImage.copy()
+                    if dbQuantization is None:
 
-                    fgImage = fgImage.resize(
-                        (
-                            imageSizing['cover']['resize']['width'],
-                            imageSizing['cover']['resize']['height']
-                        ),
-                        Image.Resampling.LANCZOS
-                    )
-                    fgImage = fgImage.crop(
-                        (
-                            imageSizing['cover']['crop']['x0'],
-                            imageSizing['cover']['crop']['y0'],
-                            imageSizing['cover']['crop']['x1'],
-                            imageSizing['cover']['crop']['y1']
+                        dbImage = self.db.get(
+                            'image',
+                            match={
+                                'id': imageId
+                            }
                         )
-                    )
-                    fgImage = fgImage.filter(
-                        ImageFilter.GaussianBlur(
-                            min(
-                                [
-                                    2,
-                                    int(
-                                        max(
-                                            [
-                                                quantizationInfo['width'],
-                                                quantizationInfo['height']
-                                            ]
-                                        ) / 32
+
+                        if isinstance(dbImage, DbImage):
+
+                            renderJobs = [
+                                {
+                                    'type': 'quantization',
+                                    'profile': quantizationProfile
+                                }
+                                for quantizationProfile in self.render.getQuantizationProfiles(
+                                    imageSettings,
+                                    profileString=profileString
+                                )
+                            ]
+
+                            if len(renderJobs) > 0:
+
+                                statusCode = 500
+
+                                register_heif_opener()
+
+                                originalImage, originalSize = self.render.decodeImage(
+                                    dbImage.working['path'],
+                                    imageSettings,
+                                    renderJobs
+                                )
+
+                                if not originalImage is None:
+
+                                    renderResults = self.render.renderJobs(
+                                        originalImage,
+                                        dbImage.working['path'],
+                                        imageSettings,
+                                        renderJobs,
+                                        imageId=imageId
                                     )
-                                ]
-                            )
-                        )
-                    )
-                    brightnessFilter = ImageEnhance.Brightness(fgImage)
-                    fgImage = brightnessFilter.enhance(
-                        imageSettings['blur_brightness']
-                    )
 
-                    resizedImage.paste(
-                        fgImage,
-                        (
-                            0,
-                            0,
-                            quantizationInfo['width'],
-                            quantizationInfo['height']
-                        )
-                    )
+                                    if not renderResults[0] is None:
 
-                    del fgImage
+                                        dbQuantization = self.db.new(
+                                            'quantization',
+                                            renderResults[0]
+                                        )
 
+                                    del renderResults
 
-            ditheredImage = resizedImage.quantize(
-                palette=self.palette
-            )
-            ditheredImage.save(
-                quantizationInfo['path']
-            )
+                                del originalImage
 
 
-            quantizationInfo['bytes'] = os.path.getsize(
-                quantizationInfo['path']
-            )
+                                if not dbQuantization is None:
+
+                                    statusCode = 200
+
+                                    self.enforceQuantizationBudget(imageSettings)
+
+                            del renderJobs
 
+                        del dbImage
+
+                    else:
+
+                        statusCode = 200
+
+            else:
 
-            quantizationWorking = quantizationInfo
+                statusCode = 200
 
-            del resizedImage
-            del ditheredImage
+                dbQuantization.touch()
 
         except Exception as e:
 
+            dbQuantization = None
+            statusCode = 500
+
             self.db.log(
                 self.logFileKey,
                 '.'.join(
@@ -806,150 +1422,257 @@ class Backend:
                 ),
                 ' '.join(
                     [
-                        originalPath,
+                        str(imageId),
+                        str(profileString),
                         str(e)
                     ]
                 )
             )
 
-        del originalImage
-
 
-        return quantizationWorking
-    def generateImageThumbnail(self, originalImage, originalPath, imageSettings, thumbnailSize, imageId=None):
-        """Generates thumbnail image from original."""
+        return dbQuantization, statusCode
+    def findImageQuantization(self, imageId, profileString):
+        """Finds stored quantization of image for profile."""
 
-        thumbnailWorking = None
+        dbQuantization = None
 
         try:
 
-            imageSizing = self.getImageSizing(
-                originalImage.size,
-                [
-                    thumbnailSize,
-                    thumbnailSize
-                ]
+            dbQuantizations = self.db.get(
+                'quantization',
+                match={
+                    'image_id': imageId
+                }
             )
 
-            thumbnailInfo = {
-                'width': thumbnailSize,
-                'height': thumbnailSize,
-                'path': os.path.join(
-                    self.db.paths['thumbnail']['path'],
-                    '%(file_name)s_%(size)i.%(extension)s' % {
-                        'file_name': originalPath.rsplit(os.sep, 1)[-1].rsplit('.', 1)[0],
-                        'size': thumbnailSize,
-                        'extension': imageSettings['extension']
-                    }
-                ),
-                'url': '/images/thumbnail/%(file_name)s_%(size)i.%(extension)s' % {
-                    'file_name': originalPath.rsplit(os.sep, 1)[-1].rsplit('.', 1)[0],
-                    'size': thumbnailSize,
-                    'extension': imageSettings['extension']
-                }
-            }
+            if not dbQuantizations is None:
 
-            if not imageId is None:
+                if not isinstance(dbQuantizations, list):
 
-                thumbnailInfo['image_id'] = imageId
+                    dbQuantizations = [dbQuantizations]
 
+                for dbQuantizationTemp in dbQuantizations:
 
-            thumbnailImage = Image.new(
-                mode='RGB',
-                size=(
-                    thumbnailSize,
-                    thumbnailSize
-                ),
-                color=(255, 255, 255)
-            )
+                    if '_%s.' % (profileString, ) in dbQuantizationTemp.working['path']:
 
+                        dbQuantization = dbQuantizationTemp
 
-            fgImage = originalImage.copy()
-            fgImage = fgImage.resize(
-                (
-                    imageSizing['fit']['resize']['width'],
-                    imageSizing['fit']['resize']['height']
-                ),
-                Image.Resampling.LANCZOS
-            )
+                        break
 
+            del dbQuantizations
+
+        except Exception as e:
 
-            bgImage = originalImage.copy()
-            bgImage = bgImage.resize(
-                (
-                    imageSizing['cover']['resize']['width'],
-                    imageSizing['cover']['resize']['height']
+            self.db.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
                 ),
-                Image.Resampling.LANCZOS
+                str(e)
             )
-            bgImage = bgImage.crop(
-                (
-                    imageSizing['cover']['crop']['x0'],
-                    imageSizing['cover']['crop']['y0'],
-                    imageSizing['cover']['crop']['x1'],
-                    imageSizing['cover']['crop']['y1']
+
+
+        return dbQuantization
+    def getThumbnailAtlas(self, imageIds, thumbnailSize, columns=None, etag=None):
+        """Gets thumbnails of images packed row by row in id order into one PNG, skipped when etag still matches."""
+
+        atlasData = None
+
+        try:
+
+            imageIds = [
+                int(imageId)
+                for imageId in imageIds
+            ][:self.thumbnailAtlasMaxImages]
+
+            if len(imageIds) > 0:
+
+                if columns is None:
+
+                    columns = int(round(len(imageIds) ** 0.5))
+
+                columns = max(
+                    [
+                        1,
+                        min(
+                            [
+                                int(columns),
+                                len(imageIds)
+                            ]
+                        )
+                    ]
                 )
-            )
-            bgImage = bgImage.filter(
-                ImageFilter.GaussianBlur(
-                    min(
+
+                dbThumbnails = self.db.get(
+                    'thumbnail',
+                    match={
+                        'image_id': imageIds,
+                        'width': int(thumbnailSize)
+                    },
+                    projection={
+                        'columns': ['image_id', 'path']
+                    }
+                )
+
+                if dbThumbnails is None:
+
+                    dbThumbnails = []
+
+                elif not isinstance(dbThumbnails, list):
+
+                    dbThumbnails = [dbThumbnails]
+
+
+                thumbnailPaths = dict(
+                    [
+                        (
+                            dbThumbnail.working['image_id'],
+                            dbThumbnail.working['path']
+                        )
+                        for dbThumbnail in dbThumbnails
+                        if os.path.isfile(dbThumbnail.working['path'])
+                    ]
+                )
+
+                # Changes with any member file, so clients revalidate without a repack
+                atlasTag = hashlib.sha1(
+                    json.dumps(
                         [
-                            2,
-                            int(thumbnailSize / 32)
+                            int(thumbnailSize),
+                            columns
+                        ] + [
+                            [
+                                imageId,
+                                thumbnailPaths[imageId],
+                                os.path.getmtime(thumbnailPaths[imageId])
+                            ] if imageId in thumbnailPaths.keys() else [
+                                imageId
+                            ]
+                            for imageId in imageIds
                         ]
+                    ).encode('utf-8')
+                ).hexdigest()
+
+                atlasData = {
+                    'etag': atlasTag,
+                    'columns': columns,
+                    'rows': -(-len(imageIds) // columns),
+                    'size': int(thumbnailSize),
+                    'ids': imageIds,
+                    'image': None
+                }
+
+                if not atlasTag == etag:
+
+                    atlasImage = Image.new(
+                        mode='RGB',
+                        size=(
+                            columns * atlasData['size'],
+                            atlasData['rows'] * atlasData['size']
+                        ),
+                        color=(255, 255, 255)
                     )
-                )
-            )
-            brightnessFilter = ImageEnhance.Brightness(bgImage)
-            bgImage = brightnessFilter.enhance(
-                imageSettings['blur_brightness']
+
+                    for i in range(len(imageIds)):
+
+                        if imageIds[i] in thumbnailPaths.keys():
+
+                            with Image.open(thumbnailPaths[imageIds[i]]) as thumbnailImage:
+
+                                atlasImage.paste(
+                                    thumbnailImage.convert('RGB'),
+                                    (
+                                        (i % columns) * atlasData['size'],
+                                        (i // columns) * atlasData['size']
+                                    )
+                                )
+
+                    atlasData['image'] = io.BytesIO()
+
+                    atlasImage.save(
+                        atlasData['image'],
+                        format='PNG'
+                    )
+
+                    atlasData['image'].seek(0)
+
+                    del atlasImage
+
+        except Exception as e:
+
+            self.db.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
             )
 
 
-            thumbnailImage.paste(
-                bgImage,
-                (
-                    0,
-                    0,
-                    thumbnailSize,
-                    thumbnailSize
-                )
+        return atlasData
+    def enforceQuantizationBudget(self, imageSettings):
+        """Evicts least recently used quantizations of inactive profiles over disk budget."""
+
+        try:
+
+            quantizationSettings = self.render.getSettings(
+                imageSettings,
+                'quantization'
             )
-            thumbnailImage.paste(
-                fgImage,
-                (
-                    imageSizing['fit']['paste']['x0'],
-                    imageSizing['fit']['paste']['y0'],
-                    imageSizing['fit']['paste']['x1'],
-                    imageSizing['fit']['paste']['y1']
+
+            if quantizationSettings['budget'] > 0:
+
+                dbQuantizations = self.db.get(
+                    'quantization',
+                    match={
+                        'path': {
+                            'not_like': '%%\\_%(profile)s.%%' % {
+                                'profile': self.render.getProfileString(imageSettings).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                            }
+                        }
+                    },
+                    order=[
+                        {
+                            'key': 'used',
+                            'direction': 'ASC'
+                        }
+                    ]
                 )
-            )
 
+                if not dbQuantizations is None:
 
-            thumbnailImage.save(
-                thumbnailInfo['path']
-            )
+                    if not isinstance(dbQuantizations, list):
 
+                        dbQuantizations = [dbQuantizations]
 
-            thumbnailInfo['bytes'] = os.path.getsize(
-                thumbnailInfo['path']
-            )
+                    quantizationSizes = [
+                        dbQuantization.working['bytes'] + (
+                            os.path.getsize(dbQuantization.working['frame']) if (
+                                not dbQuantization.working['frame'] is None and os.path.isfile(dbQuantization.working['frame'])
+                            ) else 0
+                        )
+                        for dbQuantization in dbQuantizations
+                    ]
 
-            thumbnailInfo['blob'] = 'url(\'data:image/png;base64,%s\');' % (
-                base64.b64encode(
-                    open(
-                        thumbnailInfo['path'],
-                        'rb'
-                    ).read()
-                ).decode('utf-8'),
-            )
+                    budgetUsed = sum(quantizationSizes)
+
+                    for dbQuantization, quantizationSize in zip(dbQuantizations, quantizationSizes):
+
+                        if budgetUsed <= quantizationSettings['budget']:
+
+                            break
 
+                        dbQuantization.delete()
 
-            thumbnailWorking = thumbnailInfo
+                        budgetUsed = budgetUsed - quantizationSize
 
-            del thumbnailImage
-            del fgImage
-            del bgImage
+                del dbQuantizations
 
         except Exception as e:
 
@@ -961,122 +1684,55 @@ class Backend:
                         str(sys._getframe().f_code.co_name)
                     ]
                 ),
-                ' '.join(
-                    [
-                        originalPath,
-                        str(e)
-                    ]
-                )
+                str(e)
             )
 
-        del originalImage
 
+        return
 
-        return thumbnailWorking
-    def getImageSizing(self, sourceSize, destinationSize):
-        """Gets image resizing and cropping dimensions."""
 
-        imageSizing = {
-            'fit': {
-                'resize': {
-                    'width': 0,
-                    'height': 0
-                },
-                'paste': {
-                    'x0': 0,
-                    'y0': 0,
-                    'x1': 0,
-                    'y1': 0
-                }
-            },
-            'cover': {
-                'resize': {
-                    'width': 0,
-                    'height': 0
-                },
-                'crop': {
-                    'x0': 0,
-                    'y0': 0,
-                    'x1': 0,
-                    'y1': 0
-                }
-            }
+    def getImageData(self, imageId):
+        """Gets images for API use."""
+
+        imageData = {
+            'image_data': []
         }
 
         try:
 
-            sWH = sourceSize[0] / sourceSize[1]
-            dWH = destinationSize[0] / destinationSize[1]
-            sdW = sourceSize[0] / destinationSize[0]
-            sdH = sourceSize[1] / destinationSize[1]
-
-            if (sourceSize[0] == destinationSize[0] and sourceSize[1] == destinationSize[1]) or (sWH == dWH):
+            if isinstance(imageId, str):
 
-                imageSizing['fit']['resize']['width'] = destinationSize[0]
-                imageSizing['fit']['resize']['height'] = destinationSize[1]
-                
-                imageSizing['fit']['paste']['x0'] = 0
-                imageSizing['fit']['paste']['y0'] = 0
-                imageSizing['fit']['paste']['x1'] = destinationSize[0]
-                imageSizing['fit']['paste']['y1'] = destinationSize[1]
+                dbMatch = None
 
-                imageSizing['cover']['resize']['width'] = destinationSize[0]
-                imageSizing['cover']['resize']['height'] = destinationSize[1]
+                if not imageId == 'all':
 
-                imageSizing['cover']['crop']['x0'] = 0
-                imageSizing['cover']['crop']['y0'] = 0
-                imageSizing['cover']['crop']['x1'] = destinationSize[0]
-                imageSizing['cover']['crop']['y1'] = destinationSize[1]
+                    dbMatch = {
+                        'id': int(imageId)
+                    }
 
-            else:
 
-                imageSizing['fit']['resize']['width'] = destinationSize[0] if sWH > dWH else int(
-                    sourceSize[0] / sdH
-                )
-                imageSizing['fit']['resize']['height'] = destinationSize[1] if sWH < dWH else int(
-                    sourceSize[1] / sdW
-                )
-                
-                imageSizing['fit']['paste']['x0'] = 0 if sWH > dWH else int(
-                    (
-                        destinationSize[0] - imageSizing['fit']['resize']['width']
-                    ) / 2.0
-                )
-                imageSizing['fit']['paste']['y0'] = 0 if sWH < dWH else int(
-                    (
-                        destinationSize[1] - imageSizing['fit']['resize']['height']
-                    ) / 2.0
-                )
-                imageSizing['fit']['paste']['x1'] = destinationSize[0] if sWH > dWH else (
-                    imageSizing['fit']['paste']['x0'] + imageSizing['fit']['resize']['width']
-                )
-                imageSizing['fit']['paste']['y1'] = destinationSize[1] if sWH < dWH else (
-                    imageSizing['fit']['paste']['y0'] + imageSizing['fit']['resize']['height']
+                dbImages = self.db.get(
+                    dbObjectType='image',
+                    match=dbMatch
                 )
 
-                imageSizing['cover']['resize']['width'] = destinationSize[0] if sWH < dWH else int(
-                    sourceSize[0] / sdH
-                )
-                imageSizing['cover']['resize']['height'] = destinationSize[1] if sWH > dWH else int(
-                    sourceSize[1] / sdW
-                )
 
-                imageSizing['cover']['crop']['x0'] = 0 if sWH < dWH else int(
-                    (
-                        imageSizing['cover']['resize']['width'] - destinationSize[0]
-                    ) / 2.0
-                )
-                imageSizing['cover']['crop']['y0'] = 0 if sWH > dWH else int(
-                    (
-                        imageSizing['cover']['resize']['height'] - destinationSize[1]
-                    ) / 2.0
-                )
-                imageSizing['cover']['crop']['x1'] = destinationSize[0] if sWH < dWH else (
-                    imageSizing['cover']['crop']['x0'] + destinationSize[0]
-                )
-                imageSizing['cover']['crop']['y1'] = destinationSize[1] if sWH > dWH else (
-                    imageSizing['cover']['crop']['y0'] + destinationSize[1]
-                )
+                if not dbImages is None:
+
+                    if isinstance(dbImages, DbImage):
+
+                        dbImages = [dbImages]
+
+
+                    apiImages = [
+                        dbImage.getApiFormat()
+                        for dbImage in dbImages
+                    ]
+
+
+                    imageData['image_data'] = apiImages
+
+                del dbImages
 
         except Exception as e:
 
@@ -1092,49 +1748,145 @@ class Backend:
             )
 
 
-        return imageSizing
+        return imageData
+    def getImageList(self, filters=None):
+        """Gets page of images for API use, sorted and tag filtered in DB, continued by opaque cursor."""
 
+        imageData = {'error': 'Bad request'}
+        statusCode = 400
 
-    def getImageData(self, imageId):
-        """Gets images for API use."""
+        try:
 
-        imageData = {
-            'image_data': []
-        }
+            if not isinstance(filters, dict):
 
-        try:
+                filters = {}
 
-            if isinstance(imageId, str):
+            pageSize = self.imageListSize
 
-                dbMatch = None
+            if 'size' in filters.keys():
 
-                if not imageId == 'all':
+                pageSize = max(
+                    [
+                        1,
+                        min(
+                            [
+                                int(filters['size']),
+                                self.imageListMaxSize
+                            ]
+                        )
+                    ]
+                )
 
-                    dbMatch = {
-                        'id': int(imageId)
-                    }
+            sort = {
+                'key': 'id',
+                'direction': 'ASC'
+            }
+
+            if 'sort' in filters.keys():
+
+                if 'key' in filters['sort'].keys():
+
+                    sort['key'] = filters['sort']['key']
+
+                if 'direction' in filters['sort'].keys():
+
+                    sort['direction'] = str(filters['sort']['direction']).upper()
+
+            after = None
+
+            if 'cursor' in filters.keys() and not filters['cursor'] is None:
+
+                # Cursor carries sort and tag filters, so later pages can't drift from the first
+                cursor = json.loads(
+                    base64.urlsafe_b64decode(
+                        filters['cursor'].encode('ascii')
+                    ).decode('utf-8')
+                )
+
+                sort = cursor['sort']
+                after = cursor['after']
+
+                filters['include'] = cursor['include']
+                filters['exclude'] = cursor['exclude']
+
+
+            if sort['key'] in self.imageListSorts and sort['direction'] in ['ASC', 'DESC']:
 
+                dbMatch = {}
 
+                for filterType, operator in [('include', 'in'), ('exclude', 'not_in')]:
+
+                    if filterType in filters.keys() and len(filters[filterType]) > 0:
+
+                        dbMatch.setdefault('id', {})[operator] = {
+                            'type': 'tag',
+                            'key': 'image_id',
+                            'match': [
+                                dict(
+                                    [
+                                        (key, int(tagFilter[key]))
+                                        for key in ['category_id', 'subcategory_id']
+                                        if key in tagFilter.keys()
+                                    ]
+                                )
+                                for tagFilter in filters[filterType]
+                            ]
+                        }
+
+
+                # One extra row tells if another page follows
                 dbImages = self.db.get(
                     dbObjectType='image',
-                    match=dbMatch
+                    match=dbMatch,
+                    order=[
+                        sort
+                    ],
+                    limit=pageSize + 1,
+                    after=after
                 )
 
+                if dbImages is None:
 
-                if not dbImages is None:
+                    dbImages = []
 
-                    if isinstance(dbImages, DbImage):
+                elif isinstance(dbImages, DbImage):
 
-                        dbImages = [dbImages]
+                    dbImages = [dbImages]
 
 
-                    apiImages = [
-                        dbImage.getApiFormat()
-                        for dbImage in dbImages
-                    ]
+                nextCursor = None
 
+                if len(dbImages) > pageSize:
 
-                    imageData['image_data'] = apiImages
+                    dbImages = dbImages[:pageSize]
+
+                    nextCursor = base64.urlsafe_b64encode(
+                        json.dumps(
+                            {
+                                'sort': sort,
+                                'after': {
+                                    sort['key']: dbImages[-1].raw[sort['key']],
+                                    'id': dbImages[-1].raw['id']
+                                },
+                                'include': filters['include'] if 'include' in filters.keys() else [],
+                                'exclude': filters['exclude'] if 'exclude' in filters.keys() else []
+                            }
+                        ).encode('utf-8')
+                    ).decode('ascii')
+
+
+                imageData = {
+                    'image_data': [
+                        dbImage.getApiFormat()
+                        for dbImage in dbImages
+                    ],
+                    'image_paging': {
+                        'size': pageSize,
+                        'sort': sort,
+                        'next': nextCursor
+                    }
+                }
+                statusCode = 200
 
                 del dbImages
 
@@ -1152,7 +1904,7 @@ class Backend:
             )
 
 
-        return imageData
+        return imageData, statusCode
     def displayImage(self, imageInfo):
         """Displays an image."""
 
@@ -1233,53 +1985,36 @@ class Backend:
 
                     if not imageSettings['current'] == -1:
 
-                        dbQuantizations = self.db.get(
-                            'quantization',
-                            match={
-                                'image_id': imageSettings['current']
-                            }
+                        dbQuantization, quantizationStatus = self.getImageQuantization(
+                            imageSettings['current'],
+                            self.render.getProfileString(imageSettings)
                         )
 
-                        if isinstance(dbQuantizations, list):
-
-                            quantizationPath = None
+                        if not dbQuantization is None:
 
-                            profileString = '_%(orientation)s_%(sizing)s' % {
-                                'orientation': imageSettings['orientation'],
-                                'sizing': 'cover' if imageSettings['sizing']['type'] == 'cover' else '_'.join(
-                                    [
-                                        imageSettings['sizing']['type'],
-                                        imageSettings['sizing']['fill']
-                                    ]
-                                )
-                            }
+                            framePath = dbQuantization.working['frame'] if 'frame' in dbQuantization.working.keys() else None
 
-                            for dbQuantization in dbQuantizations:
+                            if not framePath is None and os.path.isfile(framePath):
 
-                                if profileString in dbQuantization.working['path']:
+                                with open(framePath, 'rb') as f:
 
-                                    quantizationPath = dbQuantization.working['path']
-
-                                    break
-
-                            del profileString
+                                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as imageBuffered:
 
+                                        self.display.displayBytes(
+                                            imageBuffered
+                                        )
 
-                            if not quantizationPath is None:
+                            else:
 
+                                # Quantized before frames were stored
                                 quantizedImage = Image.open(
                                     dbQuantization.working['path']
                                 )
 
-                                imageRaw = bytearray(
-                                    quantizedImage.tobytes('raw')
+                                imageBuffered = self.render.packFrame(
+                                    quantizedImage
                                 )
 
-                                imageBuffered = [
-                                    (imageRaw[int(r * 2)] << 4) + imageRaw[int((r * 2) + 1)]
-                                    for r in range(int((imageSettings['size'][0] * imageSettings['size'][1]) / 2))
-                                ]
-
 
                                 self.display.displayBytes(
                                     imageBuffered
@@ -1287,35 +2022,21 @@ class Backend:
 
 
                                 del quantizedImage
-                                del imageRaw
                                 del imageBuffered
 
+                            del framePath
 
-                                self.setTaskData(
-                                    {
-                                        'name': 'Rotate Images',
-                                        'last': (datetime.datetime.now() - datetime.datetime.fromtimestamp(0)).total_seconds(),
-                                        'status': 'ok'
-                                    }
-                                )
-
-                                statusMessage = {'status': 'ok'}
-                                statusCode = 200
-
-                            else:
 
-                                self.db.log(
-                                    self.logFileKey,
-                                    '.'.join(
-                                        [
-                                            str(self.__class__.__name__),
-                                            str(sys._getframe().f_code.co_name)
-                                        ]
-                                    ),
-                                    'Missing quantizations.'
-                                )
+                            self.setTaskData(
+                                {
+                                    'name': 'Rotate Images',
+                                    'last': (datetime.datetime.now() - datetime.datetime.fromtimestamp(0)).total_seconds(),
+                                    'status': 'ok'
+                                }
+                            )
 
-                            del quantizationPath
+                            statusMessage = {'status': 'ok'}
+                            statusCode = 200
 
                         else:
 
@@ -1330,7 +2051,10 @@ class Backend:
                                 'Missing quantizations.'
                             )
 
-                        del dbQuantizations
+                            statusMessage = {'error': 'Render failed' if quantizationStatus == 500 else 'Not found'}
+                            statusCode = quantizationStatus
+
+                        del dbQuantization
 
                     else:
 
@@ -1376,66 +2100,167 @@ class Backend:
 
         return statusMessage, statusCode
     def setImageTags(self, imageId, tags):
-        """Sets tags for an image in DB."""
+        """Sets tags for an image in DB, applying only added and removed category/subcategory pairs in one transaction."""
+
+        statusMessage = {'error': 'Bad request'}
+        statusCode = 400
 
         try:
 
-            if isinstance(tags, list):
+            if isinstance(tags, list) and isinstance(imageId, int):
+
+                tagPairs = []
+
+                for tag in tags:
+
+                    if isinstance(tag, dict):
+
+                        categoryId = None
+                        subcategoryId = None
+
+                        if 'category' in tag.keys():
+
+                            if isinstance(tag['category'], dict):
+
+                                if 'id' in tag['category'].keys():
+
+                                    categoryId = tag['category']['id']
+
+                            if 'subcategory' in tag.keys():
+
+                                if isinstance(tag['subcategory'], dict):
+
+                                    if 'id' in tag['subcategory'].keys():
+
+                                        subcategoryId = tag['subcategory']['id']
+
+                        elif 'category_id' in tag.keys():
+
+                            categoryId = tag['category_id']
+
+                            if 'subcategory_id' in tag.keys():
+
+                                subcategoryId = tag['subcategory_id']
+
+                        if isinstance(categoryId, int) and (subcategoryId is None or isinstance(subcategoryId, int)):
+
+                            if not (categoryId, subcategoryId) in tagPairs:
+
+                                tagPairs.append(
+                                    (
+                                        categoryId,
+                                        subcategoryId
+                                    )
+                                )
+
+
+                dbImage = self.db.get(
+                    'image',
+                    match={
+                        'id': imageId
+                    },
+                    projection={
+                        'columns': ['id']
+                    }
+                )
+
+                if dbImage is None:
 
-                if isinstance(imageId, int):
+                    statusMessage = {'error': 'Not found'}
+                    statusCode = 404
+
+                else:
 
-                    self.db.delete(
+                    dbTags = self.db.get(
                         'tag',
-                        {
+                        match={
                             'image_id': imageId
+                        },
+                        projection={
+                            'columns': ['category_id', 'subcategory_id']
                         }
                     )
 
-                for tag in tags:
+                    if isinstance(dbTags, DbTag):
 
-                    if isinstance(tag, dict):
+                        dbTags = [dbTags]
 
-                        if 'image_id' in tag.keys():
+                    existingPairs = [
+                        (
+                            dbTag.working['category_id'],
+                            dbTag.working['subcategory_id']
+                        )
+                        for dbTag in (dbTags if isinstance(dbTags, list) else [])
+                    ]
 
-                            categoryId = None
-                            subcategoryId = None
 
-                            if 'category' in tag.keys():
+                    removedPairs = [
+                        tagPair
+                        for tagPair in set(existingPairs)
+                        if not tagPair in tagPairs
+                    ]
 
-                                if isinstance(tag['category'], dict):
+                    addedPairs = [
+                        tagPair
+                        for tagPair in tagPairs
+                        if not tagPair in existingPairs
+                    ]
 
-                                    if 'id' in tag['category'].keys():
+                    if len(removedPairs) > 0 or len(addedPairs) > 0:
 
-                                        categoryId = tag['category']['id']
+                        info = [
+                            info
+                            for info in self.db.dbObjectInfo
+                            if info['type'] == 'tag'
+                        ][0]
 
-                                if 'subcategory' in tag.keys():
+                        dbTransaction = self.db.transaction()
 
-                                    if isinstance(tag['subcategory'], dict):
+                        for categoryId, subcategoryId in removedPairs:
 
-                                        if 'id' in tag['subcategory'].keys():
+                            dbTransaction.queue(
+                                info['queries']['remove'],
+                                (
+                                    imageId,
+                                    categoryId,
+                                    subcategoryId
+                                )
+                            )
 
-                                            subcategoryId = tag['subcategory']['id']
+                        for categoryId, subcategoryId in addedPairs:
 
-                            elif 'category_id' in tag.keys():
+                            dbTransaction.queue(
+                                info['compiled']['insert'],
+                                tuple(
+                                    [
+                                        {
+                                            'image_id': imageId,
+                                            'category_id': categoryId,
+                                            'subcategory_id': subcategoryId
+                                        }[key]
+                                        for key in info['compiled']['column_keys']
+                                    ]
+                                )
+                            )
 
-                                categoryId = tag['category_id']
+                        if dbTransaction.commit() == True:
 
-                                if 'subcategory_id' in tag.keys():
+                            statusMessage = {'status': 'ok'}
+                            statusCode = 200
 
-                                    subcategoryId = tag['subcategory_id']
+                        else:
 
-                            if not categoryId is None:
+                            statusMessage = {'error': 'Server error'}
+                            statusCode = 500
 
-                                dbTag = self.db.new(
-                                    'tag',
-                                    {
-                                        'image_id': tag['image_id'],
-                                        'category_id': categoryId,
-                                        'subcategory_id': subcategoryId
-                                    }
-                                )
+                    else:
+
+                        statusMessage = {'status': 'ok'}
+                        statusCode = 200
+
+                    del dbTags
 
-                                del dbTag
+                del dbImage
 
         except Exception as e:
 
@@ -1450,11 +2275,17 @@ class Backend:
                 str(e)
             )
 
+            statusMessage = {'error': 'Server error'}
+            statusCode = 500
 
-        return
+
+        return statusMessage, statusCode
     def setImageDescription(self, imageId, description):
         """Sets image description for an image in DB."""
 
+        statusMessage = {'error': 'Bad request'}
+        statusCode = 400
+
         try:
 
             if isinstance(imageId, int):
@@ -1468,6 +2299,9 @@ class Backend:
                         }
                     )
 
+                    statusMessage = {'error': 'Not found'}
+                    statusCode = 404
+
                     if not dbImage is None:
 
                         if isinstance(dbImage, DbImage):
@@ -1476,6 +2310,9 @@ class Backend:
 
                             dbImage.save()
 
+                            statusMessage = {'status': 'ok'}
+                            statusCode = 200
+
                             del dbImage
 
         except Exception as e:
@@ -1491,30 +2328,59 @@ class Backend:
                 str(e)
             )
 
+            statusMessage = {'error': 'Server error'}
+            statusCode = 500
 
-        return
+
+        return statusMessage, statusCode
     def deleteImage(self, imageId):
         """Delete image from DB."""
 
+        statusMessage = {'error': 'Bad request'}
+        statusCode = 400
+
         try:
 
             if isinstance(imageId, int):
 
                 dbImage = self.db.get(
-                    dbObjectType='image',
+                    'image',
                     match={
                         'id': imageId
+                    },
+                    projection={
+                        'columns': ['id']
                     }
                 )
 
+                if dbImage is None:
 
-                if not dbImage is None:
+                    statusMessage = {'error': 'Not found'}
+                    statusCode = 404
 
-                    if isinstance(dbImage, DbImage):
+                else:
 
-                        dbImage.delete()
+                    # By key, children and their files go by cascade
+                    dbTransaction = self.db.transaction()
 
-                        del dbImage
+                    dbTransaction.delete(
+                        'image',
+                        match={
+                            'id': imageId
+                        }
+                    )
+
+                    if dbTransaction.commit() == True:
+
+                        statusMessage = {'status': 'ok'}
+                        statusCode = 200
+
+                    else:
+
+                        statusMessage = {'error': 'Server error'}
+                        statusCode = 500
+
+                del dbImage
 
         except Exception as e:
 
@@ -1529,8 +2395,11 @@ class Backend:
                 str(e)
             )
 
+            statusMessage = {'error': 'Server error'}
+            statusCode = 500
 
-        return
+
+        return statusMessage, statusCode
 
 
     def getCategoryData(self):
@@ -1683,36 +2552,24 @@ class Backend:
 
                             if 'category_id' in categoryAction.keys():
 
-                                dbCategory = self.db.get(
+                                self.db.delete(
                                     'category',
                                     {
                                         'id': categoryAction['category_id']
                                     }
                                 )
 
-                                if not dbCategory is None:
-
-                                    dbCategory.delete()
-
-                                del dbCategory
-
                         elif categoryAction['action'] == 'delete_subcategory':
 
                             if 'subcategory_id' in categoryAction.keys():
 
-                                dbSubcategory = self.db.get(
+                                self.db.delete(
                                     'subcategory',
                                     {
                                         'id': categoryAction['subcategory_id']
                                     }
                                 )
 
-                                if not dbSubcategory is None:
-
-                                    dbSubcategory.delete()
-
-                                del dbSubcategory
-
         except Exception as e:
 
             self.db.log(
@@ -1815,6 +2672,8 @@ class Backend:
 
                         dbUser.save(children=False)
 
+                        self.clearTokenCache()
+
                         if 'user_permissions' in userData.keys():
 
                             dbExistingUserPermissions = self.db.get(
@@ -1851,6 +2710,8 @@ class Backend:
 
                                 del dbUserPermission
 
+                            self.clearTokenCache()
+
                         del dbUser
 
                 else:
@@ -1933,20 +2794,14 @@ class Backend:
 
             if isinstance(userId, int):
 
-                dbUser = self.db.get(
+                self.db.delete(
                     'user',
-                    match={
+                    {
                         'id': userId
                     }
                 )
 
-                if not dbUser is None:
-
-                    if isinstance(dbUser, DbUser):
-
-                        dbUser.delete()
-
-                del dbUser
+                self.clearTokenCache()
 
         except Exception as e:
 
@@ -1964,37 +2819,69 @@ class Backend:
 
         return
     def getUserFromToken(self, token):
-        """Gets DbUser object from given token string."""
+        """Gets API user for given token string, from a short lived cache in front of one indexed query."""
 
         apiUser = None
 
         try:
 
-            dbToken = self.db.get(
-                'token',
-                match={
-                    'token': token
-                }
-            )
+            timestamp = (datetime.datetime.now() - datetime.datetime.fromtimestamp(0)).total_seconds()
 
-            if not dbToken is None:
+            with Backend.tokenCacheLock:
 
-                if isinstance(dbToken, DbToken):
+                cachedToken = Backend.tokenCache.get(token, None)
 
-                    dbUser = self.db.get(
-                        'user',
-                        match={
-                            'id': dbToken.working['user_id']
+            if not cachedToken is None:
+
+                if cachedToken['cached'] + Backend.tokenCacheSeconds < timestamp:
+
+                    cachedToken = None
+
+
+            if cachedToken is None:
+
+                tokenUser = self.db.getTokenUser(token)
+
+                if not tokenUser is None:
+
+                    cachedToken = {
+                        'cached': timestamp,
+                        'expires': tokenUser['expires'],
+                        'user': {
+                            'id': tokenUser['user_id'],
+                            'username': tokenUser['username'],
+                            'given_name': tokenUser['given_name'],
+                            'family_name': tokenUser['family_name'],
+                            'permissions': tokenUser['permissions'],
+                            'user_permissions': [
+                                {
+                                    'user_id': tokenUser['user_id'],
+                                    'permission_id': permissionId
+                                }
+                                for permissionId in range(tokenUser['permissions'].bit_length())
+                                if tokenUser['permissions'] >> permissionId & 1 == 1
+                            ]
                         }
-                    )
+                    }
 
-                    if not dbUser is None:
+                    with Backend.tokenCacheLock:
 
-                        if isinstance(dbUser, DbUser):
+                        for cachedKey in [
+                            cachedKey
+                            for cachedKey in Backend.tokenCache.keys()
+                            if Backend.tokenCache[cachedKey]['cached'] + Backend.tokenCacheSeconds < timestamp
+                        ]:
 
-                            apiUser = dbUser.getApiFormat()
+                            del Backend.tokenCache[cachedKey]
 
-                    del dbUser
+                        Backend.tokenCache[token] = cachedToken
+
+
+            if not cachedToken is None:
+
+                if cachedToken['expires'] > timestamp:
+
+                    apiUser = dict(cachedToken['user'])
 
         except Exception as e:
 
@@ -2011,6 +2898,15 @@ class Backend:
 
 
         return apiUser
+    def clearTokenCache(self):
+        """Drops resolved tokens after user, permission or token changes in this process."""
+
+        with Backend.tokenCacheLock:
+
+            Backend.tokenCache.clear()
+
+
+        return
     def getUserToken(self, username, password):
         """Gets token for successful login."""
 
@@ -2080,12 +2976,16 @@ class Backend:
 
             self.db.delete(
                 'token',
-                match=' WHERE expires < %(timestamp)f' % {
-                    'timestamp': (datetime.datetime.now() - datetime.datetime.fromtimestamp(0)).total_seconds()
+                match={
+                    'expires': {
+                        '<': (datetime.datetime.now() - datetime.datetime.fromtimestamp(0)).total_seconds()
+                    }
                 },
                 children=True
             )
 
+            self.clearTokenCache()
+
             statusMessage = {'status': 'ok'}
             statusCode = 200
 
@@ -2692,34 +3592,44 @@ class Backend:
 
         try:
 
-            dbMatch = ' ORDER BY collected DESC LIMIT 50'
+            dbOrder = [
+                {
+                    'key': 'collected',
+                    'direction': 'DESC'
+                }
+            ]
+            dbLimit = 50
+            dbOffset = None
 
             if isinstance(filters, dict):
 
-                dbMatch = ''
+                dbOrder = None
+                dbLimit = None
 
                 if 'sort' in filters.keys():
 
                     if 'key' in filters['sort'].keys() and 'direction' in filters['sort'].keys():
 
-                        dbMatch = dbMatch + ' ORDER BY %(key)s %(direction)' % {
-                            'key': filters['sort']['key'],
-                            'direction': filters['sort']['direction']
-                        }
+                        dbOrder = [
+                            {
+                                'key': filters['sort']['key'],
+                                'direction': filters['sort']['direction']
+                            }
+                        ]
 
                 if 'paging' in filters.keys():
 
                     if 'size' in filters['paging'].keys() and 'page' in filters['paging'].keys():
 
-                        dbMatch = dbMatch + ' LIMIT %(size)i OFFSET %(start_row)i' % {
-                            'size': filters['paging']['size'],
-                            'start_row': int(filters['paging']['size'] * filters['paging']['page'])
-                        }
+                        dbLimit = int(filters['paging']['size'])
+                        dbOffset = int(filters['paging']['size'] * filters['paging']['page'])
 
 
             dbInfos = self.db.get(
                 'info',
-                match=dbMatch
+                order=dbOrder,
+                limit=dbLimit,
+                offset=dbOffset
             )
 
             if isinstance(dbInfos, DbInfo):
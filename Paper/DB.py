@@ -9,7 +9,7 @@
 # -*- coding: utf-8 -*-
 
 
-import datetime, json, os, re, sqlite3, sys
+import datetime, json, os, pickle, re, sqlite3, sys, threading
 from cryptography.fernet import Fernet
 from random import choice
 
@@ -17,6 +17,36 @@ from random import choice
 class DB:
 
 
+    # Per thread connections, shared by every DB instance in process
+    connections = threading.local()
+
+    connectionPragmas = [
+        'PRAGMA journal_mode = WAL;',
+        'PRAGMA synchronous = NORMAL;',
+        'PRAGMA cache_size = -8192;',
+        'PRAGMA mmap_size = 67108864;',
+        'PRAGMA temp_store = MEMORY;',
+        'PRAGMA foreign_keys = ON;'
+    ]
+
+    # Match operators to SQL, every value bound as parameter
+    matchOperators = {
+        '=': '%(key)s = ?',
+        '!=': '%(key)s != ?',
+        '<': '%(key)s < ?',
+        '<=': '%(key)s <= ?',
+        '>': '%(key)s > ?',
+        '>=': '%(key)s >= ?',
+        'in': '%(key)s IN (%(values)s)',
+        'not_in': '%(key)s NOT IN (%(values)s)',
+        'like': '%(key)s LIKE ? ESCAPE \'\\\'',
+        'not_like': '%(key)s NOT LIKE ? ESCAPE \'\\\''
+    }
+
+    # Next free integer by database, table and key, shared like connections
+    uniqueInts = {}
+    uniqueIntsLock = threading.Lock()
+
     dbObjectInfo = [
         {
             'index': 0,
@@ -149,6 +179,25 @@ class DB:
                         'blur_brightness': 0.5,
                         'thumbnail_sizes': [256, 128, 64],
                         'extension': 'png',
+                        'render': {
+                            'mode': 'auto',
+                            'processes': 0
+                        },
+                        'quantization': {
+                            'mode': 'all',
+                            'budget': 0
+                        },
+                        'dither': {
+                            'algorithm': 'pillow',
+                            'spread': 128.0
+                        },
+                        'ingest': {
+                            'workers': 1,
+                            'keep': 86400.0,
+                            'batch': 8,
+                            'perceptual': True,
+                            'distance': 6
+                        },
                         'palette': {
                             'black': [0, 0, 0],
                             'white': [255, 255, 255],
@@ -481,6 +530,13 @@ class DB:
                     '                    NOT NULL ON CONFLICT ROLLBACK,' \
                     '    expires NUMERIC NOT NULL ON CONFLICT ROLLBACK' \
                     ');',
+                'user': 'SELECT tokens.user_id, tokens.expires, users.username, users.given_name, users.family_name,' \
+                    '       COALESCE(SUM(DISTINCT 1 << user_permissions.permission_id), 0)' \
+                    '  FROM tokens' \
+                    '  INNER JOIN users ON users.id = tokens.user_id' \
+                    '  LEFT JOIN user_permissions ON user_permissions.user_id = tokens.user_id' \
+                    ' WHERE tokens.token = ?' \
+                    ' GROUP BY tokens.token;',
                 'default_sort': 'ORDER BY expires ASC'
             },
             'columns': [
@@ -561,7 +617,9 @@ class DB:
                     '                        NOT NULL ON CONFLICT ROLLBACK,' \
                     '    created     NUMERIC NOT NULL ON CONFLICT ROLLBACK,' \
                     '    ingested    NUMERIC NOT NULL ON CONFLICT ROLLBACK,' \
-                    '    description TEXT' \
+                    '    description TEXT,' \
+                    '    hash        TEXT,' \
+                    '    phash       TEXT' \
                     ');',
                 'default_sort': 'ORDER BY created DESC'
             },
@@ -730,6 +788,34 @@ class DB:
 						'date': True,
                         'api': True
                     }
+                }, {
+                    'index': 10,
+                    'key': 'hash',
+                    'data_info': {
+                        'storage_type': 'TEXT',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': False,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': False,
+                        'api': False
+                    }
+                }, {
+                    'index': 11,
+                    'key': 'phash',
+                    'data_info': {
+                        'storage_type': 'TEXT',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': False,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': False,
+                        'api': False
+                    }
                 }
             ],
             'defaults': [],
@@ -777,7 +863,9 @@ class DB:
                     '    url         TEXT    UNIQUE ON CONFLICT ROLLBACK' \
                     '                        NOT NULL ON CONFLICT ROLLBACK,' \
                     '    orientation TEXT    NOT NULL ON CONFLICT ROLLBACK' \
-                    '                        CHECK (orientation IN (\'landscape\', \'portrait\'))' \
+                    '                        CHECK (orientation IN (\'landscape\', \'portrait\')),' \
+                    '    frame       TEXT,' \
+                    '    used        REAL' \
                     ');',
                 'default_sort': 'ORDER BY image_id ASC'
             },
@@ -890,6 +978,34 @@ class DB:
 						'date': False,
                         'api': True
                     }
+                }, {
+                    'index': 7,
+                    'key': 'frame',
+                    'data_info': {
+                        'storage_type': 'TEXT',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': False,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': False,
+                        'api': False
+                    }
+                }, {
+                    'index': 8,
+                    'key': 'used',
+                    'data_info': {
+                        'storage_type': 'REAL',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': False,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': True,
+                        'api': False
+                    }
                 }
             ],
             'defaults': [],
@@ -1259,6 +1375,7 @@ class DB:
                     '                                                         ON UPDATE CASCADE' \
                     '                                                         MATCH SIMPLE DEFERRABLE' \
                     ');',
+                'remove': 'DELETE FROM tags WHERE image_id = ? AND category_id = ? AND subcategory_id IS ?;',
                 'default_sort': 'ORDER BY image_id ASC'
             },
             'columns': [
@@ -1297,7 +1414,7 @@ class DB:
                         'storage_type': 'INTEGER',
                         'primary_key': False,
                         'unique': False,
-                        'not_null': True,
+                        'not_null': False,
                         'boolean': False,
                         'password': False,
                         'json': False,
@@ -1307,7 +1424,20 @@ class DB:
                 }
             ],
             'defaults': [],
-            'children': []
+            'children': [],
+            'references': [
+                {
+                    'type': 'category',
+                    'key': 'category',
+                    'local_key': 'category_id',
+                    'foreign_key': 'id'
+                }, {
+                    'type': 'subcategory',
+                    'key': 'subcategory',
+                    'local_key': 'subcategory_id',
+                    'foreign_key': 'id'
+                }
+            ]
         }, {
             'index': 11,
             'type': 'info',
@@ -1744,25 +1874,363 @@ class DB:
                 }
             ],
             'children': []
+        }, {
+            'index': 13,
+            'type': 'job',
+            'table': 'jobs',
+            'db_object': 'DbJob',
+            'db_type': 'standard',
+            'queries': {
+                'create': 'CREATE TABLE jobs (' \
+                    '    id          INTEGER PRIMARY KEY ASC ON CONFLICT ROLLBACK' \
+                    '                        UNIQUE ON CONFLICT ROLLBACK' \
+                    '                        NOT NULL ON CONFLICT ROLLBACK,' \
+                    '    type        TEXT    NOT NULL ON CONFLICT ROLLBACK' \
+                    '                        CHECK (type IN (\'ingest\')),' \
+                    '    status      TEXT    NOT NULL ON CONFLICT ROLLBACK' \
+                    '                        CHECK (status IN (\'pending\', \'running\', \'done\', \'error\')),' \
+                    '    progress    REAL    NOT NULL ON CONFLICT ROLLBACK' \
+                    '                        DEFAULT (0.0),' \
+                    '    path        TEXT    NOT NULL ON CONFLICT ROLLBACK,' \
+                    '    info        BLOB,' \
+                    '    image_id    INTEGER,' \
+                    '    message     TEXT,' \
+                    '    created     NUMERIC NOT NULL ON CONFLICT ROLLBACK,' \
+                    '    started     REAL,' \
+                    '    finished    REAL' \
+                    ');',
+                'default_sort': 'ORDER BY created DESC'
+            },
+            'columns': [
+                {
+                    'index': 0,
+                    'key': 'id',
+                    'data_info': {
+                        'storage_type': 'INTEGER',
+                        'primary_key': True,
+                        'unique': True,
+                        'unique_validation': {
+                            'table': 'jobs',
+                            'key': 'id'
+                        },
+                        'unique_generator': 'generateUniqueInt',
+                        'unique_generator_args': {
+                            'table': 'jobs',
+                            'key': 'id'
+                        },
+                        'not_null': True,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': False,
+                        'api': True
+                    }
+                }, {
+                    'index': 1,
+                    'key': 'type',
+                    'data_info': {
+                        'storage_type': 'TEXT',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': True,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': False,
+                        'api': True
+                    }
+                }, {
+                    'index': 2,
+                    'key': 'status',
+                    'data_info': {
+                        'storage_type': 'TEXT',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': True,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': False,
+                        'api': True
+                    }
+                }, {
+                    'index': 3,
+                    'key': 'progress',
+                    'data_info': {
+                        'storage_type': 'REAL',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': True,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': False,
+                        'api': True
+                    }
+                }, {
+                    'index': 4,
+                    'key': 'path',
+                    'data_info': {
+                        'storage_type': 'TEXT',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': True,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': False,
+                        'api': False
+                    }
+                }, {
+                    'index': 5,
+                    'key': 'info',
+                    'data_info': {
+                        'storage_type': 'BLOB',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': False,
+                        'boolean': False,
+                        'password': False,
+                        'json': True,
+						'date': False,
+                        'api': True
+                    }
+                }, {
+                    'index': 6,
+                    'key': 'image_id',
+                    'data_info': {
+                        'storage_type': 'INTEGER',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': False,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': False,
+                        'api': True
+                    }
+                }, {
+                    'index': 7,
+                    'key': 'message',
+                    'data_info': {
+                        'storage_type': 'TEXT',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': False,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': False,
+                        'api': True
+                    }
+                }, {
+                    'index': 8,
+                    'key': 'created',
+                    'data_info': {
+                        'storage_type': 'NUMERIC',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': True,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': True,
+                        'api': True
+                    }
+                }, {
+                    'index': 9,
+                    'key': 'started',
+                    'data_info': {
+                        'storage_type': 'REAL',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': False,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': True,
+                        'api': True
+                    }
+                }, {
+                    'index': 10,
+                    'key': 'finished',
+                    'data_info': {
+                        'storage_type': 'REAL',
+                        'primary_key': False,
+                        'unique': False,
+                        'not_null': False,
+                        'boolean': False,
+                        'password': False,
+                        'json': False,
+						'date': True,
+                        'api': True
+                    }
+                }
+            ],
+            'defaults': [],
+            'children': []
         }
     ]
 
+    # Schema changes for existing databases, applied in order and recorded in PRAGMA user_version
+    migrations = [
+        {
+            'version': 1,
+            'description': 'Indexes for foreign keys and lookups',
+            'operations': [
+                {
+                    'type': 'index',
+                    'table': 'quantizations',
+                    'columns': ['image_id']
+                },
+                {
+                    'type': 'index',
+                    'table': 'thumbnails',
+                    'columns': ['image_id']
+                },
+                {
+                    'type': 'index',
+                    'table': 'tags',
+                    'columns': ['image_id']
+                },
+                {
+                    'type': 'index',
+                    'table': 'tags',
+                    'columns': ['category_id']
+                },
+                {
+                    'type': 'index',
+                    'table': 'subcategories',
+                    'columns': ['category_id']
+                },
+                {
+                    'type': 'index',
+                    'table': 'tokens',
+                    'columns': ['user_id']
+                },
+                {
+                    'type': 'index',
+                    'table': 'tokens',
+                    'columns': ['expires']
+                },
+                {
+                    'type': 'index',
+                    'table': 'infos',
+                    'columns': ['collected']
+                }
+            ]
+        },
+        {
+            'version': 2,
+            'description': 'Quantization frame reuse and image content hashes',
+            'operations': [
+                {
+                    'type': 'column',
+                    'table': 'quantizations',
+                    'column': 'frame'
+                },
+                {
+                    'type': 'column',
+                    'table': 'quantizations',
+                    'column': 'used'
+                },
+                {
+                    'type': 'column',
+                    'table': 'images',
+                    'column': 'hash'
+                },
+                {
+                    'type': 'column',
+                    'table': 'images',
+                    'column': 'phash'
+                },
+                {
+                    'type': 'index',
+                    'table': 'images',
+                    'columns': ['hash']
+                }
+            ]
+        },
+        {
+            'version': 3,
+            'description': 'Rows orphaned before foreign keys were enforced',
+            'operations': [
+                {
+                    # User deletes used to take permission rows with them
+                    'type': 'defaults',
+                    'table': 'permissions'
+                },
+                {
+                    'type': 'query',
+                    'query': 'DELETE FROM user_permissions WHERE user_id NOT IN (SELECT id FROM users) OR permission_id NOT IN (SELECT id FROM permissions);'
+                },
+                {
+                    'type': 'query',
+                    'query': 'DELETE FROM tokens WHERE user_id NOT IN (SELECT id FROM users);'
+                },
+                {
+                    'type': 'query',
+                    'query': 'DELETE FROM quantizations WHERE image_id NOT IN (SELECT id FROM images);'
+                },
+                {
+                    'type': 'query',
+                    'query': 'DELETE FROM thumbnails WHERE image_id NOT IN (SELECT id FROM images);'
+                },
+                {
+                    'type': 'query',
+                    'query': 'DELETE FROM subcategories WHERE category_id NOT IN (SELECT id FROM categories);'
+                },
+                {
+                    'type': 'query',
+                    'query': 'DELETE FROM tags WHERE image_id NOT IN (SELECT id FROM images) OR category_id NOT IN (SELECT id FROM categories) OR (subcategory_id IS NOT NULL AND subcategory_id NOT IN (SELECT id FROM subcategories));'
+                }
+            ]
+        },
+        {
+            'version': 4,
+            'description': 'Indexes for image listing sorts',
+            'operations': [
+                {
+                    'type': 'index',
+                    'table': 'images',
+                    'columns': ['created']
+                },
+                {
+                    'type': 'index',
+                    'table': 'images',
+                    'columns': ['ingested']
+                },
+                {
+                    'type': 'index',
+                    'table': 'images',
+                    'columns': ['description']
+                }
+            ]
+        }
+    ]
+
+
+    def __init__(self):
+        """Initialize."""
+
+        self.logFileKey = 'db_log'
+
+        for info in self.dbObjectInfo:
+
+            if not 'compiled' in info.keys():
+
+                info['compiled'] = self.compileObjectInfo(info)
+
+        self.setPaths()
+        self.initDB()
+
+        self.log(self.logFileKey, 'DB.__init__', 'started.')
+
+
+        return
+    def setPaths(self):
+        """Set local paths."""
 
-    def __init__(self):
-        """Initialize."""
-
-        self.logFileKey = 'db_log'
-
-        self.setPaths()
-        self.initDB()
-
-        self.log(self.logFileKey, 'DB.__init__', 'started.')
-
-
-        return
-    def setPaths(self):
-        """Set local paths."""
-
         self.paths = {
             'root': {
                 'type': 'directory',
@@ -1926,6 +2394,28 @@ class DB:
                     )
                 )
             },
+            'render_log': {
+                'type': 'log',
+                'path': os.path.join(
+                    os.path.dirname(
+                        os.path.realpath(__file__)
+                    ),
+                    'data',
+                    '.'.join(
+                        [
+                            '_'.join(
+                                [
+                                    os.path.dirname(
+                                        os.path.realpath(__file__)
+                                    ).rsplit(os.sep, 1)[-1],
+                                    'Render'
+                                ]
+                            ),
+                            'log'
+                        ]
+                    )
+                )
+            },
             'scissor_log': {
                 'type': 'log',
                 'path': os.path.join(
@@ -1976,6 +2466,26 @@ class DB:
                     'data',
                     'api_credentials.json'
                 )
+            },
+            'palette_lut': {
+                'type': 'lut',
+                'path': os.path.join(
+                    os.path.dirname(
+                        os.path.realpath(__file__)
+                    ),
+                    'data',
+                    'palette_lut.npz'
+                )
+            },
+            'local_index': {
+                'type': 'json',
+                'path': os.path.join(
+                    os.path.dirname(
+                        os.path.realpath(__file__)
+                    ),
+                    'data',
+                    'local_index.json'
+                )
             }
         }
 
@@ -2006,15 +2516,55 @@ class DB:
 
 
         return
-    def initDB(self):
-        """Initialize database."""
+    def getConnection(self):
+        """Gets pooled connection for current thread, opening it on first use."""
 
-        try:
+        if not hasattr(DB.connections, 'pool'):
+
+            DB.connections.pool = {}
+
+
+        dbConnection = DB.connections.pool.get(self.paths['db']['path'])
+
+        if dbConnection is None:
 
             dbConnection = sqlite3.connect(
                 self.paths['db']['path'],
-                check_same_thread=False
+                check_same_thread=False,
+                timeout=10.0,
+                cached_statements=256
             )
+
+            for pragma in self.connectionPragmas:
+
+                dbConnection.execute(pragma)
+
+            DB.connections.pool[self.paths['db']['path']] = dbConnection
+
+        elif dbConnection.in_transaction == True:
+
+            # Left open by an earlier failure, never shared across a checkout
+            dbConnection.rollback()
+
+
+        return dbConnection
+    def releaseConnection(self, dbConnection):
+        """Returns pooled connection, discarding anything not committed."""
+
+        if not dbConnection is None:
+
+            if dbConnection.in_transaction == True:
+
+                dbConnection.rollback()
+
+
+        return
+    def initDB(self):
+        """Initialize database."""
+
+        try:
+
+            dbConnection = self.getConnection()
             dbCursor = dbConnection.cursor()
 
 
@@ -2046,6 +2596,12 @@ class DB:
                     dbConnection.commit()
 
 
+            self.migrateDB(
+                dbConnection,
+                dbCursor
+            )
+
+
             if not 'settings' in activeTables:
 
                 info = [
@@ -2206,7 +2762,7 @@ class DB:
 
 
             if not dbCursor is None: dbCursor.close()
-            if not dbConnection is None: dbConnection.close()
+            if not dbConnection is None: self.releaseConnection(dbConnection)
 
         except Exception as e:
 
@@ -2222,11 +2778,164 @@ class DB:
             )
 
 
+        return
+    def migrateDB(self, dbConnection, dbCursor):
+        """Apply schema migrations newer than PRAGMA user_version, one transaction each."""
+
+        for migration in sorted(self.migrations, key=lambda m: m['version']):
+
+            try:
+
+                # Write lock first, so concurrent processes apply each version once
+                dbCursor.execute(
+                    'BEGIN IMMEDIATE;'
+                )
+
+                dbCursor.execute(
+                    'PRAGMA user_version;'
+                )
+
+                if dbCursor.fetchone()[0] >= migration['version']:
+
+                    dbConnection.rollback()
+
+                    continue
+
+
+                for operation in migration['operations']:
+
+                    if operation['type'] == 'index':
+
+                        dbCursor.execute(
+                            'CREATE INDEX IF NOT EXISTS %(name)s ON %(table)s (%(columns)s);' % {
+                                'name': '_'.join(
+                                    [operation['table']] + operation['columns']
+                                ),
+                                'table': operation['table'],
+                                'columns': ', '.join(operation['columns'])
+                            }
+                        )
+
+                    elif operation['type'] == 'column':
+
+                        dbCursor.execute(
+                            'PRAGMA table_info(%(table)s);' % {
+                                'table': operation['table']
+                            }
+                        )
+
+                        if not operation['column'] in [queryValue[1] for queryValue in dbCursor.fetchall()]:
+
+                            column = [
+                                column
+                                for info in self.dbObjectInfo
+                                if info['table'] == operation['table']
+                                for column in info['columns']
+                                if column['key'] == operation['column']
+                            ][0]
+
+                            # SQLite can only add nullable columns without a rebuild
+                            if column['data_info']['not_null'] == True:
+
+                                raise DbValueException(
+                                    'Column %(table)s.%(column)s must be nullable.' % {
+                                        'table': operation['table'],
+                                        'column': operation['column']
+                                    }
+                                )
+
+                            dbCursor.execute(
+                                'ALTER TABLE %(table)s ADD COLUMN %(column)s %(storage_type)s;' % {
+                                    'table': operation['table'],
+                                    'column': operation['column'],
+                                    'storage_type': column['data_info']['storage_type']
+                                }
+                            )
+
+                    elif operation['type'] == 'defaults':
+
+                        info = [
+                            info
+                            for info in self.dbObjectInfo
+                            if info['table'] == operation['table']
+                        ][0]
+
+                        # Puts back missing default rows, existing rows win
+                        dbCursor.executemany(
+                            'INSERT OR IGNORE INTO %(table)s (%(columns)s) VALUES (%(values)s);' % {
+                                'table': info['table'],
+                                'columns': ', '.join(info['compiled']['column_keys']),
+                                'values': ', '.join(
+                                    [
+                                        '?'
+                                        for key in info['compiled']['column_keys']
+                                    ]
+                                )
+                            },
+                            [
+                                tuple(
+                                    [
+                                        default[key] if key in default.keys() else None
+                                        for key in info['compiled']['column_keys']
+                                    ]
+                                )
+                                for default in info['defaults']
+                            ]
+                        )
+
+                    elif operation['type'] == 'query':
+
+                        dbCursor.execute(
+                            operation['query']
+                        )
+
+
+                dbCursor.execute(
+                    'PRAGMA user_version = %(version)d;' % {
+                        'version': migration['version']
+                    }
+                )
+
+                dbConnection.commit()
+
+                self.log(
+                    self.logFileKey,
+                    '.'.join(
+                        [
+                            str(self.__class__.__name__),
+                            str(sys._getframe().f_code.co_name)
+                        ]
+                    ),
+                    'Migrated to version %(version)d, %(description)s.' % {
+                        'version': migration['version'],
+                        'description': migration['description']
+                    }
+                )
+
+            except Exception as e:
+
+                dbConnection.rollback()
+
+                self.log(
+                    self.logFileKey,
+                    '.'.join(
+                        [
+                            str(self.__class__.__name__),
+                            str(sys._getframe().f_code.co_name)
+                        ]
+                    ),
+                    str(e)
+                )
+
+                # Later migrations may depend on this one
+                break
+
+
         return
 
 
-    def get(self, dbObjectType, match=None):
-        """Get DbObject(s) from DB."""
+    def get(self, dbObjectType, match=None, projection=None, order=None, limit=None, offset=None, after=None):
+        """Get DbObject(s) from DB, optionally only projected columns and child relations, see buildQuery for match and paging."""
 
         dbResults = None
 
@@ -2236,31 +2945,37 @@ class DB:
 
                 if info['type'] == dbObjectType:
 
-                    dbConnection = sqlite3.connect(
-                        self.paths['db']['path'],
-                        check_same_thread=False
-                    )
+                    # Projection {'columns': [...], 'children': {key: projection or None}}, None loads everything
+                    relations = [
+                        relation
+                        for relation in info['children'] + (info['references'] if 'references' in info.keys() else [])
+                        if projection is None or relation['key'] in (projection['children'] if 'children' in projection.keys() else {}).keys()
+                    ]
+
+                    selectedColumns = [
+                        column
+                        for column in sorted(info['columns'], key=lambda c: c['index'])
+                        if 'select' in info['queries'].keys() or projection is None or not 'columns' in projection.keys() or column['key'] in projection['columns'] or column['key'] in [relation['local_key'] for relation in relations]
+                    ]
+
+
+                    dbConnection = self.getConnection()
                     dbCursor = dbConnection.cursor()
 
 
+                    queryClause, queryValues = self.buildQuery(
+                        info,
+                        match=match,
+                        order=order,
+                        limit=limit,
+                        offset=offset,
+                        after=after
+                    )
+
                     dbCursor.execute(
                         (
                             info['queries']['select'] % {
-                                'match': '' if match is None else (
-                                    match if isinstance(match, str) else (
-                                        ' WHERE ' + ' AND '.join(
-                                            [
-                                                '%(key)s = %(value)s' % {
-                                                    'key': key,
-                                                    'value': 'NULL' if match[key] is None else (
-                                                        '\'%s\'' % (match[key], ) if isinstance(match[key], str) else str(match[key])
-                                                    )
-                                                }
-                                                for key in match.keys()
-                                            ]
-                                        )
-                                    )
-                                )
+                                'match': queryClause
                             }
                         ) if 'select' in info['queries'].keys() else (
                             'SELECT %(columns)s FROM %(table)s%(match)s;' % {
@@ -2268,43 +2983,30 @@ class DB:
                                 'columns': ', '.join(
                                     [
                                         column['key']
-                                        for column in sorted(info['columns'], key=lambda c: c['index'])
+                                        for column in selectedColumns
                                     ]
                                 ),
-                                'match': ' ' + info['queries']['default_sort'] if match is None else (
-                                    match if isinstance(match, str) else (
-                                        ' WHERE ' + ' AND '.join(
-                                            [
-                                                '%(key)s = %(value)s' % {
-                                                    'key': key,
-                                                    'value': 'NULL' if match[key] is None else (
-                                                        '\'%s\'' % (match[key], ) if isinstance(match[key], str) else str(match[key])
-                                                    )
-                                                }
-                                                for key in match.keys()
-                                            ]
-                                        )
-                                    )
-                                )
+                                'match': queryClause
                             }
-                        )
+                        ),
+                        queryValues
                     )
 
                     rawResults = [
                         dict(
                             [
                                 (
-                                    sorted(info['columns'], key=lambda c: c['index'])[column]['key'],
+                                    selectedColumns[column]['key'],
                                     rawResult[column]
                                 )
-                                for column in range(len(info['columns']))
+                                for column in range(len(selectedColumns))
                             ]
                         )
                         for rawResult in dbCursor.fetchall()
                     ]
 
                     if not dbCursor is None: dbCursor.close()
-                    if not dbConnection is None: dbConnection.close()
+                    if not dbConnection is None: self.releaseConnection(dbConnection)
 
 
                     if len(rawResults) > 0:
@@ -2312,34 +3014,40 @@ class DB:
                         ObjectClass = globals()[info['db_object']]
                         objectResults = []
 
-                        for r in range(len(rawResults)):
+                        # One query per child table and reference for all rows, stitched by key
+                        for relation in relations:
+
+                            relationResults = self.getByKeys(
+                                relation['type'],
+                                relation['foreign_key'],
+                                [
+                                    rawResult[relation['local_key']]
+                                    for rawResult in rawResults
+                                ],
+                                projection=None if projection is None else projection['children'][relation['key']]
+                            )
 
-                            for child in info['children']:
+                            for r in range(len(rawResults)):
 
-                                rawResults[r][child['key']] = self.get(
-                                    child['type'],
-                                    match=' WHERE %(key)s = %(value)s' % {
-                                        'key': child['foreign_key'],
-                                        'value': (
-                                            '\'%s\'' % (
-                                                rawResults[r][child['local_key']], 
-                                            )
-                                        ) if isinstance(rawResults[r][child['local_key']], str) else str(rawResults[r][child['local_key']])
-                                    }
+                                relationMatches = relationResults.get(
+                                    rawResults[r][relation['local_key']],
+                                    []
                                 )
 
-                                if child['relationship'] in ['one_to_many', 'many_to_many']:
+                                if 'relationship' in relation.keys() and relation['relationship'] in ['one_to_many', 'many_to_many']:
+
+                                    rawResults[r][relation['key']] = relationMatches
 
-                                    if not isinstance(rawResults[r][child['key']], list):
-                                        
-                                        if rawResults[r][child['key']] is None:
+                                else:
+
+                                    rawResults[r][relation['key']] = None if len(relationMatches) == 0 else (
+                                        relationMatches[0] if len(relationMatches) == 1 else relationMatches
+                                    )
+
+                            del relationResults
 
-                                            rawResults[r][child['key']] = []
-                                            
-                                        else:
-                                            
-                                            rawResults[r][child['key']] = [rawResults[r][child['key']]]
 
+                        for r in range(len(rawResults)):
 
                             objectResult = ObjectClass(
                                 self,
@@ -2380,20 +3088,375 @@ class DB:
 
 
         return dbResults
-    def new(self, dbObjectType, objectValues):
-        """Creates new DbObject(s) in DB."""
+    def getByKeys(self, dbObjectType, key, values, projection=None):
+        """Get DbObjects whose key is in values, grouped by key value."""
 
-        dbResult = None
+        dbResults = {}
 
         try:
 
-            if isinstance(objectValues, dict):
+            if not projection is None:
 
-                for info in [i for i in self.dbObjectInfo if i['db_type'] == 'standard']:
+                if 'columns' in projection.keys() and not key in projection['columns']:
 
-                    if info['type'] == dbObjectType:
+                    projection = dict(projection)
+                    projection['columns'] = projection['columns'] + [key]
 
-                        ObjectClass = globals()[info['db_object']]
+            keyValues = list(
+                dict.fromkeys(
+                    [
+                        value
+                        for value in values
+                        if not value is None
+                    ]
+                )
+            )
+
+            for i in range(0, len(keyValues), 500):
+
+                dbObjects = self.get(
+                    dbObjectType,
+                    match={
+                        key: keyValues[i:i + 500]
+                    },
+                    projection=projection
+                )
+
+                if not dbObjects is None:
+
+                    if not isinstance(dbObjects, list):
+
+                        dbObjects = [dbObjects]
+
+                    for dbObject in dbObjects:
+
+                        dbResults.setdefault(
+                            dbObject.working[key],
+                            []
+                        ).append(dbObject)
+
+                del dbObjects
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                ' '.join(
+                    [
+                        str(dbObjectType),
+                        str(key),
+                        str(e)
+                    ]
+                )
+            )
+
+
+        return dbResults
+    def buildQuery(self, info, match=None, order=None, limit=None, offset=None, after=None):
+        """Builds parameterized WHERE, ORDER BY and LIMIT clause and its values for get."""
+
+        # Match {key: value}, None as IS NULL, list as IN, or {operator: value} from matchOperators, see buildMatch
+        # Order [{'key': key, 'direction': 'ASC' or 'DESC'}], default_sort when unordered without match or when paging
+        # After {key: value} of last row seen for keyset paging, order gains primary keys as tie breaker
+        queryClauses = []
+        queryValues = []
+        orderClauses = []
+
+        columnKeys = info['compiled']['column_keys']
+
+        if not match is None:
+
+            matchClause, matchValues = self.buildMatch(
+                info,
+                match
+            )
+
+            if len(matchClause) > 0:
+
+                queryClauses.append(
+                    matchClause
+                )
+                queryValues.extend(
+                    matchValues
+                )
+
+
+        if not order is None or not after is None:
+
+            order = [
+                {
+                    'key': sort['key'],
+                    'direction': 'DESC' if str(sort['direction']).upper() == 'DESC' else 'ASC'
+                }
+                for sort in (order if not order is None else [])
+            ]
+
+            # Tie breaker runs the same way as the last key, so an index on it scans in one direction
+            for key in info['compiled']['primary_keys']:
+
+                if not key in [sort['key'] for sort in order]:
+
+                    order.append(
+                        {
+                            'key': key,
+                            'direction': order[-1]['direction'] if len(order) > 0 else 'ASC'
+                        }
+                    )
+
+            for sort in order:
+
+                if not sort['key'] in columnKeys:
+
+                    raise DbValueException('Unknown column %s.' % (sort['key'], ))
+
+
+            orderClauses = [
+                '%(key)s %(direction)s' % sort
+                for sort in order
+            ]
+
+
+        if not after is None:
+
+            # Row comparison by hand, ASC puts NULL first and DESC last
+            afterClauses = []
+
+            nullableKeys = [
+                column['key']
+                for column in info['columns']
+                if column['data_info']['not_null'] == False and column['data_info']['primary_key'] == False
+            ]
+
+            # Bound on the first key alone lets an index seek past earlier rows
+            if order[0]['key'] in after.keys() and not after[order[0]['key']] is None and (order[0]['direction'] == 'ASC' or not order[0]['key'] in nullableKeys):
+
+                queryClauses.append(
+                    '%(key)s %(operator)s ?' % {
+                        'key': order[0]['key'],
+                        'operator': '>=' if order[0]['direction'] == 'ASC' else '<='
+                    }
+                )
+                queryValues.append(
+                    after[order[0]['key']]
+                )
+
+
+            for i in range(len(order)):
+
+                if not order[i]['key'] in after.keys():
+
+                    raise DbValueException('Missing keyset value %s.' % (order[i]['key'], ))
+
+
+                value = after[order[i]['key']]
+
+                if order[i]['direction'] == 'DESC' and value is None:
+
+                    continue
+
+
+                afterClauses.append(
+                    '(%s)' % (
+                        ' AND '.join(
+                            [
+                                '%(key)s IS ?' % sort
+                                for sort in order[:i]
+                            ] + [
+                                '%(key)s IS NOT NULL' % order[i] if value is None else (
+                                    '%(key)s > ?' % order[i] if order[i]['direction'] == 'ASC' else (
+                                        '(%(key)s < ? OR %(key)s IS NULL)' if order[i]['key'] in nullableKeys else '%(key)s < ?'
+                                    ) % order[i]
+                                )
+                            ]
+                        ),
+                    )
+                )
+                queryValues.extend(
+                    [
+                        after[sort['key']]
+                        for sort in order[:i]
+                    ] + ([] if value is None else [value])
+                )
+
+            queryClauses.append(
+                '(%s)' % (' OR '.join(afterClauses), ) if len(afterClauses) > 0 else '0'
+            )
+
+
+        queryClause = '' if len(queryClauses) == 0 else ' WHERE ' + ' AND '.join(queryClauses)
+
+        if len(orderClauses) > 0:
+
+            queryClause = queryClause + ' ORDER BY ' + ', '.join(orderClauses)
+
+        elif match is None or not limit is None or not offset is None:
+
+            queryClause = queryClause + ' ' + info['queries']['default_sort']
+
+
+        if not limit is None or not offset is None:
+
+            queryClause = queryClause + ' LIMIT ? OFFSET ?'
+            queryValues.extend(
+                [
+                    -1 if limit is None else int(limit),
+                    0 if offset is None else int(offset)
+                ]
+            )
+
+
+        return queryClause, tuple(queryValues)
+    def buildMatch(self, info, match):
+        """Builds parameterized condition and its values for match, a list of matches is OR of each."""
+
+        matchClauses = []
+        matchValues = []
+
+        columnKeys = info['compiled']['column_keys']
+
+        if isinstance(match, list):
+
+            for subMatch in match:
+
+                subClause, subValues = self.buildMatch(
+                    info,
+                    subMatch
+                )
+
+                matchClauses.append(
+                    '(%s)' % (subClause if len(subClause) > 0 else '1', )
+                )
+                matchValues.extend(
+                    subValues
+                )
+
+
+            return '(%s)' % (' OR '.join(matchClauses) if len(matchClauses) > 0 else '0', ), matchValues
+
+
+        for key in match.keys():
+
+            if not key in columnKeys:
+
+                raise DbValueException('Unknown column %s.' % (key, ))
+
+
+            operations = match[key] if isinstance(match[key], dict) else {
+                'in' if isinstance(match[key], (list, tuple)) else '=': match[key]
+            }
+
+            for operator in operations.keys():
+
+                if not operator in self.matchOperators.keys():
+
+                    raise DbValueException('Unknown operator %s.' % (operator, ))
+
+
+                value = operations[operator]
+
+                if operator in ['in', 'not_in'] and isinstance(value, dict):
+
+                    # Subquery {'type': type, 'key': key, 'match': match}, a semi join kept in SQL
+                    subInfo = [
+                        subInfo
+                        for subInfo in self.dbObjectInfo
+                        if subInfo['type'] == value['type']
+                    ][0]
+
+                    if not value['key'] in subInfo['compiled']['column_keys']:
+
+                        raise DbValueException('Unknown column %s.' % (value['key'], ))
+
+
+                    subClause, subValues = self.buildMatch(
+                        subInfo,
+                        value['match'] if 'match' in value.keys() else {}
+                    )
+
+                    matchClauses.append(
+                        self.matchOperators[operator] % {
+                            'key': key,
+                            'values': 'SELECT %(key)s FROM %(table)s%(match)s' % {
+                                'key': value['key'],
+                                'table': subInfo['table'],
+                                'match': '' if len(subClause) == 0 else ' WHERE ' + subClause
+                            }
+                        }
+                    )
+                    matchValues.extend(
+                        subValues
+                    )
+
+                elif operator in ['in', 'not_in']:
+
+                    value = list(value)
+
+                    if len(value) == 0:
+
+                        # Empty IN matches nothing, empty NOT IN everything
+                        matchClauses.append(
+                            '0' if operator == 'in' else '1'
+                        )
+
+                    else:
+
+                        matchClauses.append(
+                            self.matchOperators[operator] % {
+                                'key': key,
+                                'values': ', '.join(
+                                    [
+                                        '?'
+                                        for v in value
+                                    ]
+                                )
+                            }
+                        )
+                        matchValues.extend(
+                            value
+                        )
+
+                elif value is None and operator in ['=', '!=']:
+
+                    matchClauses.append(
+                        '%(key)s IS %(not)sNULL' % {
+                            'key': key,
+                            'not': '' if operator == '=' else 'NOT '
+                        }
+                    )
+
+                else:
+
+                    matchClauses.append(
+                        self.matchOperators[operator] % {
+                            'key': key
+                        }
+                    )
+                    matchValues.append(
+                        value
+                    )
+
+
+        return ' AND '.join(matchClauses), matchValues
+    def new(self, dbObjectType, objectValues):
+        """Creates new DbObject(s) in DB."""
+
+        dbResult = None
+
+        try:
+
+            if isinstance(objectValues, dict):
+
+                for info in [i for i in self.dbObjectInfo if i['db_type'] == 'standard']:
+
+                    if info['type'] == dbObjectType:
+
+                        ObjectClass = globals()[info['db_object']]
 
 
                         objectResult = ObjectClass(
@@ -2424,30 +3487,322 @@ class DB:
 
 
         return dbResult
-    def delete(self, dbObjectType, match=None, children=True):
-        """Deletes DbObject(s) from DB."""
+    def compileObjectInfo(self, info):
+        """Compiles table column info once, sorted columns, key tuples, statements and a loader per column for rows read back."""
+
+        columns = tuple(
+            sorted(
+                info['columns'],
+                key=lambda c: c['index']
+            )
+        )
+
+        primaryKeys = tuple(
+            [
+                column['key']
+                for column in columns
+                if column['data_info']['primary_key'] == True
+            ]
+        )
+
+        # Rows are deleted by primary key, else by unique columns, else by every plain column
+        matchKeys = primaryKeys
+
+        if len(matchKeys) == 0:
+
+            matchKeys = tuple(
+                [
+                    column['key']
+                    for column in columns
+                    if column['data_info']['unique'] == True
+                ]
+            )
+
+        if len(matchKeys) == 0:
+
+            matchKeys = tuple(
+                [
+                    column['key']
+                    for column in columns
+                    if column['data_info']['json'] == False and column['data_info']['storage_type'] != 'BLOB'
+                ]
+            )
+
+        fileKeys = tuple(
+            [
+                column['key']
+                for column in columns
+                if column['key'] in ['path', 'frame'] and issubclass(globals()[info['db_object']], DbObjectFile)
+            ]
+        )
+
+        loaders = []
+
+        for column in columns:
+
+            dataInfo = column['data_info']
+
+            # Passwords decrypt and defaults apply on the full validate path
+            loader = 'loadValidated'
+
+            if dataInfo['storage_type'] == 'INTEGER':
+
+                loader = 'loadBoolean' if dataInfo['boolean'] == True else 'loadInteger'
+
+            elif dataInfo['storage_type'] == 'TEXT' and dataInfo['password'] == False:
+
+                loader = 'loadJsonText' if dataInfo['json'] == True else 'loadText'
+
+            elif dataInfo['storage_type'] in ['NUMERIC', 'REAL']:
+
+                loader = 'loadNumber'
+
+            elif dataInfo['storage_type'] == 'BLOB':
+
+                loader = 'loadJsonBlob' if dataInfo['json'] == True else 'loadBlob'
+
+            loaders.append(
+                (
+                    column['key'],
+                    getattr(DbObjectStandard, loader),
+                    dataInfo
+                )
+            )
+
+
+        return {
+            'columns': columns,
+            'column_keys': tuple(
+                [
+                    column['key']
+                    for column in columns
+                ]
+            ),
+            'child_keys': tuple(
+                [
+                    child['key']
+                    for child in info['children']
+                ]
+            ),
+            'primary_keys': primaryKeys,
+            'match_keys': matchKeys,
+            'file_keys': fileKeys,
+            'delete_columns': tuple(
+                dict.fromkeys(
+                    list(matchKeys) + list(fileKeys) + [
+                        child['local_key']
+                        for child in info['children']
+                    ]
+                )
+            ),
+            'api_keys': tuple(
+                [
+                    column['key']
+                    for column in columns
+                    if column['data_info']['api'] == True
+                ]
+            ),
+            'date_keys': tuple(
+                [
+                    column['key']
+                    for column in columns
+                    if column['data_info']['date'] == True
+                ]
+            ),
+            'loaders': tuple(loaders),
+            'delete': 'DELETE FROM %(table)s WHERE %(match)s;' % {
+                'table': info['table'],
+                'match': ' AND '.join(
+                    [
+                        matchKey + (' = ?' if matchKey in primaryKeys else ' IS ?')
+                        for matchKey in matchKeys
+                    ]
+                )
+            },
+            # Upsert by primary key, a REPLACE would delete the row first and cascade to its children
+            'insert': 'INSERT INTO %(table)s (%(columns)s) VALUES (%(values)s)%(conflict)s;' % {
+                'table': info['table'],
+                'columns': ', '.join(
+                    [
+                        column['key']
+                        for column in columns
+                    ]
+                ),
+                'values': ', '.join(
+                    [
+                        '?'
+                        for column in columns
+                    ]
+                ),
+                'conflict': '' if len(primaryKeys) == 0 else ' ON CONFLICT (%(primary_keys)s) %(action)s' % {
+                    'primary_keys': ', '.join(primaryKeys),
+                    'action': 'DO NOTHING' if len(primaryKeys) == len(columns) else 'DO UPDATE SET ' + ', '.join(
+                        [
+                            column['key'] + ' = excluded.' + column['key']
+                            for column in columns
+                            if not column['key'] in primaryKeys
+                        ]
+                    )
+                }
+            },
+            'update': None if len(primaryKeys) == 0 else 'UPDATE %(table)s SET %(column_value)s WHERE %(match)s;' % {
+                'table': info['table'],
+                'column_value': ', '.join(
+                    [
+                        column['key'] + ' = ?'
+                        for column in columns
+                        if not column['key'] in primaryKeys
+                    ]
+                ),
+                'match': ' AND '.join(
+                    [
+                        primaryKey + ' = ?'
+                        for primaryKey in primaryKeys
+                    ]
+                )
+            }
+        }
+    def transaction(self):
+        """Starts unit of work, new/save/delete queued and written in one transaction on commit."""
+
+
+        return DbTransaction(self)
+    def reserveUniqueInts(self, key, table, count=1):
+        """Reserves count consecutive unused integers for table/key, above MAX() and anything reserved before."""
+
+        uniqueInts = None
 
         try:
 
-            if not match is None:
+            dbConnection = self.getConnection()
+            dbCursor = dbConnection.cursor()
+
+
+            # Read off the end of the primary key index, so rows from other processes are seen
+            dbCursor.execute(
+                'SELECT MAX(%(key)s) FROM %(table)s;' % {
+                    'key': str(key),
+                    'table': str(table)
+                }
+            )
+
+            queryValue = dbCursor.fetchone()
 
-                dbResults = self.get(
-                    dbObjectType=dbObjectType,
-                    match=match
+
+            if not dbCursor is None: dbCursor.close()
+            if not dbConnection is None: self.releaseConnection(dbConnection)
+
+
+            with DB.uniqueIntsLock:
+
+                markKey = (
+                    self.paths['db']['path'],
+                    str(table),
+                    str(key)
                 )
 
-                if not dbResults is None:
+                firstInt = max(
+                    [
+                        DB.uniqueInts.get(markKey, 0),
+                        0 if queryValue is None or queryValue[0] is None else queryValue[0] + 1
+                    ]
+                )
 
-                    if not isinstance(dbResults, list):
+                DB.uniqueInts[markKey] = firstInt + count
 
-                        dbResults = [dbResults]
+            uniqueInts = range(
+                firstInt,
+                firstInt + count
+            )
 
-                    for dbResult in dbResults:
+        except Exception as e:
 
-                        dbResult.delete(
-                            children=children,
-                            parentCursor=None
-                        )
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return uniqueInts
+    def getTokenUser(self, token):
+        """Gets token's user, permission bitset and expiry in one query, without loading objects."""
+
+        tokenUser = None
+
+        try:
+
+            info = [
+                info
+                for info in self.dbObjectInfo
+                if info['type'] == 'token'
+            ][0]
+
+            dbConnection = self.getConnection()
+            dbCursor = dbConnection.cursor()
+
+
+            dbCursor.execute(
+                info['queries']['user'],
+                (
+                    str(token),
+                )
+            )
+
+            queryValue = dbCursor.fetchone()
+
+
+            if not dbCursor is None: dbCursor.close()
+            if not dbConnection is None: self.releaseConnection(dbConnection)
+
+
+            if not queryValue is None:
+
+                tokenUser = {
+                    'user_id': queryValue[0],
+                    'expires': queryValue[1],
+                    'username': queryValue[2],
+                    'given_name': queryValue[3],
+                    'family_name': queryValue[4],
+                    'permissions': queryValue[5]
+                }
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return tokenUser
+    def delete(self, dbObjectType, match=None, children=True):
+        """Deletes DbObject(s) from DB in one transaction, foreign keys cascading to children."""
+
+        try:
+
+            if not match is None:
+
+                dbTransaction = self.transaction()
+
+                dbTransaction.delete(
+                    dbObjectType,
+                    match=match,
+                    children=children
+                )
+
+                dbTransaction.commit()
 
         except Exception as e:
 
@@ -2511,12 +3866,229 @@ class DB:
 
             else:
 
-                raise DbValueException('Invalid text.')
+                raise DbValueException('Invalid text.')
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return result
+    def getPasswordRegex(self):
+        """Gets password regex based on current password settings."""
+
+        passwordRegex = r''
+
+        try:
+
+            passwordSettings = self.settings.get('password')
+
+
+            passwordRegexOptions = {
+                'template': r'^%(upper)s%(lower)s%(number)s%(special)s.{%(length)i,}$',
+                'upper': r'(?=.*?[A-Z])', 
+                'lower': r'(?=.*?[a-z])',
+                'number': r'(?=.*?[0-9])',
+                'special': r'(?=.*?[^A-Za-z0-9])'
+            }
+
+            passwordRegex = passwordRegexOptions['template'] % {
+                'upper': passwordRegexOptions['upper'] if passwordSettings['upper'] == True else r'',
+                'lower': passwordRegexOptions['lower'] if passwordSettings['lower'] == True else r'',
+                'number': passwordRegexOptions['number'] if passwordSettings['number'] == True else r'',
+                'special': passwordRegexOptions['special'] if passwordSettings['special'] == True else r'',
+                'length': passwordSettings['length']
+            }
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return passwordRegex
+
+
+    def log(self, logFileKey, source, status):
+        """Write log."""
+
+        try:
+
+            with open(self.paths[logFileKey]['path'], 'a', encoding='utf-8') as f:
+
+                f.write(
+                    '%s | %s : %s\n' % (
+                        str(datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S.%f'))[0:-3],
+                        source,
+                        status.replace('\r', '').replace('\n', '\\n')
+                    )
+                )
+
+        except:
+
+            print(
+                'Could not open',
+                logFileKey,
+                source,
+                status
+            )
+
+
+        return
+
+
+class DbValueException(Exception): pass
+
+
+class DbTransaction:
+    def __init__(self, db):
+        """Initialize."""
+
+        self.db = db
+
+        # Statements in order, runs of the same statement grouped for executemany
+        self.operations = []
+
+        # Files of deleted objects, removed once the rows are gone
+        self.files = []
+
+
+        return
+
+
+    def new(self, dbObjectType, objectValues):
+        """Creates new DbObject, its insert queued until commit."""
+
+        dbResult = None
+
+        try:
+
+            if isinstance(objectValues, dict):
+
+                for info in [i for i in self.db.dbObjectInfo if i['db_type'] == 'standard']:
+
+                    if info['type'] == dbObjectType:
+
+                        ObjectClass = globals()[info['db_object']]
+
+
+                        objectResult = ObjectClass(
+                            self.db,
+                            info
+                        )
+                        objectResult.transaction = self
+                        objectResult.new(
+                            objectValues=objectValues,
+                            fromDb=False
+                        )
+
+                        dbResult = objectResult
+
+                        break
+
+        except Exception as e:
+
+            self.db.log(
+                self.db.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return dbResult
+    def save(self, dbObject, children=True):
+        """Queues save of DbObject and its children."""
+
+        try:
+
+            dbObject.transaction = self
+
+            dbObject.save(
+                children=children
+            )
+
+        except Exception as e:
+
+            self.db.log(
+                self.db.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return
+    def delete(self, dbObject, match=None, children=True):
+        """Queues delete of DbObject, or of DbObject(s) of type dbObject matching match."""
+
+        try:
+
+            dbObjects = [dbObject]
+
+            if isinstance(dbObject, str):
+
+                dbObjects = []
+
+                if not match is None:
+
+                    info = [
+                        info
+                        for info in self.db.dbObjectInfo
+                        if info['type'] == dbObject
+                    ][0]
+
+                    # Only what the delete and its file cleanup need, children go by cascade
+                    dbResults = self.db.get(
+                        dbObjectType=dbObject,
+                        match=match,
+                        projection={
+                            'columns': list(info['compiled']['delete_columns'])
+                        }
+                    )
+
+                    if not dbResults is None:
+
+                        dbObjects = dbResults if isinstance(dbResults, list) else [dbResults]
+
+
+            for dbResult in dbObjects:
+
+                dbResult.transaction = self
+
+                dbResult.delete(
+                    children=children
+                )
 
         except Exception as e:
 
-            self.log(
-                self.logFileKey,
+            self.db.log(
+                self.db.logFileKey,
                 '.'.join(
                     [
                         str(self.__class__.__name__),
@@ -2527,37 +4099,89 @@ class DB:
             )
 
 
-        return result
-    def getPasswordRegex(self):
-        """Gets password regex based on current password settings."""
+        return
+    def queue(self, query, queryValues, dbObject=None):
+        """Adds statement, keeping object state to restore if commit fails, raw statements without object."""
 
-        passwordRegex = r''
+        states = []
+
+        if not dbObject is None:
+
+            states.append(
+                {
+                    'object': dbObject,
+                    'exists': dbObject.exists,
+                    'working': getattr(dbObject, 'working', {}),
+                    'raw': getattr(dbObject, 'raw', {}),
+                    'stored': getattr(dbObject, 'stored', {})
+                }
+            )
+
+        if len(self.operations) > 0 and self.operations[-1]['query'] == query:
+
+            self.operations[-1]['values'].append(queryValues)
+            self.operations[-1]['states'].extend(states)
+
+        else:
+
+            self.operations.append(
+                {
+                    'query': query,
+                    'values': [queryValues],
+                    'states': states
+                }
+            )
+
+
+        return
+
+
+    def commit(self):
+        """Runs queued statements in one transaction, then removes files of deleted objects."""
+
+        committed = False
+
+        dbConnection = None
+        dbCursor = None
 
         try:
 
-            passwordSettings = self.settings.get('password')
+            dbConnection = self.db.getConnection()
+            dbCursor = dbConnection.cursor()
 
 
-            passwordRegexOptions = {
-                'template': r'^%(upper)s%(lower)s%(number)s%(special)s.{%(length)i,}$',
-                'upper': r'(?=.*?[A-Z])', 
-                'lower': r'(?=.*?[a-z])',
-                'number': r'(?=.*?[0-9])',
-                'special': r'(?=.*?[^A-Za-z0-9])'
-            }
+            for operation in self.operations:
 
-            passwordRegex = passwordRegexOptions['template'] % {
-                'upper': passwordRegexOptions['upper'] if passwordSettings['upper'] == True else r'',
-                'lower': passwordRegexOptions['lower'] if passwordSettings['lower'] == True else r'',
-                'number': passwordRegexOptions['number'] if passwordSettings['number'] == True else r'',
-                'special': passwordRegexOptions['special'] if passwordSettings['special'] == True else r'',
-                'length': passwordSettings['length']
-            }
+                dbCursor.executemany(
+                    operation['query'],
+                    operation['values']
+                )
+
+
+            dbConnection.commit()
+
+            committed = True
+
+
+            for filePath in self.files:
+
+                try:
+
+                    if os.path.isfile(filePath):
+
+                        os.remove(filePath)
+
+                except: pass
 
         except Exception as e:
 
-            self.log(
-                self.logFileKey,
+            if not dbConnection is None: dbConnection.rollback()
+
+            # Objects go back to how they were before they were queued
+            self.rollback()
+
+            self.db.log(
+                self.db.logFileKey,
                 '.'.join(
                     [
                         str(self.__class__.__name__),
@@ -2568,38 +4192,38 @@ class DB:
             )
 
 
-        return passwordRegex
+        for operation in self.operations:
 
+            for state in operation['states']:
 
-    def log(self, logFileKey, source, status):
-        """Write log."""
+                state['object'].transaction = None
 
-        try:
+        self.operations = []
+        self.files = []
 
-            with open(self.paths[logFileKey]['path'], 'a', encoding='utf-8') as f:
+        if not dbCursor is None: dbCursor.close()
+        if not dbConnection is None: self.db.releaseConnection(dbConnection)
 
-                f.write(
-                    '%s | %s : %s\n' % (
-                        str(datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S.%f'))[0:-3],
-                        source,
-                        status.replace('\r', '').replace('\n', '\\n')
-                    )
-                )
 
-        except:
+        return committed
+    def rollback(self):
+        """Discards queued statements, restoring queued objects."""
 
-            print(
-                'Could not open',
-                logFileKey,
-                source,
-                status
-            )
+        for operation in reversed(self.operations):
 
+            for state in reversed(operation['states']):
 
-        return
+                state['object'].exists = state['exists']
+                state['object'].working = state['working']
+                state['object'].raw = state['raw']
+                state['object'].stored = state['stored']
+                state['object'].transaction = None
 
+        self.operations = []
+        self.files = []
 
-class DbValueException(Exception): pass
+
+        return
 
 
 class DbObjectBase:
@@ -2609,14 +4233,70 @@ class DbObjectBase:
         self.db = db
         self.info = info
         self.exists = False
+        self.partial = False
+        self.transaction = None
 
 
         return
 
 
 class DbObjectConfig(DbObjectBase):
+
+
+    # Shared by every instance on the same database file, like the connection pool
+    caches = {}
+    cacheLock = threading.Lock()
+
+
+    def __init__(self, db, info):
+        """Initialize."""
+
+        super().__init__(db, info)
+
+        with DbObjectConfig.cacheLock:
+
+            # Values pickled by key, pickle.loads is cheaper than json.loads and hands out a copy
+            self.cache = DbObjectConfig.caches.setdefault(
+                (
+                    self.db.paths['db']['path'],
+                    self.info['table']
+                ),
+                {
+                    'values': {},
+                    'generation': 0,
+                    'versions': threading.local()
+                }
+            )
+
+
+        return
+
+
+    def getCacheVersion(self, dbConnection, dbCursor):
+        """Gets data_version, clearing cache when another connection or process has committed since this connection last looked."""
+
+        dbCursor.execute(
+            'PRAGMA data_version;'
+        )
+
+        dataVersion = dbCursor.fetchone()[0]
+
+        versions = self.cache['versions']
+
+        if not getattr(versions, 'connection', None) is dbConnection or not getattr(versions, 'version', None) == dataVersion:
+
+            with DbObjectConfig.cacheLock:
+
+                self.cache['values'].clear()
+                self.cache['generation'] += 1
+
+            versions.connection = dbConnection
+            versions.version = dataVersion
+
+
+        return dataVersion
     def get(self, key):
-        """Get single value."""
+        """Get single value, from cache while no other connection has written."""
 
         setting = None
 
@@ -2624,34 +4304,59 @@ class DbObjectConfig(DbObjectBase):
 
             if key in [column['key'] for column in self.info['columns']]:
 
-                dbConnection = sqlite3.connect(
-                    self.db.paths['db']['path'],
-                    check_same_thread=False
-                )
+                dbConnection = self.db.getConnection()
                 dbCursor = dbConnection.cursor()
 
 
-                dbCursor.execute(
-                    'SELECT %(column)s FROM %(table)s WHERE id = 0;' % {
-                        'table': self.info['table'],
-                        'column': key
-                    }
+                self.getCacheVersion(
+                    dbConnection,
+                    dbCursor
                 )
 
+                with DbObjectConfig.cacheLock:
 
-                blobResult = dbCursor.fetchone()
+                    cachedSetting = self.cache['values'].get(key, None)
+                    cacheGeneration = self.cache['generation']
 
-                if not blobResult is None:
+                if not cachedSetting is None:
 
-                    if len(blobResult) > 0:
+                    setting = pickle.loads(
+                        cachedSetting
+                    )
 
-                        setting = json.loads(
-                            blobResult[0].decode('utf-8')
-                        )
+                else:
+
+                    dbCursor.execute(
+                        'SELECT %(column)s FROM %(table)s WHERE id = 0;' % {
+                            'table': self.info['table'],
+                            'column': key
+                        }
+                    )
+
+
+                    blobResult = dbCursor.fetchone()
+
+                    if not blobResult is None:
+
+                        if len(blobResult) > 0:
+
+                            setting = json.loads(
+                                blobResult[0].decode('utf-8')
+                            )
+
+                            with DbObjectConfig.cacheLock:
+
+                                # Skipped when a write or clear landed while reading
+                                if self.cache['generation'] == cacheGeneration:
+
+                                    self.cache['values'][key] = pickle.dumps(
+                                        setting,
+                                        protocol=pickle.HIGHEST_PROTOCOL
+                                    )
 
 
                 if not dbCursor is None: dbCursor.close()
-                if not dbConnection is None: dbConnection.close()
+                if not dbConnection is None: self.db.releaseConnection(dbConnection)
 
             else:
 
@@ -2673,19 +4378,26 @@ class DbObjectConfig(DbObjectBase):
 
         return setting
     def set(self, key, value):
-        """Sets single value."""
+        """Sets single value, written through to cache."""
 
         try:
 
             if key in [column['key'] for column in self.info['columns']]:
 
-                dbConnection = sqlite3.connect(
-                    self.db.paths['db']['path'],
-                    check_same_thread=False
-                )
+                dbConnection = self.db.getConnection()
                 dbCursor = dbConnection.cursor()
 
 
+                # Catch up first, so an older write from elsewhere is not masked by this one
+                self.getCacheVersion(
+                    dbConnection,
+                    dbCursor
+                )
+
+                settingJson = json.dumps(
+                    value
+                )
+
                 dbCursor.execute(
                     'UPDATE %(table)s SET %(column)s = ? WHERE id = 0;' % {
                         'table': self.info['table'],
@@ -2693,9 +4405,7 @@ class DbObjectConfig(DbObjectBase):
                     },
                     (
                         bytes(
-                            json.dumps(
-                                value
-                            ),
+                            settingJson,
                             'utf-8'
                         ),
                     )
@@ -2704,9 +4414,22 @@ class DbObjectConfig(DbObjectBase):
 
                 dbConnection.commit()
 
+                # Own commits leave this connection's data_version unchanged, other connections see it move
+                with DbObjectConfig.cacheLock:
+
+                    self.cache['generation'] += 1
+
+                    # Cached as read back, so tuples and int keys match a fresh load
+                    self.cache['values'][key] = pickle.dumps(
+                        json.loads(
+                            settingJson
+                        ),
+                        protocol=pickle.HIGHEST_PROTOCOL
+                    )
+
 
                 if not dbCursor is None: dbCursor.close()
-                if not dbConnection is None: dbConnection.close()
+                if not dbConnection is None: self.db.releaseConnection(dbConnection)
 
             else:
 
@@ -2739,9 +4462,29 @@ class DbSettings(DbObjectConfig):
 
             images = self.db.get(
                 dbObjectType='image',
-                match=None
+                match=None,
+                projection={
+                    'columns': ['id'],
+                    'children': {
+                        'tags': {
+                            'columns': ['category_id', 'subcategory_id'],
+                            'children': {
+                                'category': {
+                                    'columns': ['id', 'name']
+                                },
+                                'subcategory': {
+                                    'columns': ['id', 'name']
+                                }
+                            }
+                        }
+                    }
+                }
             )
 
+            if isinstance(images, DbImage):
+
+                images = [images]
+
             filteredImageIds = []
 
             if isinstance(images, list):
@@ -2912,28 +4655,38 @@ class DbObjectStandard(DbObjectBase):
 
             if isinstance(objectValues, dict):
 
-                for column in sorted(self.info['columns'], key=lambda c: c['index']):
+                compiled = self.info['compiled']
 
-                    validated = None
+                if fromDb == True:
 
-                    if column['key'] in objectValues.keys():
+                    # Projected rows carry only some columns and relations, never saved back
+                    self.partial = not all(
+                        [
+                            key in objectValues.keys()
+                            for key in compiled['column_keys'] + compiled['child_keys']
+                        ]
+                    )
 
-                        validated = self.validate(
-                            objectValues[column['key']],
-                            column['data_info'],
-                            fromDb=fromDb
-                        )
+                    for key, loader, dataInfo in compiled['loaders']:
 
-                    else:
+                        if key in objectValues.keys():
+
+                            self.raw[key], self.working[key] = loader(
+                                self,
+                                objectValues[key],
+                                dataInfo
+                            )
+
+                else:
+
+                    for column in compiled['columns']:
 
                         validated = self.validate(
-                            None,
+                            objectValues[column['key']] if column['key'] in objectValues.keys() else None,
                             column['data_info'],
                             fromDb=fromDb
                         )
 
-                    if not validated is None:
-
                         if validated['valid'] == True:
 
                             self.working[column['key']] = validated['working']
@@ -2943,10 +4696,6 @@ class DbObjectStandard(DbObjectBase):
 
                             raise DbValueException('Validation error.')
 
-                    else:
-
-                        raise DbValueException('Validation error.')
-
 
                 for child in self.info['children']:
 
@@ -2954,7 +4703,7 @@ class DbObjectStandard(DbObjectBase):
 
                         self.working[child['key']] = objectValues[child['key']]
 
-                    else:
+                    elif fromDb == False:
 
                         if child['relationship'] in ['one_to_many', 'many_to_many']:
 
@@ -2994,10 +4743,15 @@ class DbObjectStandard(DbObjectBase):
 
         return
     def save(self, children=True, parentConnection=None, parentCursor=None):
-        """Saves object to DB."""
+        """Saves object to DB, with children on the same connection and one commit, or queued on its transaction."""
 
         try:
 
+            if self.partial == True:
+
+                raise DbValueException('Partial object.')
+
+
             workingValidation = [
                 {
                     'key': column['key'],
@@ -3007,7 +4761,7 @@ class DbObjectStandard(DbObjectBase):
                         fromDb=False
                     )
                 }
-                for column in sorted(self.info['columns'], key=lambda c: c['index'])
+                for column in self.info['compiled']['columns']
             ]
 
             if all([validation['result']['valid'] for validation in workingValidation]) == True:
@@ -3033,152 +4787,106 @@ class DbObjectStandard(DbObjectBase):
                 )
 
 
-                if children == True:
-
-                    for childKey in [child['key'] for child in self.info['children'] if child['modify_first'] == True]:
-
-                        if childKey in self.working.keys():
+                dbConnection = None
+                dbCursor = None
 
-                            if not self.working[childKey] is None:
+                if self.transaction is None:
 
-                                if isinstance(self.working[childKey], list):
+                    if (not parentConnection is None) and (not parentCursor is None):
 
-                                    for child in self.working[childKey]:
+                        dbConnection = parentConnection
+                        dbCursor = parentCursor
 
-                                        child.save(
-                                            children=children,
-                                            parentConnection=parentConnection,
-                                            parentCursor=parentCursor
-                                        )
+                    else:
 
-                                else:
+                        dbConnection = self.db.getConnection()
+                        dbCursor = dbConnection.cursor()
 
-                                    self.working[childKey].save(
-                                        children=children,
-                                        parentConnection=parentConnection,
-                                        parentCursor=parentCursor
-                                    )
 
+                if children == True:
 
-                dbConnection = None
-                dbCursor = None
+                    for childObject in self.getChildObjects(modifyFirst=True):
 
-                if (not parentConnection is None) and (not parentCursor is None):
+                        childObject.transaction = self.transaction
 
-                    dbConnection = parentConnection
-                    dbCursor = parentCursor
+                        childObject.save(
+                            children=children,
+                            parentConnection=dbConnection,
+                            parentCursor=dbCursor
+                        )
 
-                else:
 
-                    dbConnection = sqlite3.connect(
-                        self.db.paths['db']['path'],
-                        check_same_thread=False
-                    )
-                    dbCursor = dbConnection.cursor()
+                query = None
+                queryValues = None
 
+                compiled = self.info['compiled']
 
                 if self.exists == True:
 
-                    matchKeys = [
-                        column['key']
-                        for column in self.info['columns']
-                        if column['data_info']['primary_key'] == True
-                    ]
+                    if not compiled['update'] is None:
 
-                    if len(matchKeys) > 0:
+                        query = compiled['update']
 
-                        dbCursor.execute(
-                            'UPDATE %(table)s SET %(column_value)s WHERE %(match)s;' % {
-                                'table': self.info['table'],
-                                'column_value': ', '.join(
-                                    [
-                                        column['key'] + ' = ?'
-                                        for column in sorted(self.info['columns'], key=lambda c: c['index'])
-                                        if not column['key'] in matchKeys
-                                    ]
-                                ),
-                                'match': ', '.join(
-                                    [
-                                        '%(key)s = %(value)s' % {
-                                            'key': matchKey,
-                                            'value': (
-                                                '\'%s\'' % (self.raw[matchKey], )
-                                            ) if isinstance(self.raw[matchKey], str) else self.raw[matchKey]
-                                        }
-                                        for matchKey in matchKeys
-                                    ]
-                                )
-                            },
-                            tuple(
-                                [
-                                    self.raw[column['key']]
-                                    for column in sorted(self.info['columns'], key=lambda c: c['index'])
-                                    if not column['key'] in matchKeys
-                                ]
-                            )
+                        queryValues = tuple(
+                            [
+                                self.raw[key]
+                                for key in compiled['column_keys']
+                                if not key in compiled['primary_keys']
+                            ] + [
+                                self.raw[key]
+                                for key in compiled['primary_keys']
+                            ]
                         )
 
                 else:
 
-                    dbCursor.execute(
-                        'INSERT OR REPLACE INTO %(table)s (%(columns)s) VALUES (%(values)s);' % {
-                            'table': self.info['table'],
-                            'columns': ', '.join(
-                                [
-                                    column['key']
-                                    for column in sorted(self.info['columns'], key=lambda c: c['index'])
-                                ]
-                            ),
-                            'values': ', '.join(
-                                [
-                                    '?'
-                                    for column in self.info['columns']
-                                ]
-                            )
-                        },
-                        tuple(
-                            [
-                                self.raw[column['key']]
-                                for column in sorted(self.info['columns'], key=lambda c: c['index'])
-                            ]
-                        )
+                    query = compiled['insert']
+
+                    queryValues = tuple(
+                        [
+                            self.raw[key]
+                            for key in compiled['column_keys']
+                        ]
                     )
 
 
-                dbConnection.commit()
+                if not query is None:
 
+                    if self.transaction is None:
 
-                if children == True:
+                        dbCursor.execute(
+                            query,
+                            queryValues
+                        )
 
-                    for childKey in [child['key'] for child in self.info['children'] if child['modify_first'] == False]:
+                    else:
 
-                        if childKey in self.working.keys():
+                        self.transaction.queue(
+                            query,
+                            queryValues,
+                            self
+                        )
 
-                            if not self.working[childKey] is None:
 
-                                if isinstance(self.working[childKey], list):
+                if children == True:
 
-                                    for child in self.working[childKey]:
+                    for childObject in self.getChildObjects(modifyFirst=False):
 
-                                        child.save(
-                                            children=children,
-                                            parentConnection=parentConnection,
-                                            parentCursor=parentCursor
-                                        )
+                        childObject.transaction = self.transaction
 
-                                else:
+                        childObject.save(
+                            children=children,
+                            parentConnection=dbConnection,
+                            parentCursor=dbCursor
+                        )
 
-                                    self.working[childKey].save(
-                                        children=children,
-                                        parentConnection=parentConnection,
-                                        parentCursor=parentCursor
-                                    )
 
+                if self.transaction is None and (parentConnection is None or parentCursor is None):
 
-                if (not parentConnection is None) and (not parentCursor is None):
+                    dbConnection.commit()
 
                     if not dbCursor is None: dbCursor.close()
-                    if not dbConnection is None: dbConnection.close()
+                    if not dbConnection is None: self.db.releaseConnection(dbConnection)
 
 
                 self.exists = True
@@ -3204,115 +4912,112 @@ class DbObjectStandard(DbObjectBase):
 
         return
     def delete(self, children=True, parentConnection=None, parentCursor=None):
-        """Deletes object from DB."""
+        """Deletes object from DB by its match keys, foreign keys cascading to children, queued on its transaction or committed alone."""
 
         try:
 
-            if self.exists == True:
-
-                if children == True:
-
-                    for childKey in [child['key'] for child in self.info['children'] if child['modify_first'] == True]:
-
-                        if childKey in self.working.keys():
-
-                            if not self.working[childKey] is None:
-
-                                if isinstance(self.working[childKey], list):
+            compiled = self.info['compiled']
 
-                                    for child in self.working[childKey]:
+            if self.exists == True:
 
-                                        child.delete(
-                                            children=children,
-                                            parentConnection=parentConnection,
-                                            parentCursor=parentCursor
-                                        )
+                if not all([key in self.stored.keys() for key in compiled['match_keys']]):
 
-                                else:
+                    raise DbValueException('Partial object.')
 
-                                    self.working[childKey].delete(
-                                        children=children,
-                                        parentConnection=parentConnection,
-                                        parentCursor=parentCursor
-                                    )
 
+                if self.transaction is None:
 
-                dbConnection = None
-                dbCursor = None
+                    # Own transaction, so files go only once the row is gone
+                    dbTransaction = self.db.transaction()
 
-                if (not parentConnection is None) and (not parentCursor is None):
+                    dbTransaction.delete(
+                        self,
+                        children=children
+                    )
 
-                    dbConnection = parentConnection
-                    dbCursor = parentCursor
+                    dbTransaction.commit()
 
                 else:
 
-                    dbConnection = sqlite3.connect(
-                        self.db.paths['db']['path'],
-                        check_same_thread=False
+                    self.transaction.files.extend(
+                        self.getFiles()
                     )
-                    dbCursor = dbConnection.cursor()
 
-
-                dbCursor.execute(
-                    'DELETE FROM %(table)s WHERE %(match)s' % {
-                        'table': self.info['table'],
-                        'match': ' AND '.join(
+                    self.transaction.queue(
+                        compiled['delete'],
+                        tuple(
                             [
-                                '%(key)s = %(value)s' % {
-                                    'key': key,
-                                    'value': 'NULL' if self.stored[key] is None else (
-                                        '\'%s\'' % (self.stored[key], ) if isinstance(self.stored[key], str) else str(self.stored[key])
-                                    )
-                                }
-                                for key in self.stored.keys()
-                                if key in [column['key'] for column in self.info['columns']]
+                                self.stored[key]
+                                for key in compiled['match_keys']
                             ]
-                        )
-                    }
-                )
-
+                        ),
+                        self
+                    )
 
-                dbConnection.commit()
+                    self.exists = False
+                    self.working = {}
+                    self.raw = {}
+                    self.stored = {}
 
+        except Exception as e:
 
-                if children == True:
+            self.db.log(
+                self.db.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
 
-                    for childKey in [child['key'] for child in self.info['children'] if child['modify_first'] == False]:
 
-                        if childKey in self.working.keys():
+        return
+    def getFiles(self):
+        """Gets files of child rows the delete cascades to."""
 
-                            if not self.working[childKey] is None:
+        files = []
 
-                                if isinstance(self.working[childKey], list):
+        try:
 
-                                    for child in self.working[childKey]:
+            for child in self.info['children']:
 
-                                        child.delete(
-                                            children=children,
-                                            parentConnection=parentConnection,
-                                            parentCursor=parentCursor
-                                        )
+                childInfo = [
+                    info
+                    for info in self.db.dbObjectInfo
+                    if info['type'] == child['type']
+                ][0]
 
-                                else:
+                if len(childInfo['compiled']['file_keys']) > 0 and child['local_key'] in self.stored.keys():
 
-                                    self.working[childKey].delete(
-                                        children=children,
-                                        parentConnection=parentConnection,
-                                        parentCursor=parentCursor
-                                    )
+                    dbConnection = self.db.getConnection()
+                    dbCursor = dbConnection.cursor()
 
 
-                if (not parentConnection is None) and (not parentCursor is None):
+                    dbCursor.execute(
+                        'SELECT %(columns)s FROM %(table)s WHERE %(foreign_key)s = ?;' % {
+                            'columns': ', '.join(childInfo['compiled']['file_keys']),
+                            'table': childInfo['table'],
+                            'foreign_key': child['foreign_key']
+                        },
+                        (
+                            self.stored[child['local_key']],
+                        )
+                    )
 
-                    if not dbCursor is None: dbCursor.close()
-                    if not dbConnection is None: dbConnection.close()
+                    files.extend(
+                        [
+                            filePath
+                            for queryValue in dbCursor.fetchall()
+                            for filePath in queryValue
+                            if not filePath is None
+                        ]
+                    )
 
 
-                self.exists = False
-                self.working = {}
-                self.raw = {}
-                self.stored = {}
+                    if not dbCursor is None: dbCursor.close()
+                    if not dbConnection is None: self.db.releaseConnection(dbConnection)
 
         except Exception as e:
 
@@ -3328,7 +5033,32 @@ class DbObjectStandard(DbObjectBase):
             )
 
 
-        return
+        return files
+    def getChildObjects(self, modifyFirst=False):
+        """Gets loaded child objects, those modified before or after this object."""
+
+        childObjects = []
+
+        for childKey in [child['key'] for child in self.info['children'] if child['modify_first'] == modifyFirst]:
+
+            if childKey in self.working.keys():
+
+                if not self.working[childKey] is None:
+
+                    if isinstance(self.working[childKey], list):
+
+                        childObjects.extend(
+                            self.working[childKey]
+                        )
+
+                    else:
+
+                        childObjects.append(
+                            self.working[childKey]
+                        )
+
+
+        return childObjects
 
     def validate(self, value, dataInfo, fromDb=True):
         """Validates and converts value."""
@@ -3376,6 +5106,12 @@ class DbObjectStandard(DbObjectBase):
 
                                 raise DbValueException('Invalid data type.')
 
+                    else:
+
+                        validation['valid'] = True
+                        validation['raw'] = value
+                        validation['working'] = value
+
                 else:
 
                     if fromDb == True:
@@ -3440,7 +5176,9 @@ class DbObjectStandard(DbObjectBase):
 
                     else:
 
-                        raise DbValueException('Invalid data type.')
+                        validation['valid'] = True
+                        validation['raw'] = value
+                        validation['working'] = value
 
                 else:
 
@@ -3565,7 +5303,8 @@ class DbObjectStandard(DbObjectBase):
                     )
 
 
-            if validation['valid'] == True and dataInfo['unique'] == True and dataInfo['unique_generator'] is None:
+            # Rows read back already satisfy the table's UNIQUE constraints
+            if validation['valid'] == True and dataInfo['unique'] == True and dataInfo['unique_generator'] is None and fromDb == False:
 
                 if not validation['raw'] is None:
 
@@ -3599,6 +5338,84 @@ class DbObjectStandard(DbObjectBase):
 
 
         return validation
+    def loadValidated(self, value, dataInfo):
+        """Loads column read back through validate, for passwords and nulls."""
+
+        validation = self.validate(
+            value,
+            dataInfo,
+            fromDb=True
+        )
+
+        if validation['valid'] == False:
+
+            raise DbValueException('Validation error.')
+
+
+        return validation['raw'], validation['working']
+    def loadInteger(self, value, dataInfo):
+        """Loads INTEGER column read back."""
+
+        if not isinstance(value, int):
+
+            return self.loadValidated(value, dataInfo)
+
+
+        return value, value
+    def loadBoolean(self, value, dataInfo):
+        """Loads boolean INTEGER column read back."""
+
+        if not isinstance(value, int):
+
+            return self.loadValidated(value, dataInfo)
+
+
+        return value, value == 1
+    def loadText(self, value, dataInfo):
+        """Loads TEXT column read back."""
+
+        if not isinstance(value, str):
+
+            return self.loadValidated(value, dataInfo)
+
+
+        return value, value
+    def loadJsonText(self, value, dataInfo):
+        """Loads JSON TEXT column read back."""
+
+        if not isinstance(value, str):
+
+            return self.loadValidated(value, dataInfo)
+
+
+        return value, json.loads(value)
+    def loadNumber(self, value, dataInfo):
+        """Loads NUMERIC or REAL column read back."""
+
+        if not isinstance(value, int | float):
+
+            return self.loadValidated(value, dataInfo)
+
+
+        return value, value
+    def loadBlob(self, value, dataInfo):
+        """Loads BLOB column read back."""
+
+        if not isinstance(value, bytes):
+
+            return self.loadValidated(value, dataInfo)
+
+
+        return value, value.decode('utf-8')
+    def loadJsonBlob(self, value, dataInfo):
+        """Loads JSON BLOB column read back."""
+
+        if not isinstance(value, bytes):
+
+            return self.loadValidated(value, dataInfo)
+
+
+        return value, json.loads(value.decode('utf-8'))
     def validateUnique(self, table, key, value):
         """Checks if non-null value is unique."""
 
@@ -3606,10 +5423,7 @@ class DbObjectStandard(DbObjectBase):
 
         try:
 
-            dbConnection = sqlite3.connect(
-                self.db.paths['db']['path'],
-                check_same_thread=False
-            )
+            dbConnection = self.db.getConnection()
             dbCursor = dbConnection.cursor()
 
 
@@ -3643,7 +5457,7 @@ class DbObjectStandard(DbObjectBase):
 
 
             if not dbCursor is None: dbCursor.close()
-            if not dbConnection is None: dbConnection.close()
+            if not dbConnection is None: self.db.releaseConnection(dbConnection)
 
         except Exception as e:
 
@@ -3699,38 +5513,15 @@ class DbObjectStandard(DbObjectBase):
 
         try:
 
-            dbConnection = sqlite3.connect(
-                self.db.paths['db']['path'],
-                check_same_thread=False
-            )
-            dbCursor = dbConnection.cursor()
-
-
-            dbCursor.execute(
-                'SELECT %(key)s FROM %(table)s;' % {
-                    'key': str(key),
-                    'table': str(table)
-                }
+            uniqueInts = self.db.reserveUniqueInts(
+                key,
+                table,
+                count=1
             )
 
+            if not uniqueInts is None:
 
-            activeInts = [
-                queryValue[0]
-                for queryValue in dbCursor.fetchall()
-            ]
-
-
-            if not dbCursor is None: dbCursor.close()
-            if not dbConnection is None: dbConnection.close()
-
-
-            for i in range(sys.maxsize):
-
-                if not i in activeInts:
-
-                    uniqueInt = i
-
-                    break
+                uniqueInt = uniqueInts[0]
 
         except Exception as e:
 
@@ -3771,21 +5562,21 @@ class DbObjectStandard(DbObjectBase):
                 apiTemp = dict(
                     [
                         (
-                            column['key'],
-                            self.working[column['key']]
+                            key,
+                            self.working[key]
                         )
-                        for column in sorted(self.info['columns'], key=lambda c: c['index'])
-                        if column['key'] in self.working.keys() and column['data_info']['api'] == True
+                        for key in self.info['compiled']['api_keys']
+                        if key in self.working.keys()
                     ]
                 )
 
-                for column in sorted(self.info['columns'], key=lambda c: c['index']):
+                for key in self.info['compiled']['date_keys']:
 
-                    if column['key'] in apiTemp.keys() and column['data_info']['date'] == True:
+                    if key in apiTemp.keys():
 
-                        if isinstance(apiTemp[column['key']], int | float):
+                        if isinstance(apiTemp[key], int | float):
 
-                            apiTemp[column['key'] + '_date_formatted'] = str(datetime.datetime.fromtimestamp(apiTemp[column['key']]).strftime('%Y/%m/%d %H:%M:%S.%f'))[0:-3]
+                            apiTemp[key + '_date_formatted'] = str(datetime.datetime.fromtimestamp(apiTemp[key]).strftime('%Y/%m/%d %H:%M:%S.%f'))[0:-3]
 
                 for child in self.info['children']:
 
@@ -3871,28 +5662,9 @@ class DbToken(DbObjectStandard):
             tokenSettings = self.db.settings.get('token')
 
 
-            dbConnection = sqlite3.connect(
-                self.db.paths['db']['path'],
-                check_same_thread=False
-            )
+            dbConnection = self.db.getConnection()
             dbCursor = dbConnection.cursor()
 
-            dbCursor.execute(
-                'SELECT %(key)s FROM %(table)s;' % {
-                    'key': str(key),
-                    'table': str(table)
-                }
-            )
-
-            activeTokens = [
-                queryValue[0]
-                for queryValue in dbCursor.fetchall()
-            ]
-
-
-            if not dbCursor is None: dbCursor.close()
-            if not dbConnection is None: dbConnection.close()
-
 
             for i in range(sys.maxsize):
 
@@ -3905,12 +5677,27 @@ class DbToken(DbObjectStandard):
                     ]
                 )
 
-                if not testToken in activeTokens:
+                # Probes the unique index instead of loading every token
+                dbCursor.execute(
+                    'SELECT 1 FROM %(table)s WHERE %(key)s = ? LIMIT 1;' % {
+                        'key': str(key),
+                        'table': str(table)
+                    },
+                    (
+                        testToken,
+                    )
+                )
+
+                if dbCursor.fetchone() is None:
 
                     uniqueToken = testToken
 
                     break
 
+
+            if not dbCursor is None: dbCursor.close()
+            if not dbConnection is None: self.db.releaseConnection(dbConnection)
+
         except Exception as e:
 
             self.db.log(
@@ -3929,38 +5716,17 @@ class DbToken(DbObjectStandard):
 
 
 class DbObjectFile(DbObjectStandard):
-    def delete(self, children=True, parentConnection=None, parentCursor=None):
-        """Deletes file."""
-
-        try:
-
-            if self.exists == True:
-
-                if hasattr(self, 'working'):
-
-                    if 'path' in self.working.keys():
-
-                        if os.path.exists(self.working['path']):
-
-                            if os.path.isfile(self.working['path']):
-
-                                os.remove(self.working['path'])
+    def getFiles(self):
+        """Overload to add own files."""
 
-        except Exception as e:
-
-            self.db.log(
-                self.db.logFileKey,
-                '.'.join(
-                    [
-                        str(self.__class__.__name__),
-                        str(sys._getframe().f_code.co_name)
-                    ]
-                ),
-                str(e)
-            )
+        files = [
+            self.stored[fileKey]
+            for fileKey in self.info['compiled']['file_keys']
+            if fileKey in self.stored.keys() and not self.stored[fileKey] is None
+        ]
 
 
-        return super(DbObjectFile, self).delete(children, parentConnection, parentCursor)
+        return files + super(DbObjectFile, self).getFiles()
 
 class DbImage(DbObjectFile):
     def new(self, objectValues, fromDb=True):
@@ -4091,7 +5857,55 @@ class DbImage(DbObjectFile):
 
 
         return isAvailable
-class DbQuantization(DbObjectFile): pass
+class DbQuantization(DbObjectFile):
+    def touch(self):
+        """Marks quantization as used, for least recently used eviction."""
+
+        try:
+
+            if self.exists == True:
+
+                timestamp = self.generateTimestamp()
+
+                dbConnection = self.db.getConnection()
+                dbCursor = dbConnection.cursor()
+
+                # No primary key, path is unique
+                dbCursor.execute(
+                    'UPDATE %(table)s SET used = ? WHERE path = ?;' % {
+                        'table': self.info['table']
+                    },
+                    (
+                        timestamp,
+                        self.raw['path']
+                    )
+                )
+
+                dbConnection.commit()
+
+                if not dbCursor is None: dbCursor.close()
+                if not dbConnection is None: self.db.releaseConnection(dbConnection)
+
+
+                self.working['used'] = timestamp
+                self.raw['used'] = timestamp
+                self.stored['used'] = timestamp
+
+        except Exception as e:
+
+            self.db.log(
+                self.db.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return
 class DbThumbnail(DbObjectFile): pass
 
 
@@ -4099,20 +5913,28 @@ class DbCategory(DbObjectStandard): pass
 class DbSubcategory(DbObjectStandard): pass
 class DbTag(DbObjectStandard):
     def new(self, objectValues, fromDb=True):
-        """Adds referenced objects."""
+        """Adds referenced objects, loaded by DB.get or fetched here for new tags."""
 
         super(DbTag, self).new(objectValues, fromDb)
 
         try:
 
-            for referenceKey in ['category', 'subcategory']:
+            for reference in self.info['references']:
 
-                self.working[referenceKey] = self.db.get(
-                    dbObjectType=referenceKey,
-                    match={
-                        'id': self.working[referenceKey + '_id']
-                    }
-                )
+                if fromDb == True:
+
+                    if reference['key'] in objectValues.keys():
+
+                        self.working[reference['key']] = objectValues[reference['key']]
+
+                else:
+
+                    self.working[reference['key']] = self.db.get(
+                        dbObjectType=reference['type'],
+                        match={
+                            reference['foreign_key']: self.working[reference['local_key']]
+                        }
+                    )
 
         except Exception as e:
 
@@ -4174,3 +5996,58 @@ class DbTag(DbObjectStandard):
 
 class DbInfo(DbObjectStandard): pass
 class DbTask(DbObjectStandard): pass
+class DbJob(DbObjectStandard):
+    def claim(self):
+        """Moves pending job to running, false when another worker got it first."""
+
+        claimed = False
+
+        try:
+
+            if self.exists == True:
+
+                timestamp = self.generateTimestamp()
+
+                dbConnection = self.db.getConnection()
+                dbCursor = dbConnection.cursor()
+
+                dbCursor.execute(
+                    'UPDATE %(table)s SET status = \'running\', started = ? WHERE id = ? AND status = \'pending\';' % {
+                        'table': self.info['table']
+                    },
+                    (
+                        timestamp,
+                        self.raw['id']
+                    )
+                )
+
+                claimed = dbCursor.rowcount == 1
+
+                dbConnection.commit()
+
+                if not dbCursor is None: dbCursor.close()
+                if not dbConnection is None: self.db.releaseConnection(dbConnection)
+
+
+                if claimed == True:
+
+                    for values in [self.working, self.raw, self.stored]:
+
+                        values['status'] = 'running'
+                        values['started'] = timestamp
+
+        except Exception as e:
+
+            self.db.log(
+                self.db.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return claimed
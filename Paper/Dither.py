@@ -0,0 +1,457 @@
+#  Copyright (c) 2024, Alexander Austin
+#  All rights reserved.
+#
+#  This source code is licensed under the BSD-style license found in the
+#  LICENSE file in the root directory of this source tree.
+
+
+#!/usr/bin/python3.12
+# -*- coding: utf-8 -*-
+
+
+import datetime, os, sys
+import numpy
+from PIL import Image
+
+
+class Dither:
+
+
+    defaults = {
+        'algorithm': 'pillow',
+        'spread': 128.0
+    }
+
+    # Lookup cube cells per channel, 64 ** 3 palette indices
+    lookupLevels = 64
+
+    algorithms = {
+        'pillow': 'ditherPillow',
+        'none': 'ditherNearest',
+        'ordered': 'ditherOrdered',
+        'floyd_steinberg': 'ditherDiffusion',
+        'atkinson': 'ditherDiffusion',
+        'lab': 'ditherNearest'
+    }
+
+    # (dx, dy, weight) error offsets, every offset behind x + 2y so waves stay independent
+    kernels = {
+        'floyd_steinberg': [
+            (1, 0, 7.0 / 16.0),
+            (-1, 1, 3.0 / 16.0),
+            (0, 1, 5.0 / 16.0),
+            (1, 1, 1.0 / 16.0)
+        ],
+        'atkinson': [
+            (1, 0, 1.0 / 8.0),
+            (2, 0, 1.0 / 8.0),
+            (-1, 1, 1.0 / 8.0),
+            (0, 1, 1.0 / 8.0),
+            (1, 1, 1.0 / 8.0),
+            (0, 2, 1.0 / 8.0)
+        ]
+    }
+
+    bayer = [
+        [0, 32, 8, 40, 2, 34, 10, 42],
+        [48, 16, 56, 24, 50, 18, 58, 26],
+        [12, 44, 4, 36, 14, 46, 6, 38],
+        [60, 28, 52, 20, 62, 30, 54, 22],
+        [3, 35, 11, 43, 1, 33, 9, 41],
+        [51, 19, 59, 27, 49, 17, 57, 25],
+        [15, 47, 7, 39, 13, 45, 5, 37],
+        [63, 31, 55, 23, 61, 29, 53, 21]
+    ]
+
+
+    def __init__(self, paths):
+        """Initialize."""
+
+        self.logFileKey = 'render_log'
+        self.paths = paths
+
+        self.waves = {}
+        self.lookup = None
+
+
+        return
+    def __getstate__(self):
+        """Excludes caches when sent to workers, the lookup cube reloads from disk."""
+
+        state = self.__dict__.copy()
+
+        state['waves'] = {}
+        state['lookup'] = None
+
+
+        return state
+
+
+    def getSettings(self, imageSettings):
+        """Gets dither settings, filled from defaults for older settings."""
+
+        settings = self.defaults.copy()
+
+        if 'dither' in imageSettings.keys():
+
+            if isinstance(imageSettings['dither'], dict):
+
+                settings.update(imageSettings['dither'])
+
+
+        if not settings['algorithm'] in self.algorithms.keys():
+
+            settings['algorithm'] = self.defaults['algorithm']
+
+
+        return settings
+    def ditherImage(self, rgbImage, palette, paletteRgb, imageSettings):
+        """Maps RGB image to palette indices with configured algorithm."""
+
+        ditheredImage = None
+
+        try:
+
+            settings = self.getSettings(
+                imageSettings
+            )
+
+            ditheredImage = getattr(
+                self,
+                self.algorithms[settings['algorithm']]
+            )(
+                rgbImage.convert('RGB'),
+                palette,
+                numpy.asarray(
+                    paletteRgb,
+                    dtype=numpy.float32
+                ),
+                settings
+            )
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return ditheredImage
+
+
+    def ditherPillow(self, rgbImage, palette, paletteColors, settings):
+        """Pillow's built in Floyd-Steinberg."""
+
+
+        return rgbImage.quantize(
+            palette=palette
+        )
+    def ditherNearest(self, rgbImage, palette, paletteColors, settings):
+        """Nearest palette color per pixel, by RGB or CIELAB distance."""
+
+        indices = self.getLookup(paletteColors)['lab' if settings['algorithm'] == 'lab' else 'rgb'][
+            self.getLookupCells(
+                numpy.asarray(rgbImage)
+            )
+        ]
+
+
+        return self.getIndexedImage(
+            indices,
+            palette
+        )
+    def ditherOrdered(self, rgbImage, palette, paletteColors, settings):
+        """8x8 Bayer threshold added before nearest color."""
+
+        pixels = numpy.asarray(rgbImage, dtype=numpy.float32)
+
+        threshold = (numpy.asarray(self.bayer, dtype=numpy.float32) + 0.5) / 64.0 - 0.5
+
+        pixels = pixels + numpy.tile(
+            threshold,
+            (
+                -(-pixels.shape[0] // 8),
+                -(-pixels.shape[1] // 8)
+            )
+        )[:pixels.shape[0], :pixels.shape[1], None] * float(settings['spread'])
+
+        indices = self.getLookup(paletteColors)['rgb'][
+            self.getLookupCells(
+                numpy.clip(pixels, 0.0, 255.0)
+            )
+        ]
+
+
+        return self.getIndexedImage(
+            indices,
+            palette
+        )
+    def ditherDiffusion(self, rgbImage, palette, paletteColors, settings):
+        """Error diffusion by kernel, one vectorized wave of independent pixels at a time."""
+
+        kernel = self.kernels[settings['algorithm']]
+        lookup = self.getLookup(paletteColors)['rgb']
+
+        width, height = rgbImage.size
+
+        # Two columns each side and two rows below absorb error pushed off the edges
+        errorBuffer = numpy.zeros((height + 2, width + 4, 3), dtype=numpy.float32)
+        errorBuffer[:height, 2:width + 2] = numpy.asarray(rgbImage, dtype=numpy.float32)
+
+        indices = numpy.zeros((height, width), dtype=numpy.uint8)
+
+        for waveY, waveX in self.getWaves(width, height):
+
+            wavePixels = numpy.clip(
+                errorBuffer[waveY, waveX + 2],
+                0.0,
+                255.0
+            )
+
+            waveIndices = lookup[
+                self.getLookupCells(
+                    wavePixels
+                )
+            ]
+
+            indices[waveY, waveX] = waveIndices
+
+            waveError = wavePixels - paletteColors[waveIndices]
+
+            for dx, dy, weight in kernel:
+
+                errorBuffer[waveY + dy, waveX + 2 + dx] += waveError * weight
+
+
+        return self.getIndexedImage(
+            indices,
+            palette
+        )
+
+
+    def getWaves(self, width, height):
+        """Gets pixel coordinates grouped by x + 2y, cached per size."""
+
+        if not (width, height) in self.waves.keys():
+
+            waves = []
+
+            for t in range(width + 2 * (height - 1)):
+
+                waveY = numpy.arange(
+                    max(
+                        [
+                            0,
+                            -(-(t - width + 1) // 2)
+                        ]
+                    ),
+                    min(
+                        [
+                            height - 1,
+                            t // 2
+                        ]
+                    ) + 1
+                )
+
+                waves.append(
+                    (
+                        waveY,
+                        t - 2 * waveY
+                    )
+                )
+
+            self.waves[(width, height)] = waves
+
+
+        return self.waves[(width, height)]
+    def getLookup(self, paletteColors):
+        """Gets RGB and CIELAB nearest color cubes for palette, built once and kept next to DB."""
+
+        if self.lookup is None or not numpy.array_equal(self.lookup['palette'], paletteColors):
+
+            self.lookup = None
+
+            if 'palette_lut' in self.paths.keys():
+
+                if os.path.exists(self.paths['palette_lut']['path']):
+
+                    try:
+
+                        with numpy.load(self.paths['palette_lut']['path']) as lookupFile:
+
+                            if numpy.array_equal(lookupFile['palette'], paletteColors) and lookupFile['rgb'].shape[0] == self.lookupLevels:
+
+                                self.lookup = {
+                                    'palette': lookupFile['palette'],
+                                    'rgb': lookupFile['rgb'],
+                                    'lab': lookupFile['lab']
+                                }
+
+                    except Exception as e:
+
+                        self.lookup = None
+
+
+            if self.lookup is None:
+
+                cellValues = numpy.arange(self.lookupLevels, dtype=numpy.float32) * (255.0 / (self.lookupLevels - 1))
+
+                cellColors = numpy.stack(
+                    numpy.meshgrid(
+                        cellValues,
+                        cellValues,
+                        cellValues,
+                        indexing='ij'
+                    ),
+                    axis=-1
+                ).reshape(-1, 3)
+
+                self.lookup = {
+                    'palette': paletteColors.copy(),
+                    'rgb': self.getNearest(
+                        cellColors,
+                        paletteColors
+                    ).reshape((self.lookupLevels, ) * 3),
+                    'lab': self.getNearest(
+                        self.getLab(cellColors),
+                        self.getLab(paletteColors)
+                    ).reshape((self.lookupLevels, ) * 3)
+                }
+
+                if 'palette_lut' in self.paths.keys():
+
+                    try:
+
+                        with open(self.paths['palette_lut']['path'] + '.tmp', 'wb') as f:
+
+                            numpy.savez(
+                                f,
+                                palette=self.lookup['palette'],
+                                rgb=self.lookup['rgb'],
+                                lab=self.lookup['lab']
+                            )
+
+                        os.replace(
+                            self.paths['palette_lut']['path'] + '.tmp',
+                            self.paths['palette_lut']['path']
+                        )
+
+                    except Exception as e:
+
+                        self.log(
+                            self.logFileKey,
+                            '.'.join(
+                                [
+                                    str(self.__class__.__name__),
+                                    str(sys._getframe().f_code.co_name)
+                                ]
+                            ),
+                            str(e)
+                        )
+
+
+        return self.lookup
+    def getLookupCells(self, pixels):
+        """Gets lookup cube cell index tuple for 0-255 pixel values."""
+
+        cells = (
+            numpy.asarray(pixels, dtype=numpy.float32) * ((self.lookupLevels - 1) / 255.0) + 0.5
+        ).astype(numpy.intp)
+
+
+        return (
+            cells[..., 0],
+            cells[..., 1],
+            cells[..., 2]
+        )
+    def getNearest(self, pixels, paletteColors):
+        """Gets index of nearest palette color for each pixel."""
+
+
+        # |p - c|^2 without the per pixel |p|^2 term, which does not change the argmin
+        return (
+            (paletteColors ** 2).sum(axis=1) - 2.0 * (pixels @ paletteColors.T)
+        ).argmin(axis=1).astype(numpy.uint8)
+    def getLab(self, rgbValues):
+        """Converts sRGB values 0-255 to CIELAB, D65."""
+
+        linear = rgbValues / 255.0
+        linear = numpy.where(
+            linear > 0.04045,
+            ((linear + 0.055) / 1.055) ** 2.4,
+            linear / 12.92
+        )
+
+        xyz = linear @ numpy.asarray(
+            [
+                [0.4124564, 0.2126729, 0.0193339],
+                [0.3575761, 0.7151522, 0.1191920],
+                [0.1804375, 0.0721750, 0.9503041]
+            ],
+            dtype=numpy.float32
+        ) / numpy.asarray([0.95047, 1.0, 1.08883], dtype=numpy.float32)
+
+        xyz = numpy.where(
+            xyz > 0.008856,
+            numpy.cbrt(xyz),
+            7.787 * xyz + 16.0 / 116.0
+        )
+
+
+        return numpy.stack(
+            [
+                116.0 * xyz[..., 1] - 16.0,
+                500.0 * (xyz[..., 0] - xyz[..., 1]),
+                200.0 * (xyz[..., 1] - xyz[..., 2])
+            ],
+            axis=-1
+        ).astype(numpy.float32)
+    def getIndexedImage(self, indices, palette):
+        """Wraps palette indices as P image with palette."""
+
+        indexedImage = Image.frombytes(
+            'P',
+            (indices.shape[1], indices.shape[0]),
+            numpy.ascontiguousarray(indices, dtype=numpy.uint8).tobytes()
+        )
+        indexedImage.putpalette(
+            palette.getpalette()
+        )
+
+
+        return indexedImage
+
+
+    def log(self, logFileKey, source, status):
+        """Write log, usable from worker processes without DB."""
+
+        try:
+
+            with open(self.paths[logFileKey]['path'], 'a', encoding='utf-8') as f:
+
+                f.write(
+                    '%s | %s : %s\n' % (
+                        str(datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S.%f'))[0:-3],
+                        source,
+                        status.replace('\r', '').replace('\n', '\\n')
+                    )
+                )
+
+        except:
+
+            print(
+                'Could not open',
+                logFileKey,
+                source,
+                status
+            )
+
+
+        return
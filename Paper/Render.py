@@ -0,0 +1,1396 @@
+#  Copyright (c) 2024, Alexander Austin
+#  All rights reserved.
+#
+#  This source code is licensed under the BSD-style license found in the
+#  LICENSE file in the root directory of this source tree.
+
+
+#!/usr/bin/python3.12
+# -*- coding: utf-8 -*-
+
+
+import datetime, hashlib, os, sys, threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+from Paper.Dither import Dither
+from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+
+
+class Render:
+
+
+    defaults = {
+        'render': {
+            'mode': 'auto',
+            'processes': 0,
+            'serial_memory_limit': 1073741824
+        },
+        'quantization': {
+            'mode': 'all',
+            'budget': 0
+        },
+        'ingest': {
+            'workers': 1,
+            'keep': 86400.0,
+            'batch': 8,
+            'perceptual': True,
+            'distance': 6
+        }
+    }
+
+    quantizationProfiles = [
+        {
+            'orientation': 'landscape',
+            'sizing': {
+                'type': 'fit',
+                'fill': 'blur'
+            }
+        }, {
+            'orientation': 'landscape',
+            'sizing': {
+                'type': 'fit',
+                'fill': 'blank'
+            }
+        }, {
+            'orientation': 'landscape',
+            'sizing': {
+                'type': 'cover'
+            }
+        }, {
+            'orientation': 'portrait',
+            'sizing': {
+                'type': 'fit',
+                'fill': 'blur'
+            }
+        }, {
+            'orientation': 'portrait',
+            'sizing': {
+                'type': 'fit',
+                'fill': 'blank'
+            }
+        }, {
+            'orientation': 'portrait',
+            'sizing': {
+                'type': 'cover'
+            }
+        }
+    ]
+
+
+    def __init__(self, db):
+        """Initialize."""
+
+        self.logFileKey = 'render_log'
+        self.paths = db.paths
+
+        self.palette = None
+        self.paletteRgb = None
+
+        self.dither = Dither(self.paths)
+
+        self.pool = None
+        self.poolSize = 0
+        self.poolLock = threading.Lock()
+
+
+        return
+    def __getstate__(self):
+        """Excludes process pool when sent to workers."""
+
+        state = self.__dict__.copy()
+
+        state['pool'] = None
+        state['poolSize'] = 0
+        state['poolLock'] = None
+
+
+        return state
+
+
+    def generatePalette(self, imageSettings):
+        """Generate quantization palette."""
+
+        try:
+
+            paletteSettings = imageSettings['palette']
+
+            paletteRgb = [
+                paletteSettings[colorKey]
+                for colorKey in paletteSettings.keys()
+            ]
+
+            if not paletteRgb == self.paletteRgb:
+
+                palette = Image.new(
+                    'P',
+                    (1, 1)
+                )
+                palette.putpalette(
+                    tuple(
+                        [
+                            val
+                            for color in paletteRgb
+                            for val in color
+                        ] + [0, 0, 0] * (
+                            256 - len(paletteRgb)
+                        )
+                    )
+                )
+
+                self.palette = palette
+                self.paletteRgb = paletteRgb
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return
+
+
+    def getSettings(self, imageSettings, key):
+        """Gets image settings section, filled from defaults for older settings."""
+
+        settings = self.defaults[key].copy()
+
+        if key in imageSettings.keys():
+
+            if isinstance(imageSettings[key], dict):
+
+                for settingKey in imageSettings[key].keys():
+
+                    settings[settingKey] = imageSettings[key][settingKey]
+
+
+        return settings
+    def getProfileString(self, profile):
+        """Gets quantization profile string, as used in file names, from profile or image settings."""
+
+        profileString = '_'.join(
+            [
+                profile['orientation'],
+                'cover' if profile['sizing']['type'] == 'cover' else '_'.join(
+                    [
+                        profile['sizing']['type'],
+                        profile['sizing']['fill']
+                    ]
+                )
+            ]
+        )
+
+
+        return profileString
+    def getQuantizationProfiles(self, imageSettings, profileString=None):
+        """Gets quantization profiles rendered on ingest, or the one matching profile string."""
+
+        quantizationProfiles = []
+
+        try:
+
+            if profileString is None and self.getSettings(imageSettings, 'quantization')['mode'] == 'all':
+
+                quantizationProfiles = self.quantizationProfiles
+
+            else:
+
+                if profileString is None:
+
+                    profileString = self.getProfileString(imageSettings)
+
+                quantizationProfiles = [
+                    quantizationProfile
+                    for quantizationProfile in self.quantizationProfiles
+                    if self.getProfileString(quantizationProfile) == profileString
+                ]
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return quantizationProfiles
+
+
+    def decodeImage(self, imagePath, imageSettings, jobs):
+        """Decodes original at smallest resolution still covering every job, returns image and full size."""
+
+        decodedImage = None
+        originalSize = None
+
+        try:
+
+            sourceImage = Image.open(imagePath)
+
+            orientation = sourceImage.getexif().get(0x0112, 1)
+
+            # Header size, reported upright like the stored original
+            originalSize = sourceImage.size if not orientation in [5, 6, 7, 8] else (
+                sourceImage.size[1],
+                sourceImage.size[0]
+            )
+
+            requiredSize = self.getRequiredSize(
+                originalSize,
+                imageSettings,
+                jobs
+            )
+
+            if orientation in [5, 6, 7, 8]:
+
+                requiredSize = [
+                    requiredSize[1],
+                    requiredSize[0]
+                ]
+
+
+            if sourceImage.format == 'JPEG':
+
+                # DCT scaling, never decodes pixels beyond what is kept
+                sourceImage.draft(
+                    'RGB',
+                    tuple(requiredSize)
+                )
+
+            else:
+
+                # HEIF/AVIF have no reduced decode, reduce before any copies are made
+                reduceFactor = min(
+                    [
+                        int(sourceImage.size[0] / requiredSize[0]),
+                        int(sourceImage.size[1] / requiredSize[1])
+                    ]
+                )
+
+                if reduceFactor > 1:
+
+                    # Palette, bilevel and 16 bit modes can't be reduced, RGB gives the same pixels as converting after
+                    if not sourceImage.mode in ['L', 'LA', 'RGB', 'RGBA', 'RGBX', 'CMYK', 'I', 'F']:
+
+                        sourceImage = sourceImage.convert('RGB')
+
+                    sourceImage = sourceImage.reduce(reduceFactor)
+
+
+            decodedImage = ImageOps.exif_transpose(
+                sourceImage.convert('RGB')
+            )
+
+            del sourceImage
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                ' '.join(
+                    [
+                        imagePath,
+                        str(e)
+                    ]
+                )
+            )
+
+
+        return decodedImage, originalSize
+    def getRequiredSize(self, sourceSize, imageSettings, jobs):
+        """Gets smallest source size covering every job destination."""
+
+        requiredSize = [1, 1]
+
+        try:
+
+            for job in jobs:
+
+                if job['type'] == 'quantization':
+
+                    destinationSize = [
+                        max(imageSettings['size']) if job['profile']['orientation'] == 'landscape' else min(imageSettings['size']),
+                        min(imageSettings['size']) if job['profile']['orientation'] == 'landscape' else max(imageSettings['size'])
+                    ]
+
+                else:
+
+                    destinationSize = [
+                        job['size'],
+                        job['size']
+                    ]
+
+                imageSizing = self.getImageSizing(
+                    sourceSize,
+                    destinationSize
+                )
+
+                requiredSize = [
+                    max(
+                        [
+                            requiredSize[0],
+                            imageSizing['cover']['resize']['width']
+                        ]
+                    ),
+                    max(
+                        [
+                            requiredSize[1],
+                            imageSizing['cover']['resize']['height']
+                        ]
+                    )
+                ]
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return requiredSize
+
+
+    def renderJobs(self, originalImage, originalPath, imageSettings, jobs, imageId=None):
+        """Renders quantization and thumbnail jobs, spread across process pool when enabled."""
+
+        results = [None for job in jobs]
+
+        sharedMemory = None
+
+        try:
+
+            self.generatePalette(imageSettings)
+
+            originalImage = self.getPyramidBase(
+                originalImage,
+                imageSettings,
+                jobs
+            )
+
+            # Jobs sharing intermediates stay together so they share one cache
+            jobGroups = {}
+
+            for i, job in enumerate(jobs):
+
+                groupKey = job['profile']['orientation'] if job['type'] == 'quantization' else job['type']
+
+                if not groupKey in jobGroups.keys():
+
+                    jobGroups[groupKey] = []
+
+                jobGroups[groupKey].append(i)
+
+
+            processCount = self.getProcessCount(
+                imageSettings,
+                len(jobGroups.keys())
+            )
+
+            if processCount > 1:
+
+                # Decoded once, workers map the same pixels read-only
+                sharedMemory = shared_memory.SharedMemory(
+                    create=True,
+                    size=originalImage.size[0] * originalImage.size[1] * 4
+                )
+                sharedMemory.buf[:sharedMemory.size] = originalImage.tobytes('raw', 'RGBX')
+
+                sharedInfo = {
+                    'name': sharedMemory.name,
+                    'size': originalImage.size
+                }
+
+                pool = self.getPool(processCount)
+
+                futures = {
+                    groupKey: pool.submit(
+                        self.renderJobGroup,
+                        None,
+                        sharedInfo,
+                        originalPath,
+                        imageSettings,
+                        [
+                            jobs[i]
+                            for i in jobGroups[groupKey]
+                        ],
+                        imageId
+                    )
+                    for groupKey in jobGroups.keys()
+                }
+
+                for groupKey in jobGroups.keys():
+
+                    for i, result in zip(jobGroups[groupKey], futures[groupKey].result()):
+
+                        results[i] = result
+
+            else:
+
+                results = self.renderJobGroup(
+                    originalImage,
+                    None,
+                    originalPath,
+                    imageSettings,
+                    jobs,
+                    imageId
+                )
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                ' '.join(
+                    [
+                        originalPath,
+                        str(e)
+                    ]
+                )
+            )
+
+        if not sharedMemory is None:
+
+            try:
+
+                sharedMemory.close()
+                sharedMemory.unlink()
+
+            except: pass
+
+
+        return results
+    def renderJobGroup(self, originalImage, sharedInfo, originalPath, imageSettings, jobs, imageId=None):
+        """Renders group of jobs against one intermediate cache, attaching to shared original when run in worker."""
+
+        results = [None for job in jobs]
+
+        sharedMemory = None
+
+        cache = {}
+
+        try:
+
+            if originalImage is None:
+
+                sharedMemory = shared_memory.SharedMemory(
+                    name=sharedInfo['name']
+                )
+
+                originalImage = Image.frombuffer(
+                    'RGBX',
+                    sharedInfo['size'],
+                    sharedMemory.buf,
+                    'raw',
+                    'RGBX',
+                    0,
+                    1
+                )
+
+            for i, job in enumerate(jobs):
+
+                if job['type'] == 'quantization':
+
+                    results[i] = self.generateImageQuantization(
+                        originalImage,
+                        originalPath,
+                        imageSettings,
+                        job['profile'],
+                        imageId=imageId,
+                        cache=cache
+                    )
+
+                elif job['type'] == 'thumbnail':
+
+                    results[i] = self.generateImageThumbnail(
+                        originalImage,
+                        originalPath,
+                        imageSettings,
+                        job['size'],
+                        imageId=imageId,
+                        cache=cache
+                    )
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                ' '.join(
+                    [
+                        originalPath,
+                        str(e)
+                    ]
+                )
+            )
+
+        cache.clear()
+
+        del originalImage
+
+        if not sharedMemory is None:
+
+            try: sharedMemory.close()
+            except: pass
+
+
+        return results
+    def getProcessCount(self, imageSettings, jobCount):
+        """Gets bounded worker count, serial (1) when disabled or memory is tight."""
+
+        processCount = 1
+
+        try:
+
+            renderSettings = self.getSettings(
+                imageSettings,
+                'render'
+            )
+
+            if renderSettings['mode'] == 'parallel' or (
+                renderSettings['mode'] == 'auto' and self.getMemoryTotal() >= renderSettings['serial_memory_limit']
+            ):
+
+                processCount = renderSettings['processes'] if renderSettings['processes'] > 0 else (
+                    os.cpu_count() or 1
+                )
+
+                processCount = max(
+                    [
+                        1,
+                        min(
+                            [
+                                processCount,
+                                jobCount
+                            ]
+                        )
+                    ]
+                )
+
+        except Exception as e:
+
+            processCount = 1
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return processCount
+    def getMemoryTotal(self):
+        """Gets total physical memory in bytes."""
+
+        memoryTotal = 0
+
+        try:
+
+            memoryTotal = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+        except: pass
+
+
+        return memoryTotal
+    def getPool(self, processCount):
+        """Gets process pool, sized for every core once, replaced only when settings ask for more."""
+
+        retiredPool = None
+
+        with self.poolLock:
+
+            if self.pool is None or self.poolSize < processCount:
+
+                retiredPool = self.pool
+
+                # Forkserver children start from a clean process, not a copy of this threaded one,
+                # and spawn on demand, so sizing for every core costs nothing until used
+                self.pool = ProcessPoolExecutor(
+                    max_workers=max(
+                        [
+                            processCount,
+                            os.cpu_count() or 1
+                        ]
+                    ),
+                    mp_context=get_context('forkserver')
+                )
+                self.poolSize = max(
+                    [
+                        processCount,
+                        os.cpu_count() or 1
+                    ]
+                )
+
+        if not retiredPool is None:
+
+            # Other ingest jobs may still hold futures on it, let them finish before workers exit
+            retiredPool.shutdown(wait=True)
+
+
+        return self.pool
+
+
+    def generateImageQuantization(self, originalImage, originalPath, imageSettings, quantizationProfile, imageId=None, cache=None):
+        """Generates quantized image from original."""
+
+        quantizationWorking = None
+
+        try:
+
+            if cache is None:
+
+                cache = {}
+
+
+            destinationSize = [
+                max(
+                    [
+                        imageSettings['size'][0],
+                        imageSettings['size'][1]
+                    ]
+                ) if quantizationProfile['orientation'] == 'landscape' else min(
+                    [
+                        imageSettings['size'][0],
+                        imageSettings['size'][1]
+                    ]
+                ),
+                min(
+                    [
+                        imageSettings['size'][0],
+                        imageSettings['size'][1]
+                    ]
+                ) if quantizationProfile['orientation'] == 'landscape' else max(
+                    [
+                        imageSettings['size'][0],
+                        imageSettings['size'][1]
+                    ]
+                )
+            ]
+
+            imageSizing = self.getImageSizing(
+                originalImage.size,
+                destinationSize
+            )
+
+            quantizationInfo = {
+                'width': destinationSize[0],
+                'height': destinationSize[1],
+                'path': os.path.join(
+                    self.paths['quantization']['path'],
+                    '%(file_name)s_%(orientation)s_%(sizing)s.%(extension)s' % {
+                        'file_name': originalPath.rsplit(os.sep, 1)[-1].rsplit('.', 1)[0],
+                        'orientation': quantizationProfile['orientation'],
+                        'sizing': 'cover' if quantizationProfile['sizing']['type'] == 'cover' else '_'.join(
+                            [
+                                quantizationProfile['sizing']['type'],
+                                quantizationProfile['sizing']['fill']
+                            ]
+                        ),
+                        'extension': imageSettings['extension']
+                    }
+                ),
+                'url': '/images/quantization/%(file_name)s_%(orientation)s_%(sizing)s.%(extension)s' % {
+                    'file_name': originalPath.rsplit(os.sep, 1)[-1].rsplit('.', 1)[0],
+                    'orientation': quantizationProfile['orientation'],
+                    'sizing': 'cover' if quantizationProfile['sizing']['type'] == 'cover' else '_'.join(
+                        [
+                            quantizationProfile['sizing']['type'],
+                            quantizationProfile['sizing']['fill']
+                        ]
+                    ),
+                    'extension': imageSettings['extension']
+                },
+                'orientation': quantizationProfile['orientation']
+            }
+
+            if not imageId is None:
+
+                quantizationInfo['image_id'] = imageId
+
+
+            resizedImage = None
+
+            if originalImage.size[0] == quantizationInfo['width'] and originalImage.size[1] == quantizationInfo['height']:
+
+                resizedImage = originalImage.convert('RGB')
+
+            elif (originalImage.size[0] / quantizationInfo['width']) == (originalImage.size[1] / quantizationInfo['height']):
+
+                resizedImage = self.getCachedResize(
+                    cache,
+                    originalImage,
+                    (
+                        quantizationInfo['width'],
+                        quantizationInfo['height']
+                    )
+                ).convert('RGB')
+
+            else:
+
+                resizedImage = Image.new(
+                    mode='RGB',
+                    size=(
+                        quantizationInfo['width'],
+                        quantizationInfo['height']
+                    ),
+                    color=(255, 255, 255)
+                )
+
+                if quantizationProfile['sizing']['type'] == 'cover' or quantizationProfile['sizing']['fill'] == 'blur':
+
+                    resizedImage.paste(
+                        self.getCachedBackground(
+                            cache,
+                            originalImage,
+                            imageSizing,
+                            imageSettings
+                        ),
+                        (
+                            0,
+                            0,
+                            quantizationInfo['width'],
+                            quantizationInfo['height']
+                        )
+                    )
+
+                if quantizationProfile['sizing']['type'] == 'fit':
+
+                    resizedImage.paste(
+                        self.getCachedResize(
+                            cache,
+                            originalImage,
+                            (
+                                imageSizing['fit']['resize']['width'],
+                                imageSizing['fit']['resize']['height']
+                            )
+                        ),
+                        (
+                            imageSizing['fit']['paste']['x0'],
+                            imageSizing['fit']['paste']['y0'],
+                            imageSizing['fit']['paste']['x1'],
+                            imageSizing['fit']['paste']['y1']
+                        )
+                    )
+
+
+            ditheredImage = self.dither.ditherImage(
+                resizedImage,
+                self.palette,
+                self.paletteRgb,
+                imageSettings
+            )
+            ditheredImage.save(
+                quantizationInfo['path']
+            )
+
+            # Panel ready frame, streamed as is on display
+            quantizationInfo['frame'] = '.'.join(
+                [
+                    quantizationInfo['path'].rsplit('.', 1)[0],
+                    'epd'
+                ]
+            )
+
+            with open(quantizationInfo['frame'], 'wb') as f:
+
+                f.write(
+                    self.packFrame(
+                        ditheredImage
+                    )
+                )
+
+
+            quantizationInfo['bytes'] = os.path.getsize(
+                quantizationInfo['path']
+            )
+            quantizationInfo['used'] = (datetime.datetime.now() - datetime.datetime.fromtimestamp(0)).total_seconds()
+
+
+            quantizationWorking = quantizationInfo
+
+            del resizedImage
+            del ditheredImage
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                ' '.join(
+                    [
+                        originalPath,
+                        str(e)
+                    ]
+                )
+            )
+
+        del originalImage
+
+
+        return quantizationWorking
+    def generateImageThumbnail(self, originalImage, originalPath, imageSettings, thumbnailSize, imageId=None, cache=None):
+        """Generates thumbnail image from original."""
+
+        thumbnailWorking = None
+
+        try:
+
+            if cache is None:
+
+                cache = {}
+
+
+            imageSizing = self.getImageSizing(
+                originalImage.size,
+                [
+                    thumbnailSize,
+                    thumbnailSize
+                ]
+            )
+
+            thumbnailInfo = {
+                'width': thumbnailSize,
+                'height': thumbnailSize,
+                'path': os.path.join(
+                    self.paths['thumbnail']['path'],
+                    '%(file_name)s_%(size)i.%(extension)s' % {
+                        'file_name': originalPath.rsplit(os.sep, 1)[-1].rsplit('.', 1)[0],
+                        'size': thumbnailSize,
+                        'extension': imageSettings['extension']
+                    }
+                ),
+                'url': '/images/thumbnail/%(file_name)s_%(size)i.%(extension)s' % {
+                    'file_name': originalPath.rsplit(os.sep, 1)[-1].rsplit('.', 1)[0],
+                    'size': thumbnailSize,
+                    'extension': imageSettings['extension']
+                }
+            }
+
+            if not imageId is None:
+
+                thumbnailInfo['image_id'] = imageId
+
+
+            thumbnailImage = Image.new(
+                mode='RGB',
+                size=(
+                    thumbnailSize,
+                    thumbnailSize
+                ),
+                color=(255, 255, 255)
+            )
+
+
+            thumbnailImage.paste(
+                self.getCachedBackground(
+                    cache,
+                    originalImage,
+                    imageSizing,
+                    imageSettings
+                ),
+                (
+                    0,
+                    0,
+                    thumbnailSize,
+                    thumbnailSize
+                )
+            )
+            thumbnailImage.paste(
+                self.getCachedResize(
+                    cache,
+                    originalImage,
+                    (
+                        imageSizing['fit']['resize']['width'],
+                        imageSizing['fit']['resize']['height']
+                    )
+                ),
+                (
+                    imageSizing['fit']['paste']['x0'],
+                    imageSizing['fit']['paste']['y0'],
+                    imageSizing['fit']['paste']['x1'],
+                    imageSizing['fit']['paste']['y1']
+                )
+            )
+
+
+            thumbnailImage.save(
+                thumbnailInfo['path']
+            )
+
+
+            thumbnailInfo['bytes'] = os.path.getsize(
+                thumbnailInfo['path']
+            )
+
+
+            thumbnailWorking = thumbnailInfo
+
+            del thumbnailImage
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                ' '.join(
+                    [
+                        originalPath,
+                        str(e)
+                    ]
+                )
+            )
+
+        del originalImage
+
+
+        return thumbnailWorking
+    def getImageSizing(self, sourceSize, destinationSize):
+        """Gets image resizing and cropping dimensions."""
+
+        imageSizing = {
+            'fit': {
+                'resize': {
+                    'width': 0,
+                    'height': 0
+                },
+                'paste': {
+                    'x0': 0,
+                    'y0': 0,
+                    'x1': 0,
+                    'y1': 0
+                }
+            },
+            'cover': {
+                'resize': {
+                    'width': 0,
+                    'height': 0
+                },
+                'crop': {
+                    'x0': 0,
+                    'y0': 0,
+                    'x1': 0,
+                    'y1': 0
+                }
+            }
+        }
+
+        try:
+
+            sWH = sourceSize[0] / sourceSize[1]
+            dWH = destinationSize[0] / destinationSize[1]
+            sdW = sourceSize[0] / destinationSize[0]
+            sdH = sourceSize[1] / destinationSize[1]
+
+            if (sourceSize[0] == destinationSize[0] and sourceSize[1] == destinationSize[1]) or (sWH == dWH):
+
+                imageSizing['fit']['resize']['width'] = destinationSize[0]
+                imageSizing['fit']['resize']['height'] = destinationSize[1]
+
+                imageSizing['fit']['paste']['x0'] = 0
+                imageSizing['fit']['paste']['y0'] = 0
+                imageSizing['fit']['paste']['x1'] = destinationSize[0]
+                imageSizing['fit']['paste']['y1'] = destinationSize[1]
+
+                imageSizing['cover']['resize']['width'] = destinationSize[0]
+                imageSizing['cover']['resize']['height'] = destinationSize[1]
+
+                imageSizing['cover']['crop']['x0'] = 0
+                imageSizing['cover']['crop']['y0'] = 0
+                imageSizing['cover']['crop']['x1'] = destinationSize[0]
+                imageSizing['cover']['crop']['y1'] = destinationSize[1]
+
+            else:
+
+                imageSizing['fit']['resize']['width'] = destinationSize[0] if sWH > dWH else int(
+                    sourceSize[0] / sdH
+                )
+                imageSizing['fit']['resize']['height'] = destinationSize[1] if sWH < dWH else int(
+                    sourceSize[1] / sdW
+                )
+
+                imageSizing['fit']['paste']['x0'] = 0 if sWH > dWH else int(
+                    (
+                        destinationSize[0] - imageSizing['fit']['resize']['width']
+                    ) / 2.0
+                )
+                imageSizing['fit']['paste']['y0'] = 0 if sWH < dWH else int(
+                    (
+                        destinationSize[1] - imageSizing['fit']['resize']['height']
+                    ) / 2.0
+                )
+                imageSizing['fit']['paste']['x1'] = destinationSize[0] if sWH > dWH else (
+                    imageSizing['fit']['paste']['x0'] + imageSizing['fit']['resize']['width']
+                )
+                imageSizing['fit']['paste']['y1'] = destinationSize[1] if sWH < dWH else (
+                    imageSizing['fit']['paste']['y0'] + imageSizing['fit']['resize']['height']
+                )
+
+                imageSizing['cover']['resize']['width'] = destinationSize[0] if sWH < dWH else int(
+                    sourceSize[0] / sdH
+                )
+                imageSizing['cover']['resize']['height'] = destinationSize[1] if sWH > dWH else int(
+                    sourceSize[1] / sdW
+                )
+
+                imageSizing['cover']['crop']['x0'] = 0 if sWH < dWH else int(
+                    (
+                        imageSizing['cover']['resize']['width'] - destinationSize[0]
+                    ) / 2.0
+                )
+                imageSizing['cover']['crop']['y0'] = 0 if sWH > dWH else int(
+                    (
+                        imageSizing['cover']['resize']['height'] - destinationSize[1]
+                    ) / 2.0
+                )
+                imageSizing['cover']['crop']['x1'] = destinationSize[0] if sWH < dWH else (
+                    imageSizing['cover']['crop']['x0'] + destinationSize[0]
+                )
+                imageSizing['cover']['crop']['y1'] = destinationSize[1] if sWH > dWH else (
+                    imageSizing['cover']['crop']['y0'] + destinationSize[1]
+                )
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return imageSizing
+    def getPyramidBase(self, originalImage, imageSettings, jobs):
+        """Gets original reduced once to smallest size still covering every job."""
+
+        baseImage = originalImage
+
+        try:
+
+            requiredSize = self.getRequiredSize(
+                originalImage.size,
+                imageSettings,
+                jobs
+            )
+
+            # Keep twice the required size so LANCZOS still has detail to work with
+            reduceFactor = min(
+                [
+                    int(originalImage.size[0] / (requiredSize[0] * 2)),
+                    int(originalImage.size[1] / (requiredSize[1] * 2))
+                ]
+            )
+
+            if reduceFactor > 1:
+
+                baseImage = originalImage.reduce(reduceFactor)
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return baseImage
+    def getCachedLevel(self, cache, originalImage, size):
+        """Gets smallest pyramid level at least twice the requested size, halving and caching as needed."""
+
+        levelImage = originalImage
+
+        try:
+
+            while levelImage.size[0] >= size[0] * 4 and levelImage.size[1] >= size[1] * 4:
+
+                levelKey = (
+                    (
+                        int(levelImage.size[0] / 2),
+                        int(levelImage.size[1] / 2)
+                    ),
+                    'reduce'
+                )
+
+                if not levelKey in cache.keys():
+
+                    cache[levelKey] = levelImage.reduce(2)
+
+                levelImage = cache[levelKey]
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return levelImage
+    def getCachedResize(self, cache, originalImage, size):
+        """Gets LANCZOS resize of original, derived from nearest pyramid level and cached by size."""
+
+        resizeKey = (
+            tuple(size),
+            'resize'
+        )
+
+        if not resizeKey in cache.keys():
+
+            cache[resizeKey] = self.getCachedLevel(
+                cache,
+                originalImage,
+                size
+            ).resize(
+                tuple(size),
+                Image.Resampling.LANCZOS
+            )
+
+
+        return cache[resizeKey]
+    def getCachedBackground(self, cache, originalImage, imageSizing, imageSettings):
+        """Gets blurred and dimmed cover background, cached by size."""
+
+        backgroundSize = (
+            imageSizing['cover']['crop']['x1'] - imageSizing['cover']['crop']['x0'],
+            imageSizing['cover']['crop']['y1'] - imageSizing['cover']['crop']['y0']
+        )
+
+        backgroundKey = (
+            backgroundSize,
+            'background'
+        )
+
+        if not backgroundKey in cache.keys():
+
+            bgImage = self.getCachedResize(
+                cache,
+                originalImage,
+                (
+                    imageSizing['cover']['resize']['width'],
+                    imageSizing['cover']['resize']['height']
+                )
+            )
+            bgImage = bgImage.crop(
+                (
+                    imageSizing['cover']['crop']['x0'],
+                    imageSizing['cover']['crop']['y0'],
+                    imageSizing['cover']['crop']['x1'],
+                    imageSizing['cover']['crop']['y1']
+                )
+            )
+            bgImage = bgImage.filter(
+                ImageFilter.GaussianBlur(
+                    min(
+                        [
+                            2,
+                            int(
+                                max(backgroundSize) / 32
+                            )
+                        ]
+                    )
+                )
+            )
+            brightnessFilter = ImageEnhance.Brightness(bgImage)
+
+            cache[backgroundKey] = brightnessFilter.enhance(
+                imageSettings['blur_brightness']
+            )
+
+
+        return cache[backgroundKey]
+
+
+    def packFrame(self, quantizedImage):
+        """Packs quantized image into panel frame buffer, two palette indices per byte."""
+
+        frameBytes = None
+
+        try:
+
+            # Pillow's 4 bit packer, high nibble first as the panel expects
+            frameBytes = quantizedImage.tobytes(
+                'raw',
+                'P;4'
+            )
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return frameBytes
+
+
+    def getContentHash(self, imagePath):
+        """Gets SHA-256 of file contents, read in chunks."""
+
+        contentHash = None
+
+        try:
+
+            fileHash = hashlib.sha256()
+
+            with open(imagePath, 'rb') as f:
+
+                for chunk in iter(lambda: f.read(1048576), b''):
+
+                    fileHash.update(chunk)
+
+            contentHash = fileHash.hexdigest()
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return contentHash
+    def getPerceptualHash(self, originalImage):
+        """Gets 64 bit difference hash of image, as hex."""
+
+        perceptualHash = None
+
+        try:
+
+            hashImage = originalImage.convert('L').resize(
+                (9, 8),
+                Image.Resampling.BOX
+            )
+
+            hashPixels = list(hashImage.getdata())
+
+            hashValue = 0
+
+            for y in range(8):
+
+                for x in range(8):
+
+                    hashValue = (hashValue << 1) | (1 if hashPixels[y * 9 + x] > hashPixels[y * 9 + x + 1] else 0)
+
+            perceptualHash = '%016x' % (hashValue, )
+
+        except Exception as e:
+
+            self.log(
+                self.logFileKey,
+                '.'.join(
+                    [
+                        str(self.__class__.__name__),
+                        str(sys._getframe().f_code.co_name)
+                    ]
+                ),
+                str(e)
+            )
+
+
+        return perceptualHash
+
+
+    def log(self, logFileKey, source, status):
+        """Write log, usable from worker processes without DB."""
+
+        try:
+
+            with open(self.paths[logFileKey]['path'], 'a', encoding='utf-8') as f:
+
+                f.write(
+                    '%s | %s : %s\n' % (
+                        str(datetime.datetime.now().strftime('%Y/%m/%d %H:%M:%S.%f'))[0:-3],
+                        source,
+                        status.replace('\r', '').replace('\n', '\\n')
+                    )
+                )
+
+        except:
+
+            print(
+                'Could not open',
+                logFileKey,
+                source,
+                status
+            )
+
+
+        return
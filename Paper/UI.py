@@ -18,6 +18,14 @@ from Paper.Backend import Backend
 logFileKey = 'server_log'
 backend = Backend()
 
+# Browser cache lifetime by image type, quantizations re-render under the same name so always revalidate
+imageCacheSeconds = {
+    'original': 3600,
+    'thumbnail': 3600,
+    'quantization': 0,
+    'atlas': 3600
+}
+
 
 def getAuthorization(req):
     """Checks cookie authorization."""
@@ -51,18 +59,16 @@ def getAuthorization(req):
                 authorization['logged_in'] = True
                 authorization['user'] = user
 
-                permissionIds = [
-                    userPermission['permission_id']
-                    for userPermission in user['user_permissions']
-                ]
+                # Bit n set for permission id n
+                permissions = user['permissions']
 
-                if 0 in permissionIds: authorization['api'] = True
+                if permissions & (1 << 0): authorization['api'] = True
 
-                if 1 in permissionIds: authorization['admin'] = True
+                if permissions & (1 << 1): authorization['admin'] = True
 
-                if 2 in permissionIds: authorization['settings'] = True
+                if permissions & (1 << 2): authorization['settings'] = True
 
-                if 3 in permissionIds: authorization['media'] = True
+                if permissions & (1 << 3): authorization['media'] = True
 
     except Exception as e:
 
@@ -287,15 +293,86 @@ def images(subpath):
 
         if authorization['logged_in'] == True:
 
+            if subpath.startswith('atlas/'):
+
+                # atlas/<size>?ids=1,2,3&columns=8, cells row by row in ids order
+                atlasData = backend.getThumbnailAtlas(
+                    [
+                        imageId
+                        for imageId in request.args.get('ids', '').split(',')
+                        if len(imageId) > 0
+                    ],
+                    int(subpath.split('/', 1)[-1].rsplit('.', 1)[0]),
+                    columns=request.args.get('columns', None),
+                    etag=request.if_none_match.as_set().pop() if len(request.if_none_match.as_set()) == 1 else None
+                )
+
+                if not atlasData is None:
+
+                    if atlasData['image'] is None:
+
+                        imageResponse = make_response('', 304)
+                        imageResponse.set_etag(atlasData['etag'])
+
+                    else:
+
+                        imageResponse = send_file(
+                            atlasData['image'],
+                            mimetype='image/png',
+                            etag=atlasData['etag'],
+                            max_age=imageCacheSeconds['atlas']
+                        )
+
+                    imageResponse.headers['X-Atlas-Columns'] = str(atlasData['columns'])
+                    imageResponse.headers['X-Atlas-Rows'] = str(atlasData['rows'])
+                    imageResponse.cache_control.public = False
+                    imageResponse.cache_control.private = True
+                    imageResponse.cache_control.max_age = imageCacheSeconds['atlas']
+
+                    return imageResponse, imageResponse.status_code
+
             for imageType in ['original', 'thumbnail', 'quantization']:
 
                 if subpath.startswith(imageType + '/'):
 
-                    for imagePath in glob.glob(os.path.join(backend.db.paths[imageType]['path'], '*')):
+                    imagePath = None
 
-                        if imagePath.rsplit(os.sep, 1)[-1] == subpath.rsplit('/', 1)[-1]:
+                    # Files sit flat in each directory, so the name alone finds them
+                    fileName = subpath.rsplit('/', 1)[-1]
+
+                    if not fileName.startswith('.') and fileName == os.path.basename(fileName):
+
+                        if os.path.isfile(os.path.join(backend.db.paths[imageType]['path'], fileName)):
+
+                            imagePath = os.path.join(backend.db.paths[imageType]['path'], fileName)
+
+                    if imagePath is None and imageType == 'quantization' and 'image_id' in request.args.keys():
+
+                        # Profile not rendered yet, subpath is quantization/<profile>
+                        dbQuantization, quantizationStatus = backend.getImageQuantization(
+                            int(request.args['image_id']),
+                            subpath.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+                        )
+
+                        if not dbQuantization is None:
+
+                            imagePath = dbQuantization.working['path']
+
+                        elif quantizationStatus == 500:
+
+                            return jsonify({'error': 'Render failed'}), 500
+
+                    if not imagePath is None:
+
+                        # Conditional, a cached copy gets 304 instead of the file again
+                        imageResponse = send_file(
+                            imagePath,
+                            max_age=imageCacheSeconds[imageType]
+                        )
+                        imageResponse.cache_control.public = False
+                        imageResponse.cache_control.private = True
 
-                            return send_file(imagePath), 200
+                        return imageResponse, imageResponse.status_code
 
     except Exception as e:
 
@@ -618,18 +618,23 @@ function displayEditImageModal(imageId) {
 
                 for (var i = 0; i < quantizationProfiles.length; i++) {
 
+                    // Profiles not rendered yet are rendered on request
+                    let quantizationUrl = `/images/quantization/${quantizationProfiles[i]}?image_id=${imageData.id}`;
+
                     for (const imageDataQuantization of imageData.quantizations) {
 
                         if (imageDataQuantization.url.includes(quantizationProfiles[i])) {
 
-                            let quantizationImgHtml = `<img data-index="${i + 2}" src="${imageDataQuantization.url}" alt="${imageData.file}" />`;
-
-                            editImageModalImageHolder.insertAdjacentHTML('beforeend', quantizationImgHtml);
+                            quantizationUrl = imageDataQuantization.url;
 
                         }
 
                     }
 
+                    let quantizationImgHtml = `<img data-index="${i + 2}" src="${quantizationUrl}" alt="${imageData.file}" />`;
+
+                    editImageModalImageHolder.insertAdjacentHTML('beforeend', quantizationImgHtml);
+
                 }
 
 
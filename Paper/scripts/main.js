@@ -196,6 +196,8 @@ async function apiHandler(type, data, background=false) {
 
                 }).then((responseData) => {
 
+                    responseData = mergeApiData(responseData);
+
                     for (const responseKey of Object.keys(responseData)) {
 
                         apiData[responseKey] = responseData[responseKey];
@@ -244,6 +246,52 @@ async function apiHandler(type, data, background=false) {
 
     }
 
+}
+function mergeApiData(responseData) {
+
+    /* Edits and deletes send back only changed images, merged here into the full list */
+
+    if (Object.keys(responseData).includes('image_update') || Object.keys(responseData).includes('image_delete')) {
+
+        let imageData = Object.keys(apiData).includes('image_data') ? apiData.image_data.slice() : [];
+
+        if (Object.keys(responseData).includes('image_update')) {
+
+            for (const updatedImage of responseData.image_update) {
+
+                const imageIndex = imageData.findIndex((imageItem) => imageItem.id == updatedImage.id);
+
+                if (imageIndex >= 0) {
+
+                    imageData[imageIndex] = updatedImage;
+
+                } else {
+
+                    imageData.push(updatedImage);
+
+                }
+
+            }
+
+            delete responseData.image_update;
+
+        }
+
+        if (Object.keys(responseData).includes('image_delete')) {
+
+            imageData = imageData.filter((imageItem) => !responseData.image_delete.includes(imageItem.id));
+
+            delete responseData.image_delete;
+
+        }
+
+        responseData.image_data = imageData;
+
+    }
+
+
+    return responseData;
+
 }
 function getApiRequest(type, data) {
 
@@ -480,6 +528,8 @@ function getApiRequest(type, data) {
 
 
 var fileQueue = [];
+var jobQueue = [];
+var jobPolling = false;
 
 async function fileHandler(fileUploads) {
 
@@ -588,33 +638,23 @@ async function chunkHandler(chunkFormData, retries = 3) {
             );
 
 
-            let uploadComplete = true;
-
-            if (uploadResponse.progress.length == 0) {
-
-                uploadComplete = false;
-
-            } else {
-
-                for (const uploadProgress of uploadResponse.progress) {
-
-                    if (uploadProgress.progress < 100.0) {
+            // Polled as each file is queued, its progress reads below 100 again until its job ingests it
+            for (const uploadProgress of uploadResponse.progress) {
 
-                        uploadComplete = false;
+                if (Object.keys(uploadProgress).includes('job_id') && uploadProgress.job_id !== null) {
 
-                    }
+                    jobQueue.push(uploadProgress.job_id);
 
                 }
 
             }
 
 
-            if (uploadComplete == true) {
+            if (jobQueue.length > 0 && jobPolling == false) {
+
+                jobPolling = true;
 
-                apiHandler(
-                    'image_data',
-                    null
-                );
+                jobHandler();
 
             }
 
@@ -638,6 +678,61 @@ async function chunkHandler(chunkFormData, retries = 3) {
     }
 
 }
+async function jobHandler() {
+
+    try {
+
+        const responseData = await fetch(
+            '/api/images/jobs',
+            {
+                method: 'GET'
+            }
+        );
+
+        const jobResponse = await responseData.json();
+
+        if (Object.keys(jobResponse).includes('job_data')) {
+
+            const activeJobIds = jobResponse.job_data.filter(
+                jobData => ['pending', 'running'].includes(jobData.status)
+            ).map(
+                jobData => jobData.id
+            );
+
+            jobQueue = jobQueue.filter(
+                jobId => activeJobIds.includes(jobId)
+            );
+
+        }
+
+
+        if (jobQueue.length == 0) {
+
+            jobPolling = false;
+
+            apiHandler(
+                'image_data',
+                null
+            );
+
+        } else {
+
+            setTimeout(
+                jobHandler,
+                1000
+            );
+
+        }
+
+    } catch (error) {
+
+        jobPolling = false;
+
+        console.error('Job status failed: ', jobQueue, error);
+
+    }
+
+}
 
 
 function updateStatus(updateType, status, info, background=false) {